@@ -6,6 +6,7 @@ from django.http import HttpResponseForbidden
 from django.contrib.auth import get_user_model
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from topgrade_api.models import Category, Program, Syllabus, Topic
+from topgrade_api.hashing import PasswordHashPoolBusy
 
 User = get_user_model()
 
@@ -33,10 +34,15 @@ def signin_view(request):
         password = request.POST.get('password')
         
         # Use AdminOnlyBackend for authentication
-        user = authenticate(request, username=email, password=password)
+        try:
+            user = authenticate(request, username=email, password=password)
+        except PasswordHashPoolBusy:
+            messages.error(request, 'The server is busy right now. Please try again in a moment.')
+            return render(request, 'dashboard/signin.html', status=503)
         
         if user is not None and user.is_superuser:
-            login(request, user)
+            # Sessions resolve their user through AdminOnlyBackend's cache
+            login(request, user, backend='topgrade_api.backends.AdminOnlyBackend')
             return redirect('/dashboard/')
         else:
             messages.error(request, 'Invalid credentials or you are not authorized to access the dashboard.')
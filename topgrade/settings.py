@@ -92,6 +92,28 @@ DATABASES = {
 }
 
 
+# Cache
+# Catalog snapshots and version stamps live here; multi-worker deployments
+# should use a shared backend such as Redis or Memcached
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'topgrade',
+    }
+}
+
+# 'memory' serves /programs/filter, /landing and /bookmarks from an
+# in-process columnar copy of the catalog, 'shared' from one snapshot file
+# mapped by every worker on the host (both require NumPy, `pip install numpy`); 'orm' queries the
+# database on every request. With this per-process cache the catalog version
+# they are built from is kept in the database (see catalog_cache)
+CATALOG_ENGINE = 'orm'
+# Seconds a process reuses the catalog version it read from the database
+CATALOG_VERSION_TTL = 1
+CATALOG_SNAPSHOT_PATH = BASE_DIR / 'catalog.snapshot'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -146,10 +168,20 @@ AUTH_USER_MODEL = 'topgrade_api.CustomUser'
 
 # Custom Authentication Backend - Django admin uses standard auth, dashboard uses custom auth
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',  # Standard Django admin authentication
-    'topgrade_api.backends.AdminOnlyBackend',     # Custom dashboard authentication
+    'topgrade_api.backends.PooledModelBackend',  # Standard authentication, hashing on a bounded pool
+    'topgrade_api.backends.AdminOnlyBackend',    # Custom dashboard authentication
+    # Only resolves admin sessions signed in before PooledModelBackend; wrong
+    # passwords end at PooledModelBackend, so this never hashes them again
+    'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Bounded pool for password hashing (see topgrade_api.hashing). Sign-ins and
+# sign-ups beyond WORKERS + QUEUE_SIZE concurrent hashes get a 503
+PASSWORD_HASH_WORKERS = None  # defaults to the CPU count
+PASSWORD_HASH_QUEUE_SIZE = None  # defaults to 4 per worker
+PASSWORD_HASH_TIMEOUT = 5  # seconds a request may wait for a hashing thread
+PASSWORD_HASH_STATS_LOG_INTERVAL = 60  # seconds between pool stats warnings while it sheds load
+
 # JWT Settings
 from datetime import timedelta
 
@@ -166,6 +198,58 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Revoked refresh/access tokens (see topgrade_api.revocation); run
+# prune_revoked_tokens periodically to drop expired ones
+TOKEN_REVOCATION_BLOOM_CAPACITY = 100000
+TOKEN_REVOCATION_SYNC_INTERVAL = 5  # seconds before other workers' revocations apply
+TOKEN_REVOCATION_REBUILD_INTERVAL = 60 * 60  # seconds
+
+# Put `role` and `has_area_of_intrest` claims in access tokens so API
+# authentication can skip the database; tokens of deleted or deactivated
+# users then stay usable until they expire, so only turn this on where
+# that is acceptable
+JWT_USER_CLAIMS = False
+
+# Rate limits of the auth endpoints (see topgrade_api.ratelimit): per scope,
+# (key, limit, period in seconds) where key is 'ip' or a request body field
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_CACHE_ALIAS = 'default'
+RATE_LIMIT_IP_HEADER = None  # e.g. 'HTTP_X_FORWARDED_FOR' behind a trusted proxy
+RATE_LIMITS = {
+    'signin': [('ip', 30, 60), ('email', 10, 60)],
+    'request_otp': [('ip', 10, 60), ('email', 3, 60)],
+    'verify_otp': [('ip', 30, 60), ('email', 10, 60)],
+    'request_phone_otp': [('ip', 10, 60), ('phone_number', 3, 60)],
+    'phone_signin': [('ip', 30, 60), ('phone_number', 10, 60)],
+}
+
+# Where OTP challenges live (see topgrade_api.otp_store): 'cache', 'database',
+# or 'auto' to use the cache only when OTP_CACHE_ALIAS is a shared backend
+OTP_STORE = 'auto'
+OTP_CACHE_ALIAS = 'default'
+OTP_LIFETIME = 10 * 60  # seconds
+
+# Per-process cache of authenticated users (see topgrade_api.authentication)
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL = 60  # seconds
+
+# Per-process cache of dashboard admins (see topgrade_api.backends.AdminOnlyBackend)
+DASHBOARD_AUTH_CACHE_SIZE = 1000
+DASHBOARD_AUTH_CACHE_TTL = 30  # seconds
+
+# Largest array /api/learning/update-progress/batch accepts
+PROGRESS_BATCH_MAX_UPDATES = 500
+
+# Buffer heartbeats that only move the watch position and write them in bulk
+# every PROGRESS_FLUSH_INTERVAL seconds (see topgrade_api.progress_buffer).
+# PROGRESS_BUFFER is 'cache', 'memory', or 'auto' to use the cache only when
+# PROGRESS_CACHE_ALIAS is a shared backend
+PROGRESS_WRITE_BEHIND = False
+PROGRESS_BUFFER = 'auto'
+PROGRESS_CACHE_ALIAS = 'default'
+PROGRESS_FLUSH_INTERVAL = 10  # seconds
+PROGRESS_FLUSH_MAX_ATTEMPTS = 5  # failed flushes before a buffered position is dropped
+
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
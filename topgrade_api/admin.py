@@ -144,10 +144,11 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Program)
 class ProgramAdmin(admin.ModelAdmin):
-    list_display = ['title', 'subtitle', 'category', 'price', 'discount_percentage', 'batch_starts', 'available_slots', 'is_best_seller']
+    list_display = ['title', 'subtitle', 'category', 'price', 'discount_percentage', 'batch_starts', 'available_slots', 'enrolled_students', 'is_best_seller']
     list_filter = ['category', 'is_best_seller', 'batch_starts']
     search_fields = ['title', 'subtitle']
     ordering = ['title']
+    readonly_fields = ['enrolled_students']
 
 
 @admin.register(Syllabus)
@@ -166,10 +167,11 @@ class TopicAdmin(admin.ModelAdmin):
 
 @admin.register(AdvanceProgram)
 class AdvanceProgramAdmin(admin.ModelAdmin):
-    list_display = ['title', 'price', 'discount_percentage', 'batch_starts', 'available_slots', 'is_best_seller']
+    list_display = ['title', 'price', 'discount_percentage', 'batch_starts', 'available_slots', 'enrolled_students', 'is_best_seller']
     list_filter = ['is_best_seller', 'batch_starts']
     search_fields = ['title', 'subtitle']
     ordering = ['title']
+    readonly_fields = ['enrolled_students']
 
 
 @admin.register(AdvanceSyllabus)
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class TopgradeApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'topgrade_api'
+
+    def ready(self):
+        # Registers the search index, catalog version, updated_at and user cache signal receivers
+        from . import authentication, catalog_cache, conditional  # noqa: F401
+        from .search import setup_search_index
+        post_migrate.connect(setup_search_index, sender=self)
+        # Fail at startup, not on the first listing, if CATALOG_ENGINE needs NumPy and it is missing
+        from .catalog_engine import get_catalog_engine
+        get_catalog_engine()
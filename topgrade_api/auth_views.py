@@ -1,24 +1,56 @@
 from ninja import NinjaAPI
+from ninja.decorators import decorate_view
 from django.contrib.auth import authenticate
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.http import JsonResponse
 from .schemas import LoginSchema, SignupSchema, RequestOtpSchema, VerifyOtpSchema, ResetPasswordSchema, RequestPhoneOtpSchema, PhoneSigninSchema, RefreshTokenSchema
-from .models import CustomUser, OTPVerification, PhoneOTPVerification
-from django.utils import timezone
-import time
+from .models import CustomUser
+from .authentication import AuthBearer, issue_refresh_token
+from .hashing import PasswordHashPoolBusy, hash_password
+from .otp_store import get_otp_store
+from .ratelimit import rate_limit
+from .revocation import ais_token_revoked, arevoke_token, revoke_token
+from .renderers import FastJSONRenderer
 
 # Initialize Django Ninja API for authentication
-auth_api = NinjaAPI(version="1.0.0", title="Authentication API", urls_namespace="auth")
+auth_api = NinjaAPI(version="1.0.0", title="Authentication API", urls_namespace="auth", renderer=FastJSONRenderer())
+
+@auth_api.exception_handler(PasswordHashPoolBusy)
+def password_hashing_busy(request, exc):
+    """
+    Shed load instead of queueing behind the password hashing pool
+    """
+    response = JsonResponse({"message": "Server is busy, please try again shortly"}, status=503)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
+def mask_phone_number(phone):
+    """
+    Masked phone number for privacy (e.g., 86XXXXXXX1)
+    """
+    # Clean phone number
+    clean = phone.replace('+', '').replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
+    if len(clean) >= 4:
+        # Show first 2 and last 1 digits, mask the rest
+        masked = clean[:2] + 'X' * (len(clean) - 3) + clean[-1:]
+    else:
+        # If phone is too short, just mask middle
+        masked = clean[0] + 'X' * (len(clean) - 2) + clean[-1] if len(clean) > 2 else clean
+    return masked
 
 @auth_api.post("/signin")
+@decorate_view(rate_limit('signin'))
 def signin(request, credentials: LoginSchema):
     """
     Simple signin API that returns access_token and refresh_token
     """
+    # PooledModelBackend checks the password on the bounded hashing pool
     user = authenticate(username=credentials.email, password=credentials.password)
     
     if user is not None:
-        refresh = RefreshToken.for_user(user)
+        refresh = issue_refresh_token(user)
         return {
             "success": True,
             "message": "Signin successful",
@@ -42,16 +74,19 @@ def signup(request, user_data: SignupSchema):
     if CustomUser.objects.filter(email=user_data.email).exists():
         return JsonResponse({"message": "User with this email already exists"}, status=400)
     
+    # Hash on the bounded pool; a busy pool is answered with 503
+    encoded_password = hash_password(user_data.password)
+    
     try:
         # Create new user
         user = CustomUser.objects.create_user(
             email=user_data.email,
-            password=user_data.password,
+            encoded_password=encoded_password,
             fullname=user_data.fullname
         )
         
         # Generate tokens for immediate login
-        refresh = RefreshToken.for_user(user)
+        refresh = issue_refresh_token(user)
         
         return {
             "success": True,
@@ -64,6 +99,7 @@ def signup(request, user_data: SignupSchema):
         return JsonResponse({"message": "Error creating user"}, status=500)
 
 @auth_api.post("/request-otp")
+@decorate_view(rate_limit('request_otp'))
 def request_otp(request, otp_data: RequestOtpSchema):
     """
     Request OTP for password reset
@@ -72,18 +108,8 @@ def request_otp(request, otp_data: RequestOtpSchema):
         # Check if user exists
         user = CustomUser.objects.get(email=otp_data.email)
         
-        # Create or update OTP verification record
-        otp_verification, created = OTPVerification.objects.get_or_create(
-            email=otp_data.email,
-            defaults={'is_verified': False}
-        )
-        
-        # Reset verification status for new OTP request
-        if not created:
-            otp_verification.is_verified = False
-            otp_verification.verified_at = None
-            otp_verification.expires_at = timezone.now() + timezone.timedelta(minutes=10)
-            otp_verification.save()
+        # Start a new OTP challenge, replacing any previous one
+        get_otp_store('password_reset').issue(otp_data.email)
         
         return {
             "success": True,
@@ -96,6 +122,7 @@ def request_otp(request, otp_data: RequestOtpSchema):
         return JsonResponse({"message": "Error sending OTP"}, status=500)
 
 @auth_api.post("/verify-otp")
+@decorate_view(rate_limit('verify_otp'))
 def verify_otp(request, verify_data: VerifyOtpSchema):
     """
     Verify OTP for password reset
@@ -104,24 +131,23 @@ def verify_otp(request, verify_data: VerifyOtpSchema):
         # Check if user exists
         user = CustomUser.objects.get(email=verify_data.email)
         
-        # Check if OTP verification record exists
-        try:
-            otp_verification = OTPVerification.objects.get(email=verify_data.email)
-        except OTPVerification.DoesNotExist:
+        # Check if an OTP challenge exists
+        otp_store = get_otp_store('password_reset')
+        otp_state = otp_store.get(verify_data.email)
+        if otp_state is None:
             return JsonResponse({"message": "No OTP request found. Please request OTP first."}, status=400)
         
         # Check if OTP verification has expired
-        if otp_verification.is_expired():
+        if otp_state.is_expired():
             return JsonResponse({"message": "OTP has expired. Please request a new OTP."}, status=400)
         
         # Check if OTP is correct (static OTP: 654321)
         if verify_data.otp != "654321":
             return JsonResponse({"message": "Invalid OTP"}, status=400)
         
-        # Mark OTP as verified
-        otp_verification.is_verified = True
-        otp_verification.verified_at = timezone.now()
-        otp_verification.save()
+        # Mark OTP as verified; fails if the challenge expired in the meantime
+        if not otp_store.mark_verified(verify_data.email):
+            return JsonResponse({"message": "OTP has expired. Please request a new OTP."}, status=400)
         
         return {
             "success": True,
@@ -147,25 +173,28 @@ def reset_password(request, reset_data: ResetPasswordSchema):
         user = CustomUser.objects.get(email=reset_data.email)
         
         # Check if OTP was verified
-        try:
-            otp_verification = OTPVerification.objects.get(email=reset_data.email)
-        except OTPVerification.DoesNotExist:
+        otp_store = get_otp_store('password_reset')
+        otp_state = otp_store.get(reset_data.email)
+        if otp_state is None:
             return JsonResponse({"message": "OTP verification required. Please request and verify OTP first."}, status=400)
         
         # Check if OTP verification is still valid and verified
-        if not otp_verification.is_verified:
+        if not otp_state.verified:
             return JsonResponse({"message": "OTP not verified. Please verify OTP before resetting password."}, status=400)
         
-        if otp_verification.is_expired():
+        if otp_state.is_expired():
+            return JsonResponse({"message": "OTP verification has expired. Please request a new OTP."}, status=400)
+        
+        encoded_password = hash_password(reset_data.new_password)
+        
+        # Use up the verification; only one concurrent reset can
+        if not otp_store.consume(reset_data.email, verified_only=True):
             return JsonResponse({"message": "OTP verification has expired. Please request a new OTP."}, status=400)
         
         # Update the password
-        user.set_password(reset_data.new_password)
+        user.password = encoded_password
         user.save()
         
-        # Clean up the OTP verification record after successful password reset
-        otp_verification.delete()
-        
         return {
             "success": True,
             "message": "Password reset successfully"
@@ -173,10 +202,13 @@ def reset_password(request, reset_data: ResetPasswordSchema):
         
     except CustomUser.DoesNotExist:
         return JsonResponse({"message": "User with this email does not exist"}, status=404)
+    except PasswordHashPoolBusy:
+        raise
     except Exception as e:
         return JsonResponse({"message": "Error resetting password"}, status=500)
 
 @auth_api.post("/request-phone-otp")
+@decorate_view(rate_limit('request_phone_otp'))
 def request_phone_otp(request, phone_data: RequestPhoneOtpSchema):
     """
     Request OTP for phone number signin - creates user if doesn't exist
@@ -186,26 +218,11 @@ def request_phone_otp(request, phone_data: RequestPhoneOtpSchema):
     if len(clean_phone) != 10 or not clean_phone.isdigit():
         return JsonResponse({"message": "Phone number must be exactly 10 digits"}, status=400)
     
-    try:
-        # Check if user exists with this phone number
-        user = CustomUser.objects.get(phone_number=phone_data.phone_number)
-        user_exists = True
-        
-    except CustomUser.DoesNotExist:
-        user_exists = False
-    
-    # Create or update Phone OTP verification record
-    phone_otp_verification, created = PhoneOTPVerification.objects.get_or_create(
-        phone_number=phone_data.phone_number,
-        defaults={'is_verified': False}
-    )
+    # Check if user exists with this phone number (an index lookup)
+    user_exists = CustomUser.objects.filter(phone_number=phone_data.phone_number).exists()
     
-    # Reset verification status for new OTP request
-    if not created:
-        phone_otp_verification.is_verified = False
-        phone_otp_verification.verified_at = None
-        phone_otp_verification.expires_at = timezone.now() + timezone.timedelta(minutes=10)
-        phone_otp_verification.save()
+    # Start a new OTP challenge, replacing any previous one
+    get_otp_store('phone_signin').issue(phone_data.phone_number)
     
     return {
         "success": True,
@@ -214,6 +231,7 @@ def request_phone_otp(request, phone_data: RequestPhoneOtpSchema):
     }
 
 @auth_api.post("/phone-signin")
+@decorate_view(rate_limit('phone_signin'))
 def phone_signin(request, phone_data: PhoneSigninSchema):
     """
     Phone signin API using phone number and OTP - creates user if doesn't exist
@@ -223,73 +241,39 @@ def phone_signin(request, phone_data: PhoneSigninSchema):
     if len(clean_phone) != 10 or not clean_phone.isdigit():
         return JsonResponse({"message": "Phone number must be exactly 10 digits"}, status=400)
     
-    # Check if Phone OTP verification record exists
-    try:
-        phone_otp_verification = PhoneOTPVerification.objects.get(phone_number=phone_data.phone_number)
-    except PhoneOTPVerification.DoesNotExist:
+    # Check if a phone OTP challenge exists
+    otp_store = get_otp_store('phone_signin')
+    otp_state = otp_store.get(phone_data.phone_number)
+    if otp_state is None:
         return JsonResponse({"message": "No OTP request found. Please request OTP first."}, status=400)
     
     # Check if OTP verification has expired
-    if phone_otp_verification.is_expired():
+    if otp_state.is_expired():
         return JsonResponse({"message": "OTP has expired. Please request a new OTP."}, status=400)
     
     # Check if OTP is correct (static OTP: 654321)
     if phone_data.otp != "654321":
         return JsonResponse({"message": "Invalid OTP"}, status=400)
     
+    # Use up the challenge before signing in, so it can't be replayed concurrently
+    if not otp_store.consume(phone_data.phone_number):
+        return JsonResponse({"message": "No OTP request found. Please request OTP first."}, status=400)
+    
     try:
-        # Check if user exists with this phone number
-        user = CustomUser.objects.get(phone_number=phone_data.phone_number)
-        message = "Phone signin successful"
+        # Fetch the user with this phone number, or create one; concurrent
+        # first sign-ins from the same number all get the same single user
+        user, created = CustomUser.objects.get_or_create_phone_user(
+            phone_data.phone_number,
+            fullname=mask_phone_number(phone_data.phone_number)  # Masked phone as fullname
+        )
+        message = "User created and signed in successfully" if created else "Phone signin successful"
         
-    except CustomUser.DoesNotExist:
-        # Create new user if doesn't exist
-        try:
-            # Clean phone number for email generation
-            clean_phone = phone_data.phone_number.replace('+', '').replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
-            
-            # Generate unique email with timestamp to ensure uniqueness
-            timestamp = str(int(time.time()))
-            temp_email = f"phone_{clean_phone}_{timestamp}@tempuser.com"
-            
-            # Double check email uniqueness
-            counter = 1
-            while CustomUser.objects.filter(email=temp_email).exists():
-                temp_email = f"phone_{clean_phone}_{timestamp}_{counter}@tempuser.com"
-                counter += 1
-            
-            # Create masked fullname for privacy (e.g., 86XXXXXXX1)
-            def mask_phone_number(phone):
-                # Clean phone number
-                clean = phone.replace('+', '').replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
-                if len(clean) >= 4:
-                    # Show first 2 and last 1 digits, mask the rest
-                    masked = clean[:2] + 'X' * (len(clean) - 3) + clean[-1:]
-                else:
-                    # If phone is too short, just mask middle
-                    masked = clean[0] + 'X' * (len(clean) - 2) + clean[-1] if len(clean) > 2 else clean
-                return masked
-            
-            masked_fullname = mask_phone_number(phone_data.phone_number)
-            
-            # Create user with masked phone as fullname and auto-generated password
-            user = CustomUser.objects.create_user(
-                email=temp_email,
-                phone_number=phone_data.phone_number,
-                fullname=masked_fullname,
-                password=phone_data.phone_number  # Use phone number as password
-            )
-            message = "User created and signed in successfully"
-            
-        except Exception as e:
-            return JsonResponse({"message": "Error creating user"}, status=500)
+    except Exception as e:
+        return JsonResponse({"message": "Error creating user"}, status=500)
     
     try:
         # Generate tokens for login
-        refresh = RefreshToken.for_user(user)
-        
-        # Clean up the Phone OTP verification record after successful signin
-        phone_otp_verification.delete()
+        refresh = issue_refresh_token(user)
         
         return {
             "success": True,
@@ -303,22 +287,59 @@ def phone_signin(request, phone_data: PhoneSigninSchema):
         return JsonResponse({"message": "Error during phone signin"}, status=500)
 
 @auth_api.post("/refresh")
-def refresh_token(request, token_data: RefreshTokenSchema):
+async def refresh_token(request, token_data: RefreshTokenSchema):
     """
     Refresh access token using refresh token
     """
     try:
         # Create RefreshToken object from the provided refresh token
         refresh = RefreshToken(token_data.refresh_token)
+    except TokenError:
+        return JsonResponse({"message": "Invalid or expired refresh token"}, status=401)
+    
+    # Reject revoked refresh tokens (a Bloom filter lookup for almost all of them)
+    if await ais_token_revoked(refresh):
+        return JsonResponse({"message": "Invalid or expired refresh token"}, status=401)
+    
+    response = {
+        "success": True,
+        "message": "Token refreshed successfully",
+    }
+    
+    if api_settings.ROTATE_REFRESH_TOKENS:
+        if api_settings.BLACKLIST_AFTER_ROTATION:
+            # Only one of several concurrent refreshes with the same token can revoke it
+            if not await arevoke_token(refresh):
+                return JsonResponse({"message": "Invalid or expired refresh token"}, status=401)
         
-        # Generate new access token
-        new_access_token = str(refresh.access_token)
-        
-        return {
-            "success": True,
-            "message": "Token refreshed successfully",
-            "access_token": new_access_token
-        }
-        
-    except Exception as e:
-        return JsonResponse({"message": "Invalid or expired refresh token"}, status=401)
\ No newline at end of file
+        # Same claims under a new id and lifetime
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+        response["refresh_token"] = str(refresh)
+    
+    # Generate new access token
+    response["access_token"] = str(refresh.access_token)
+    return response
+
+@auth_api.post("/signout", auth=AuthBearer())
+def signout(request, token_data: RefreshTokenSchema):
+    """
+    Revoke the refresh token and the access token of this session
+    """
+    try:
+        refresh = RefreshToken(token_data.refresh_token)
+    except TokenError:
+        return JsonResponse({"message": "Invalid or expired refresh token"}, status=401)
+    
+    # Only the owner may revoke a refresh token
+    if str(refresh[api_settings.USER_ID_CLAIM]) != str(request.auth.pk):
+        return JsonResponse({"message": "Invalid or expired refresh token"}, status=401)
+    
+    revoke_token(refresh)
+    revoke_token(request.access_token)
+    
+    return {
+        "success": True,
+        "message": "Signed out successfully"
+    }
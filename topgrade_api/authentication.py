@@ -0,0 +1,194 @@
+"""
+JWT bearer authentication for the general API.
+
+Each request decodes its access token once. The user behind it comes from,
+in order: a per-process TTL LRU cache of lightweight user records, the
+`role` claim that tokens issued by issue_refresh_token() carry when
+JWT_USER_CLAIMS is on (off by default), and only then the database. Records are built into model instances with every
+other field deferred, so views can still filter by the user, create rows
+for them and read any field (which loads it on first access).
+
+Saving or deleting a CustomUser drops its cache entry in this process;
+other workers pick up the change when their entry expires
+(AUTH_USER_CACHE_TTL seconds). Revoked tokens (see revocation) are turned
+away before any of this.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from ninja.security import HttpBearer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .models import CustomUser
+from .revocation import ais_token_revoked, is_token_revoked
+
+# Fields kept per cached user; password hashes deliberately stay out. Model.from_db()
+# takes the values of a partial row positionally, so they follow the model's field order
+USER_RECORD_FIELDS = [
+    field.attname for field in CustomUser._meta.concrete_fields
+    if field.attname in {
+        'id', 'email', 'username', 'fullname', 'phone_number', 'area_of_intrest', 'role',
+        'is_active', 'is_staff', 'is_superuser',
+    }
+]
+
+
+class UserCache:
+    """
+    Thread-safe LRU of user records that expire `ttl` seconds after caching
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, record = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return record
+
+    def set(self, user_id, record):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    maxsize=getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 60),
+)
+
+
+def issue_refresh_token(user):
+    """
+    RefreshToken.for_user() plus, with JWT_USER_CLAIMS on, the `role` and
+    `has_area_of_intrest` claims (copied into every access token it mints)
+    """
+    refresh = RefreshToken.for_user(user)
+    if getattr(settings, 'JWT_USER_CLAIMS', False):
+        refresh['role'] = user.role
+        refresh['has_area_of_intrest'] = bool(user.area_of_intrest and user.area_of_intrest.strip())
+    return refresh
+
+
+def _build_user(fields, values):
+    # Unlisted fields are deferred, so save() only writes the loaded ones
+    return CustomUser.from_db('default', fields, values)
+
+
+def load_user_record(user_id):
+    """Fetch and cache the (fields, values) record of a user; None if there is no such user"""
+    values = CustomUser.objects.filter(pk=user_id).values_list(*USER_RECORD_FIELDS).first()
+    if values is None:
+        return None
+    record = (USER_RECORD_FIELDS, values)
+    user_cache.set(user_id, record)
+    return record
+
+
+async def aload_user_record(user_id):
+    """load_user_record() for async code"""
+    values = await CustomUser.objects.filter(pk=user_id).values_list(*USER_RECORD_FIELDS).afirst()
+    if values is None:
+        return None
+    record = (USER_RECORD_FIELDS, values)
+    user_cache.set(user_id, record)
+    return record
+
+
+def decode_access_token(token):
+    """(access token, user id) of a valid access token, or None"""
+    try:
+        # One decode validates the signature, expiry and token type
+        access_token = AccessToken(token)
+        # The claim is serialized as a string; cache keys use the real pk type
+        user_id = CustomUser._meta.pk.to_python(access_token[api_settings.USER_ID_CLAIM])
+    except (TokenError, KeyError, ValidationError):
+        return None
+    return access_token, user_id
+
+
+def cached_user_record(access_token, user_id):
+    """The user's record from the cache or the token's claims, if either has it"""
+    record = user_cache.get(user_id)
+    if record is None and 'role' in access_token:
+        # Tokens carrying user claims need no database round trip
+        record = (['id', 'role'], (user_id, access_token['role']))
+    return record
+
+
+class AuthBearer(HttpBearer):
+    def authenticate(self, request, token):
+        decoded = decode_access_token(token)
+        if decoded is None:
+            return None
+        access_token, user_id = decoded
+
+        # Signed-out tokens; the in-memory Bloom filter clears almost all others without a query
+        if is_token_revoked(access_token):
+            return None
+        # For views that act on the token itself, e.g. signout
+        request.access_token = access_token
+
+        record = cached_user_record(access_token, user_id)
+        if record is None:
+            record = load_user_record(user_id)
+            if record is None:
+                return None
+        return _build_user(*record)
+
+
+class AsyncAuthBearer(AuthBearer):
+    """
+    AuthBearer for async operations: the same checks, with the rare database
+    lookups awaited instead of blocking the event loop. Sync operations keep
+    AuthBearer, which Ninja would otherwise run through async_to_sync.
+    """
+
+    async def authenticate(self, request, token):
+        decoded = decode_access_token(token)
+        if decoded is None:
+            return None
+        access_token, user_id = decoded
+
+        if await ais_token_revoked(access_token):
+            return None
+        request.access_token = access_token
+
+        record = cached_user_record(access_token, user_id)
+        if record is None:
+            record = await aload_user_record(user_id)
+            if record is None:
+                return None
+        return _build_user(*record)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
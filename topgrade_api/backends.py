@@ -1,8 +1,52 @@
-from django.contrib.auth.backends import BaseBackend
+from django.conf import settings
+from django.contrib.auth.backends import BaseBackend, ModelBackend
 from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import UserCache
+from .hashing import verify_user_password
 
 User = get_user_model()
 
+# Every concrete field, so nothing on a cached admin loads lazily. The password
+# hash is needed to verify the session's auth hash, so this cache stays in
+# process memory rather than in a shared cache backend
+ADMIN_USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+
+admin_cache = UserCache(
+    maxsize=getattr(settings, 'DASHBOARD_AUTH_CACHE_SIZE', 1000),
+    ttl=getattr(settings, 'DASHBOARD_AUTH_CACHE_TTL', 30),
+)
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that checks passwords on the bounded hashing pool (see
+    topgrade_api.hashing) and upgrades out-of-date password hashes.
+    Raises PasswordHashPoolBusy when the pool is saturated, and
+    PermissionDenied for a wrong password, so that the backends after it
+    don't hash it again.
+    """
+    
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway so unknown emails take as long as wrong passwords
+            verify_user_password(None, password)
+            raise PermissionDenied
+        
+        if not verify_user_password(user, password):
+            raise PermissionDenied
+        if self.user_can_authenticate(user):
+            return user
+        return None
+
 class AdminOnlyBackend(BaseBackend):
     """
     Custom authentication backend that only allows admin users (superusers) to authenticate
@@ -14,8 +58,8 @@ class AdminOnlyBackend(BaseBackend):
             # Try to find user by email (since we use email as username)
             user = User.objects.get(email=username)
             
-            # Check if password is correct and user is a superuser
-            if user.check_password(password) and user.is_superuser:
+            # Check the user is a superuser before paying for the password hash
+            if user.is_superuser and verify_user_password(user, password):
                 return user
         except User.DoesNotExist:
             return None
@@ -23,12 +67,22 @@ class AdminOnlyBackend(BaseBackend):
         return None
     
     def get_user(self, user_id):
-        try:
-            user = User.objects.get(pk=user_id)
-            # Only return user if they are a superuser
-            if user.is_superuser:
-                return user
-        except User.DoesNotExist:
-            return None
-        
-        return None
\ No newline at end of file
+        """
+        The superuser of a dashboard session, from a short-lived per-process
+        cache so a dashboard page costs no user query once the admin is cached
+        """
+        values = admin_cache.get(user_id)
+        if values is None:
+            # Only superusers are returned, and so cached
+            values = User.objects.filter(pk=user_id, is_superuser=True).values_list(*ADMIN_USER_FIELDS).first()
+            if values is None:
+                return None
+            admin_cache.set(user_id, values)
+        # A fresh instance per request, so views can't change the cached one
+        return User.from_db('default', ADMIN_USER_FIELDS, values)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_admin(sender, instance, **kwargs):
+    # Other processes catch up within DASHBOARD_AUTH_CACHE_TTL
+    admin_cache.invalidate(instance.pk)
@@ -0,0 +1,541 @@
+"""
+Catalog listing helpers shared by the program endpoints.
+
+Listings span both Program and AdvanceProgram and are built by CatalogQuery
+as a single UNION ALL. Every sort order ends in (type_rank, id), which makes
+it total, so the sort values of the last row on a page are enough to find
+where the next page starts (keyset pagination) without OFFSET scans.
+"""
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import models
+from django.db.models.functions import Round
+from .models import Program, AdvanceProgram, Category
+from .search import get_search_backend
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+PROGRAM_TYPE_RANK = {'program': 0, 'advanced_program': 1}
+
+SORT_OPTIONS = ['title', 'price', 'program_rating', 'available_slots', 'discounted_price', 'most_relevant', 'recently_added', 'top_rated']
+
+DECIMAL_SORT_FIELDS = {'price', 'program_rating', 'discounted_price'}
+
+IMAGE_STORAGE = Program._meta.get_field('image').storage
+
+DISCOUNTED_PRICE = Round(
+    models.F('price') * (100 - models.F('discount_percentage')) / 100,
+    2,
+    output_field=models.DecimalField(max_digits=10, decimal_places=2),
+)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor is malformed or was issued for a different sort"""
+
+
+def get_sort_keys(sort_by, sort_order, ranked=False):
+    """
+    Return the (field, descending) pairs that totally order a listing.
+    `ranked` listings come from a search and carry a search_rank column.
+    """
+    descending = sort_order == 'desc'
+    if sort_by == 'most_relevant' and ranked:
+        # Full-text relevance first, then the usual relevance signals
+        keys = [('search_rank', False), ('is_best_seller', True), ('program_rating', True), ('enrolled_students', True)]
+    elif sort_by == 'most_relevant':
+        # Best sellers first, then by rating, then by enrolled students
+        keys = [('is_best_seller', True), ('program_rating', True), ('enrolled_students', True)]
+    elif sort_by == 'recently_added':
+        # Using ID as proxy for creation order
+        keys = [('id', True)]
+    elif sort_by == 'top_rated':
+        keys = [('program_rating', True), ('enrolled_students', True)]
+    elif sort_by in SORT_OPTIONS:
+        keys = [(sort_by, descending)]
+    else:
+        keys = []
+
+    # Tiebreakers: regular programs before advanced ones, then by id
+    keys.append(('type_rank', False))
+    if ('id', True) not in keys:
+        keys.append(('id', False))
+    return keys
+
+
+def encode_cursor(sort_keys, values):
+    """Pack the sort values of the last row of a page into an opaque token"""
+    payload = {
+        "k": [f"{field}:{'d' if descending else 'a'}" for field, descending in sort_keys],
+        "v": [str(value) if isinstance(value, Decimal) else value for value in values],
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_keys):
+    """Unpack a cursor issued by encode_cursor for the same sort keys"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        signature = [f"{field}:{'d' if descending else 'a'}" for field, descending in sort_keys]
+        if payload["k"] != signature or len(payload["v"]) != len(sort_keys):
+            raise InvalidCursor("Cursor does not match the requested sort")
+
+        values = []
+        for (field, _), value in zip(sort_keys, payload["v"]):
+            if field in DECIMAL_SORT_FIELDS:
+                value = Decimal(value)
+            elif not isinstance(value, (int, float, str)):
+                raise InvalidCursor("Malformed cursor")
+            values.append(value)
+        return values
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError, InvalidOperation) as e:
+        if isinstance(e, InvalidCursor):
+            raise
+        raise InvalidCursor("Malformed cursor") from e
+
+
+def apply_program_filters(queryset, is_best_seller=None, min_price=None, max_price=None, min_rating=None):
+    """Apply the filters shared by Program and AdvanceProgram listings"""
+    if is_best_seller is not None:
+        queryset = queryset.filter(is_best_seller=is_best_seller)
+
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    if min_rating is not None:
+        queryset = queryset.filter(program_rating__gte=min_rating)
+    return queryset
+
+
+def _keyset_condition(sort_keys, values, type_rank):
+    """
+    Build the condition selecting rows strictly after `values` in one table.
+
+    type_rank is constant within a table, so comparisons on it are decided
+    here rather than in SQL. Returns True when every row qualifies and None
+    when no row can.
+    """
+    terms = []
+    for index, (field, descending) in enumerate(sort_keys):
+        prefix = models.Q()
+        possible = True
+        for (prev_field, _), prev_value in zip(sort_keys[:index], values[:index]):
+            if prev_field == 'type_rank':
+                possible = possible and type_rank == prev_value
+            else:
+                prefix &= models.Q(**{prev_field: prev_value})
+        if not possible:
+            continue
+
+        value = values[index]
+        if field == 'type_rank':
+            if not (type_rank < value if descending else type_rank > value):
+                continue
+            if not prefix:
+                return True
+            terms.append(prefix)
+        else:
+            lookup = f"{field}__lt" if descending else f"{field}__gt"
+            terms.append(prefix & models.Q(**{lookup: value}))
+
+    if not terms:
+        return None
+    condition = terms[0]
+    for term in terms[1:]:
+        condition |= term
+    return condition
+
+
+CARD_FIELDS = [
+    'id', 'title', 'subtitle', 'description', 'image', 'duration', 'program_rating',
+    'is_best_seller', 'enrolled_students', 'price', 'discount_percentage', 'available_slots',
+]
+
+
+class CatalogQuery:
+    """
+    Query builder expressing Program and AdvanceProgram as one UNION ALL.
+
+    Both branches share the CARD_FIELDS projection plus computed columns
+    (category_pk, category_name, program_type, type_rank, discounted_price),
+    so filtering, ordering and LIMIT all run in the database and each row is
+    enough to render a program card.
+    """
+
+    def __init__(self, program_types=None):
+        program_types = program_types or list(PROGRAM_TYPE_RANK)
+        self.branches = {}
+        if 'program' in program_types:
+            self.branches['program'] = Program.objects.annotate(
+                category_pk=models.F('category_id'),
+                category_name=models.F('category__name'),
+            )
+        if 'advanced_program' in program_types:
+            # Advanced programs don't have categories
+            self.branches['advanced_program'] = AdvanceProgram.objects.annotate(
+                category_pk=models.Value(None, output_field=models.BigIntegerField()),
+                category_name=models.Value(None, output_field=models.CharField()),
+            )
+        self.ranked = False
+        for program_type, queryset in self.branches.items():
+            self.branches[program_type] = queryset.annotate(
+                program_type=models.Value(program_type, output_field=models.CharField()),
+                type_rank=models.Value(PROGRAM_TYPE_RANK[program_type], output_field=models.IntegerField()),
+                discounted_price=DISCOUNTED_PRICE,
+            )
+
+    def filter(self, **filters):
+        """Apply apply_program_filters() to every branch"""
+        for program_type, queryset in self.branches.items():
+            self.branches[program_type] = apply_program_filters(queryset, **filters)
+        return self
+
+    def search(self, text):
+        """Keep full-text matches for `text` and expose their search_rank"""
+        backend = get_search_backend()
+        for program_type, queryset in self.branches.items():
+            self.branches[program_type] = backend.apply(queryset, program_type, text)
+        self.ranked = True
+        return self
+
+    def filter_category(self, category_id):
+        """Restrict regular programs to a category; advanced programs have none"""
+        if 'program' in self.branches:
+            self.branches['program'] = self.branches['program'].filter(category_id=category_id)
+        return self
+
+    def counts(self):
+        """Number of matching rows per program type"""
+        return {program_type: queryset.count() for program_type, queryset in self.branches.items()}
+
+    def _union(self, branches, sort_keys):
+        columns = CARD_FIELDS + ['category_pk', 'category_name', 'program_type', 'type_rank', 'discounted_price']
+        if self.ranked:
+            columns.append('search_rank')
+        projected = [queryset.values(*columns) for queryset in branches]
+        if not projected:
+            return []
+        query = projected[0]
+        if len(projected) > 1:
+            query = query.union(*projected[1:], all=True)
+        return query.order_by(*_order_by(sort_keys))
+
+    def rows(self):
+        """Every matching row, in (type_rank, id) order"""
+        return list(self._union(list(self.branches.values()), [('type_rank', False), ('id', False)]))
+
+    def page(self, sort_keys, cursor_values=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Fetch one keyset page as card rows. Returns (rows, next_cursor).
+        """
+        branches = []
+        for program_type, queryset in self.branches.items():
+            if cursor_values is not None:
+                condition = _keyset_condition(sort_keys, cursor_values, PROGRAM_TYPE_RANK[program_type])
+                if condition is None:
+                    continue
+                if condition is not True:
+                    queryset = queryset.filter(condition)
+            branches.append(queryset)
+
+        rows = list(self._union(branches, sort_keys)[:limit + 1])
+        page = rows[:limit]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor(sort_keys, [last[field] for field, _ in sort_keys])
+        return page, next_cursor
+
+    def section(self, sort_keys, limits):
+        """
+        Rows for a landing-style section: the top `limits[program_type]` rows of
+        each branch, regular programs first.
+        """
+        order_by = _order_by(sort_keys)
+        branches = []
+        for program_type, queryset in self.branches.items():
+            # SQLite rejects LIMIT inside compound statements, so rank in a subquery
+            top_ids = queryset.order_by(*order_by).values('pk')[:limits.get(program_type, 0)]
+            branches.append(queryset.filter(pk__in=top_ids))
+        return list(self._union(branches, [('type_rank', False)] + sort_keys))
+
+
+def list_programs(program_types, sort_keys, category_id=None, search=None, cursor_values=None,
+                  limit=DEFAULT_PAGE_SIZE, **filters):
+    """
+    Run a /programs/filter listing against the database.
+
+    Returns (counts, cards, next_cursor) where counts maps each program type
+    to its number of matches across the whole filtered catalog.
+    """
+    catalog = CatalogQuery(program_types).filter(**filters)
+    if search:
+        catalog.search(search)
+
+    # Category filter applies to regular programs only and is skipped for an unknown category
+    if category_id is not None and Category.objects.filter(id=category_id).exists():
+        catalog.filter_category(category_id)
+
+    counts = catalog.counts()
+    page, next_cursor = catalog.page(sort_keys, cursor_values=cursor_values, limit=limit)
+    return counts, [serialize_catalog_row(row) for row in page], next_cursor
+
+
+# Facet buckets: prices are [min, max) ranges, ratings are "min_rating and up"
+PRICE_BUCKETS = [(None, 500), (500, 1000), (1000, 2000), (2000, None)]
+RATING_BUCKETS = [4.5, 4.0, 3.5, 3.0]
+
+
+def _count(condition):
+    return models.Count('pk', filter=condition) if condition else models.Count('pk')
+
+
+def _price_bucket(low, high):
+    condition = models.Q()
+    if low is not None:
+        condition &= models.Q(price__gte=low)
+    if high is not None:
+        condition &= models.Q(price__lt=high)
+    return condition
+
+
+def count_facets(program_types, category_id=None, search=None, is_best_seller=None,
+                 min_price=None, max_price=None, min_rating=None):
+    """
+    Facet counts for a /programs/filter filter set, with one aggregate query
+    per program table (plus one for the category names).
+
+    Each facet applies every active filter except its own, so the counts
+    show what choosing another value of that facet would return.
+    """
+    categories = list(Category.objects.order_by('name').values_list('id', 'name'))
+
+    dimensions = {}
+    # Unknown categories are ignored, like in list_programs
+    if category_id is not None and category_id in {pk for pk, _ in categories}:
+        dimensions['category'] = models.Q(category_id=category_id)
+    if min_price is not None or max_price is not None:
+        dimensions['price'] = models.Q()
+        if min_price is not None:
+            dimensions['price'] &= models.Q(price__gte=min_price)
+        if max_price is not None:
+            dimensions['price'] &= models.Q(price__lte=max_price)
+    if min_rating is not None:
+        dimensions['rating'] = models.Q(program_rating__gte=min_rating)
+    if is_best_seller is not None:
+        dimensions['best_seller'] = models.Q(is_best_seller=is_best_seller)
+
+    def others(table_type, excluded=None):
+        condition = models.Q()
+        for dimension, dimension_condition in dimensions.items():
+            # Advanced programs have no category, so the category filter passes them through
+            if dimension != excluded and not (dimension == 'category' and table_type != 'program'):
+                condition &= dimension_condition
+        return condition
+
+    facets = {
+        "program_type": {},
+        "category": [{"id": pk, "name": name, "count": 0} for pk, name in categories],
+        "price": [{"min": low, "max": high, "count": 0} for low, high in PRICE_BUCKETS],
+        "rating": [{"min_rating": rating, "count": 0} for rating in RATING_BUCKETS],
+        "is_best_seller": {"true": 0, "false": 0},
+    }
+
+    backend = get_search_backend() if search else None
+    for table_type, model in (('program', Program), ('advanced_program', AdvanceProgram)):
+        queryset = model.objects.all()
+        if backend is not None:
+            queryset = backend.apply(queryset, table_type, search)
+
+        # The program type facet counts every table; the rest only the selected ones
+        aggregates = {'total': _count(others(table_type))}
+        if table_type in program_types:
+            if table_type == 'program':
+                for pk, _ in categories:
+                    aggregates[f'category_{pk}'] = _count(others(table_type, 'category') & models.Q(category_id=pk))
+            for index, (low, high) in enumerate(PRICE_BUCKETS):
+                aggregates[f'price_{index}'] = _count(others(table_type, 'price') & _price_bucket(low, high))
+            for index, rating in enumerate(RATING_BUCKETS):
+                aggregates[f'rating_{index}'] = _count(
+                    others(table_type, 'rating') & models.Q(program_rating__gte=rating)
+                )
+            for flag in (True, False):
+                aggregates[f'best_seller_{str(flag).lower()}'] = _count(
+                    others(table_type, 'best_seller') & models.Q(is_best_seller=flag)
+                )
+
+        counts = queryset.aggregate(**aggregates)
+        facets["program_type"][table_type] = counts['total']
+        if table_type not in program_types:
+            continue
+        for entry in facets["category"] if table_type == 'program' else []:
+            entry["count"] += counts[f'category_{entry["id"]}']
+        for index, entry in enumerate(facets["price"]):
+            entry["count"] += counts[f'price_{index}']
+        for index, entry in enumerate(facets["rating"]):
+            entry["count"] += counts[f'rating_{index}']
+        for flag in ("true", "false"):
+            facets["is_best_seller"][flag] += counts[f'best_seller_{flag}']
+    return facets
+
+
+def build_landing_sections():
+    """
+    Build the non-personal /landing sections; each holds at most 5 cards
+    """
+    by_rating = [('program_rating', True), ('id', True)]
+    landing_limits = {'program': 3, 'advanced_program': 2}
+
+    def cards(catalog, sort_keys, limits):
+        return [serialize_catalog_row(row) for row in catalog.section(sort_keys, limits)]
+
+    return {
+        # Top Courses - Highest rated programs (both regular and advanced)
+        "top_course": cards(CatalogQuery().filter(min_rating=4.0), by_rating, landing_limits),
+        # Recently Added - Latest programs by ID (assuming higher ID = newer)
+        "recently_added": cards(CatalogQuery(), [('id', True)], landing_limits),
+        # Featured - Best seller programs
+        "featured": cards(CatalogQuery().filter(is_best_seller=True), by_rating, landing_limits),
+        # Programs - Regular programs only
+        "programs": cards(CatalogQuery(['program']), by_rating, {'program': 5}),
+        # Advanced Programs - Advanced programs only
+        "advanced_programs": cards(CatalogQuery(['advanced_program']), by_rating, {'advanced_program': 5}),
+    }
+
+
+def _order_by(sort_keys):
+    return [('-' if descending else '') + field for field, descending in sort_keys]
+
+
+def serialize_program_card(program, program_type):
+    """Format a program the way every listing endpoint returns it"""
+    discounted_price = program.price
+    if program.discount_percentage > 0:
+        discounted_price = program.price * (1 - program.discount_percentage / 100)
+
+    category = None
+    if program_type == 'program' and program.category:
+        category = {
+            "id": program.category.id,
+            "name": program.category.name,
+        }
+
+    return {
+        "id": program.id,
+        "type": program_type,
+        "title": program.title,
+        "subtitle": program.subtitle,
+        "description": program.description,
+        "category": category,  # Advanced programs don't have categories
+        "image": program.image.url if program.image else None,
+        "duration": program.duration,
+        "program_rating": float(program.program_rating),
+        "is_best_seller": program.is_best_seller,
+        "enrolled_students": program.enrolled_students,
+        "pricing": {
+            "original_price": float(program.price),
+            "discount_percentage": float(program.discount_percentage),
+            "discounted_price": float(discounted_price),
+            "savings": float(program.price - discounted_price)
+        },
+    }
+
+
+def serialize_catalog_row(row):
+    """Format a CatalogQuery row exactly like serialize_program_card"""
+    price = Decimal(row['price'])
+    discount_percentage = Decimal(row['discount_percentage'])
+    discounted_price = price
+    if discount_percentage > 0:
+        discounted_price = price * (1 - discount_percentage / 100)
+
+    category = None
+    if row['category_pk'] is not None:
+        category = {
+            "id": row['category_pk'],
+            "name": row['category_name'],
+        }
+
+    return {
+        "id": row['id'],
+        "type": row['program_type'],
+        "title": row['title'],
+        "subtitle": row['subtitle'],
+        "description": row['description'],
+        "category": category,
+        "image": IMAGE_STORAGE.url(row['image']) if row['image'] else None,
+        "duration": row['duration'],
+        "program_rating": float(row['program_rating']),
+        "is_best_seller": bool(row['is_best_seller']),
+        "enrolled_students": row['enrolled_students'],
+        "pricing": {
+            "original_price": float(price),
+            "discount_percentage": float(discount_percentage),
+            "discounted_price": float(discounted_price),
+            "savings": float(price - discounted_price)
+        },
+    }
+
+
+def serialize_syllabus_trees(program, program_type):
+    """
+    Serialize a program's modules and topics once for both entitlements.
+
+    Returns {"locked": ..., "unlocked": ...}: "unlocked" is what a purchaser
+    sees, "locked" hides every video except regular program intros.
+    """
+    trees = {"locked": [], "unlocked": []}
+    for syllabus in program.syllabuses.all().prefetch_related('topics'):
+        modules = {"locked": [], "unlocked": []}
+        for topic in syllabus.topics.all():
+            for variant, has_purchased in (("locked", False), ("unlocked", True)):
+                if program_type == 'program':
+                    # Regular programs have intro videos
+                    is_accessible = has_purchased or topic.is_intro
+                    topic_data = {
+                        "id": topic.id,
+                        "topic_title": topic.topic_title,
+                        "is_free_trail": topic.is_free_trail,
+                        "is_intro": topic.is_intro,
+                        "is_locked": not is_accessible
+                    }
+                else:
+                    # Advanced programs - all videos locked unless purchased
+                    is_accessible = has_purchased
+                    topic_data = {
+                        "id": topic.id,
+                        "topic_title": topic.topic_title,
+                        "is_locked": not has_purchased
+                    }
+
+                # Only add video_url if accessible
+                if is_accessible:
+                    topic_data["video_url"] = topic.video_url
+                modules[variant].append(topic_data)
+
+        for variant, topics in modules.items():
+            trees[variant].append({
+                "id": syllabus.id,
+                "module_title": syllabus.module_title,
+                "topics_count": len(topics),
+                "topics": topics
+            })
+
+    return {
+        variant: {
+            "total_modules": len(modules),
+            "total_topics": sum(len(module["topics"]) for module in modules),
+            "modules": modules
+        }
+        for variant, modules in trees.items()
+    }
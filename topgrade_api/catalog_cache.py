@@ -0,0 +1,214 @@
+"""
+Versioned caching for catalog responses.
+
+A single catalog version number lives in Django's cache and is bumped after
+any committed write that can change what a listing shows: programs,
+advanced programs, categories, syllabus content (searched) and enrollment
+counters. Cached snapshots record the version they were built from and are
+rebuilt when it moves; the time of the last bump is kept alongside it.
+
+With a per-process cache (LocMemCache, the default) the version lives in
+the single CatalogVersion row instead, so every worker sees the same
+version and only the snapshots themselves are per process. Each process
+rereads the row at most every CATALOG_VERSION_TTL seconds, so another
+worker's write can take that long to show up here.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    Program, AdvanceProgram, Category, Syllabus, Topic, AdvanceSyllabus, AdvanceTopic, CatalogVersion,
+    enrollment_changed
+)
+from .otp_store import PER_PROCESS_CACHES
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+LANDING_SNAPSHOT_KEY = 'catalog:landing'
+LANDING_LOCK_KEY = 'catalog:landing:rebuild'
+FACETS_KEY_PREFIX = 'catalog:facets'
+SYLLABUS_KEY_PREFIX = 'catalog:syllabus-tree'
+REBUILD_LOCK_TIMEOUT = 30  # seconds
+FACETS_TIMEOUT = 60 * 60  # seconds; entries of old versions just age out
+SYLLABUS_TIMEOUT = 24 * 60 * 60  # seconds
+
+
+def version_in_database():
+    """True when the cache isn't shared between processes, so the version can't live there"""
+    return settings.CACHES['default']['BACKEND'] in PER_PROCESS_CACHES
+
+
+# (monotonic time it expires, (version, modified)) of the CatalogVersion row
+_watermark_memo = None
+
+
+def _database_watermark():
+    global _watermark_memo
+    now = time.monotonic()
+    memo = _watermark_memo
+    if memo is not None and now < memo[0]:
+        return memo[1]
+
+    row = CatalogVersion.objects.filter(pk=1).values_list('version', 'modified_at').first()
+    if row is None:
+        # Also from the clock, so a recreated database never reuses a snapshot's version
+        created, _ = CatalogVersion.objects.get_or_create(
+            pk=1, defaults={'version': time.time_ns(), 'modified_at': timezone.now()}
+        )
+        row = (created.version, created.modified_at)
+    _watermark_memo = (now + getattr(settings, 'CATALOG_VERSION_TTL', 1), row)
+    return row
+
+
+def forget_database_watermark():
+    """Make the next lookup read the CatalogVersion row"""
+    global _watermark_memo
+    _watermark_memo = None
+
+
+def _initial_version():
+    # Start from the clock so a reset cache never reuses an old version number
+    cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+    return cache.get(CATALOG_VERSION_KEY)
+
+
+def get_catalog_version():
+    """Current catalog version"""
+    if version_in_database():
+        return _database_watermark()[0]
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = _initial_version()
+    return version
+
+
+def get_catalog_modified():
+    """When the catalog version last moved"""
+    if version_in_database():
+        return _database_watermark()[1]
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        # Unknown after a cache reset, so claim now and let clients refetch once
+        cache.add(CATALOG_MODIFIED_KEY, timezone.now(), timeout=None)
+        modified = cache.get(CATALOG_MODIFIED_KEY)
+    return modified
+
+
+def get_catalog_watermark():
+    """(version, modified) with a single lookup where the version lives in the database"""
+    if version_in_database():
+        return _database_watermark()
+    return get_catalog_version(), get_catalog_modified()
+
+
+def bump_catalog_version():
+    """Invalidate every snapshot built from the current version"""
+    if version_in_database():
+        updated = CatalogVersion.objects.filter(pk=1).update(
+            version=models.F('version') + 1, modified_at=timezone.now()
+        )
+        # This process sees its own writes straight away
+        forget_database_watermark()
+        if not updated:
+            # Creates the row
+            _database_watermark()
+        return get_catalog_version()
+    try:
+        version = cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        _initial_version()
+        version = cache.incr(CATALOG_VERSION_KEY)
+    cache.set(CATALOG_MODIFIED_KEY, timezone.now(), timeout=None)
+    return version
+
+
+def get_landing_snapshot(build):
+    """
+    Return the landing sections for the current catalog version.
+
+    The version and snapshot are fetched in one cache round trip. When the
+    snapshot is stale, the request that takes the rebuild lock rebuilds it
+    while concurrent requests keep serving the stale copy. Only a cold cache
+    makes every request build.
+    """
+    if version_in_database():
+        version = get_catalog_version()
+        snapshot = cache.get(LANDING_SNAPSHOT_KEY)
+    else:
+        values = cache.get_many([CATALOG_VERSION_KEY, LANDING_SNAPSHOT_KEY])
+        version = values.get(CATALOG_VERSION_KEY)
+        if version is None:
+            version = _initial_version()
+        snapshot = values.get(LANDING_SNAPSHOT_KEY)
+
+    if snapshot is not None and snapshot['version'] == version:
+        return snapshot['data']
+
+    has_lock = cache.add(LANDING_LOCK_KEY, version, timeout=REBUILD_LOCK_TIMEOUT)
+    if not has_lock and snapshot is not None:
+        # Someone else is rebuilding; stale data beats a stampede
+        return snapshot['data']
+
+    try:
+        data = build()
+        if has_lock:
+            cache.set(LANDING_SNAPSHOT_KEY, {'version': version, 'data': data}, timeout=None)
+    finally:
+        if has_lock:
+            cache.delete(LANDING_LOCK_KEY)
+    return data
+
+
+def get_facets(filters, build):
+    """
+    Return build(**filters), cached per catalog version and filter set.
+    `filters` must already be normalized (see the /programs/facets view)
+    so that equivalent requests share one entry.
+    """
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    key = f'{FACETS_KEY_PREFIX}:{get_catalog_version()}:{digest}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = build(**filters)
+        cache.set(key, facets, timeout=FACETS_TIMEOUT)
+    return facets
+
+
+def get_syllabus_tree(program, program_type, unlocked, build):
+    """
+    Return the syllabus tree of `program` for one entitlement.
+
+    Entries are keyed by the program's updated_at, which syllabus and topic
+    writes move (see conditional) but enrollments don't, so an edit makes
+    the old entry unreachable instead of racing to delete it. `build(program, program_type)`
+    returns both variants on a miss.
+    """
+    key = f'{SYLLABUS_KEY_PREFIX}:{program_type}:{program.pk}:{program.updated_at.timestamp()}'
+    trees = cache.get(key)
+    if trees is None:
+        trees = build(program, program_type)
+        cache.set(key, trees, timeout=SYLLABUS_TIMEOUT)
+    return trees["unlocked" if unlocked else "locked"]
+
+
+@receiver([post_save, post_delete], sender=Program)
+@receiver([post_save, post_delete], sender=AdvanceProgram)
+@receiver([post_save, post_delete], sender=Category)
+# Search results match on syllabus module and topic titles
+@receiver([post_save, post_delete], sender=Syllabus)
+@receiver([post_save, post_delete], sender=Topic)
+@receiver([post_save, post_delete], sender=AdvanceSyllabus)
+@receiver([post_save, post_delete], sender=AdvanceTopic)
+@receiver(enrollment_changed)
+def invalidate_catalog(sender, **kwargs):
+    # Bumping after commit means a rebuild can never snapshot uncommitted
+    # data under the new version
+    transaction.on_commit(bump_catalog_version)
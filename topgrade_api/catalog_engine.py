@@ -0,0 +1,268 @@
+"""
+Optional columnar catalog for /programs/filter, /landing and /bookmarks.
+
+The catalog is small next to its read traffic, so it can be held as NumPy
+column arrays plus pre-serialized cards, and filters and sorts answered
+with vectorized masks and lexsort instead of a database round trip. With
+CATALOG_ENGINE = 'memory' each worker keeps its own copy; with 'shared'
+every worker on a host maps one snapshot file (see catalog_snapshot). Both
+need NumPy, an optional dependency (`pip install numpy`); selecting either
+without it raises ImproperlyConfigured. The default 'orm' needs neither.
+
+The loaded catalog is tagged with the catalog version from catalog_cache
+and is swapped for a freshly built one when that version moves.
+"""
+import threading
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .catalog import PROGRAM_TYPE_RANK, CatalogQuery, encode_cursor, serialize_catalog_row
+from .catalog_cache import get_catalog_version
+from .models import Category
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional
+    np = None
+
+
+# Decimal sort columns are held as floats; cursors quantize them back to the model precision
+DECIMAL_QUANTUM = {
+    'price': Decimal('0.01'),
+    'discounted_price': Decimal('0.01'),
+    'program_rating': Decimal('0.1'),
+}
+
+LANDING_RATING_SORT = [('program_rating', True), ('id', True)]
+LANDING_LIMITS = {'program': 3, 'advanced_program': 2}
+
+
+def build_columns(rows):
+    """Column arrays for CatalogQuery rows in (type_rank, id) order"""
+    def column(field, dtype):
+        return np.array([row[field] for row in rows], dtype=dtype)
+
+    columns = {
+        'id': column('id', np.int64),
+        'type_rank': column('type_rank', np.int64),
+        'title': np.array([row['title'] for row in rows], dtype=str),
+        'price': column('price', np.float64),
+        'discounted_price': column('discounted_price', np.float64),
+        'program_rating': column('program_rating', np.float64),
+        'is_best_seller': column('is_best_seller', bool),
+        'enrolled_students': column('enrolled_students', np.int64),
+        'available_slots': column('available_slots', np.int64),
+        'category_id': np.array(
+            [-1 if row['category_pk'] is None else row['category_pk'] for row in rows], dtype=np.int64
+        ),
+    }
+    # lexsort needs numeric keys; titles sort by their rank among unique titles
+    columns['title_rank'] = np.unique(columns['title'], return_inverse=True)[1].reshape(-1).astype(np.int64)
+    # Rows are ordered by (type_rank, id), so this key is sorted and searchable
+    columns['key'] = (columns['type_rank'] << 40) | columns['id']
+    return columns
+
+
+class ColumnarCatalog:
+    """
+    Filters, sorts and pages over the column arrays of one catalog version.
+    Subclasses decide where the columns and serialized cards live.
+    """
+
+    def __init__(self, columns, category_ids, version):
+        self.version = version
+        self.columns = columns
+        self.category_ids = frozenset(category_ids)
+        self.size = len(columns['id'])
+
+    def card(self, index):
+        """Serialized card for the row at `index`"""
+        raise NotImplementedError
+
+    def program_card(self, program_type, program_id):
+        """Card for one program, or None if it is not in this catalog version"""
+        key = (PROGRAM_TYPE_RANK[program_type] << 40) | int(program_id)
+        index = int(np.searchsorted(self.columns['key'], key))
+        if index < self.size and self.columns['key'][index] == key:
+            return self.card(index)
+        return None
+
+    def _sort_column(self, field, descending):
+        if field == 'title':
+            field = 'title_rank'
+        values = self.columns[field]
+        if values.dtype == bool:
+            values = values.astype(np.int64)
+        return -values if descending else values
+
+    def _cursor_value(self, field, value):
+        if field == 'title':
+            return str(value)
+        if isinstance(value, Decimal):
+            return float(value)
+        return value
+
+    def _row_values(self, index, sort_keys):
+        """Sort values of one row, typed like the ORM returns them"""
+        values = []
+        for field, _ in sort_keys:
+            value = self.columns[field][index].item()
+            if field in DECIMAL_QUANTUM:
+                value = Decimal(repr(value)).quantize(DECIMAL_QUANTUM[field])
+            values.append(value)
+        return values
+
+    def _after(self, sort_keys, cursor_values):
+        """Mask of rows strictly after the cursor in sort order"""
+        after = np.zeros(self.size, dtype=bool)
+        equal = np.ones(self.size, dtype=bool)
+        for (field, descending), value in zip(sort_keys, cursor_values):
+            column = self.columns[field]
+            value = self._cursor_value(field, value)
+            after |= equal & ((column < value) if descending else (column > value))
+            equal &= column == value
+        return after
+
+    def _ordered(self, mask, sort_keys):
+        """Indexes of the rows in `mask`, in sort order"""
+        matches = np.flatnonzero(mask)
+        # lexsort treats its last key as the primary one
+        keys = [self._sort_column(field, descending)[matches] for field, descending in reversed(sort_keys)]
+        return matches[np.lexsort(keys)] if len(matches) else matches
+
+    def _mask(self, program_types, category_id=None, is_best_seller=None, min_price=None, max_price=None,
+              min_rating=None):
+        columns = self.columns
+        type_rank = columns['type_rank']
+
+        mask = np.isin(type_rank, [PROGRAM_TYPE_RANK[program_type] for program_type in program_types])
+        if category_id is not None and int(category_id) in self.category_ids:
+            # Only regular programs have categories
+            mask &= (type_rank != PROGRAM_TYPE_RANK['program']) | (columns['category_id'] == int(category_id))
+        if is_best_seller is not None:
+            mask &= columns['is_best_seller'] == is_best_seller
+        if min_price is not None:
+            mask &= columns['price'] >= min_price
+        if max_price is not None:
+            mask &= columns['price'] <= max_price
+        if min_rating is not None:
+            mask &= columns['program_rating'] >= min_rating
+        return mask
+
+    def list_programs(self, program_types, sort_keys, category_id=None, cursor_values=None, limit=20,
+                      **filters):
+        """Same contract as catalog.list_programs, minus full-text search"""
+        type_rank = self.columns['type_rank']
+        mask = self._mask(program_types, category_id=category_id, **filters)
+
+        counts = {
+            program_type: int(np.count_nonzero(mask & (type_rank == PROGRAM_TYPE_RANK[program_type])))
+            for program_type in program_types
+        }
+
+        if cursor_values is not None:
+            mask &= self._after(sort_keys, cursor_values)
+
+        selected = self._ordered(mask, sort_keys)[:limit + 1].tolist()
+        page = selected[:limit]
+
+        next_cursor = None
+        if len(selected) > limit:
+            next_cursor = encode_cursor(sort_keys, self._row_values(page[-1], sort_keys))
+        return counts, [self.card(index) for index in page], next_cursor
+
+    def _section(self, sort_keys, limits, **filters):
+        indexes = []
+        for program_type, limit in limits.items():
+            indexes.extend(self._ordered(self._mask([program_type], **filters), sort_keys)[:limit].tolist())
+        return [self.card(index) for index in indexes]
+
+    def landing_sections(self):
+        """Same sections as catalog.build_landing_sections"""
+        return {
+            "top_course": self._section(LANDING_RATING_SORT, LANDING_LIMITS, min_rating=4.0),
+            "recently_added": self._section([('id', True)], LANDING_LIMITS),
+            "featured": self._section(LANDING_RATING_SORT, LANDING_LIMITS, is_best_seller=True),
+            "programs": self._section(LANDING_RATING_SORT, {'program': 5}),
+            "advanced_programs": self._section(LANDING_RATING_SORT, {'advanced_program': 5}),
+        }
+
+
+class MemoryCatalog(ColumnarCatalog):
+    """
+    Catalog held in this process: column arrays plus a list of card dicts
+    """
+
+    def __init__(self, rows, category_ids, version):
+        super().__init__(build_columns(rows), category_ids, version)
+        self.cards = [serialize_catalog_row(row) for row in rows]
+
+    @classmethod
+    def load(cls, version):
+        return cls(CatalogQuery().rows(), Category.objects.values_list('id', flat=True), version)
+
+    def card(self, index):
+        return self.cards[index]
+
+
+class CatalogEngine:
+    """
+    Holds the current catalog and reloads it when the catalog version moves
+    """
+    catalog_class = MemoryCatalog
+
+    def __init__(self):
+        self._catalog = None
+        self._lock = threading.Lock()
+
+    def load(self, version):
+        return self.catalog_class.load(version)
+
+    def current(self):
+        version = get_catalog_version()
+        catalog = self._catalog
+        if catalog is not None and catalog.version == version:
+            return catalog
+
+        # Only one thread reloads; the rest keep using the previous catalog if there is one
+        if self._lock.acquire(blocking=catalog is None):
+            try:
+                if self._catalog is None or self._catalog.version != version:
+                    self._catalog = self.load(version)
+            finally:
+                self._lock.release()
+        return self._catalog
+
+    def list_programs(self, **listing):
+        return self.current().list_programs(**listing)
+
+    def landing_sections(self):
+        return self.current().landing_sections()
+
+
+_engine = None
+
+
+def get_catalog_engine():
+    """
+    Return the engine selected by CATALOG_ENGINE ('memory' or 'shared'),
+    or None when listings should go to the database
+    """
+    global _engine
+    engine_name = getattr(settings, 'CATALOG_ENGINE', 'orm')
+    if engine_name not in ('memory', 'shared'):
+        return None
+    if np is None:
+        raise ImproperlyConfigured(
+            f"CATALOG_ENGINE = '{engine_name}' requires NumPy: install it with `pip install numpy` "
+            "or set CATALOG_ENGINE = 'orm'"
+        )
+    if _engine is None:
+        if engine_name == 'shared':
+            from .catalog_snapshot import SharedCatalogEngine
+            _engine = SharedCatalogEngine()
+        else:
+            _engine = CatalogEngine()
+    return _engine
@@ -0,0 +1,168 @@
+"""
+Host-wide catalog snapshot shared by every worker process.
+
+With CATALOG_ENGINE = 'shared', the catalog columns and the JSON-encoded
+program cards are written once into a snapshot file, and each worker maps
+that file read-only. Column arrays are NumPy views straight onto the
+mapping and a card is decoded from its byte range only when a response
+needs it, so adding workers does not add copies of the catalog.
+
+File layout (all offsets relative to the end of the padded header):
+
+    MAGIC | header length (uint64) | JSON header | columns ... | card blobs
+
+The header records the catalog version, the category ids and, for each
+column, its dtype, offset and length. `card_offsets` is an ordinary column
+holding count + 1 boundaries into the blob area.
+
+A new version is written to a temporary file and renamed over the old one,
+so readers always see a complete snapshot; mappings of the replaced file
+stay valid until their last reader drops them.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from django.conf import settings
+
+from .catalog import CatalogQuery, serialize_catalog_row
+from .catalog_engine import CatalogEngine, ColumnarCatalog, build_columns, np
+from .models import Category
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no advisory locks on Windows
+    fcntl = None
+
+MAGIC = b'TGCATLG1'
+HEADER_LENGTH = struct.Struct('<Q')
+ALIGNMENT = 64
+
+
+def get_snapshot_path():
+    return str(getattr(
+        settings, 'CATALOG_SNAPSHOT_PATH', os.path.join(tempfile.gettempdir(), 'topgrade-catalog.snapshot')
+    ))
+
+
+def _padding(size):
+    return -size % ALIGNMENT
+
+
+def write_snapshot(path, version):
+    """Build the snapshot for `version` from the database and atomically replace `path`"""
+    rows = CatalogQuery().rows()
+    columns = build_columns(rows)
+    blobs = [json.dumps(serialize_catalog_row(row), separators=(',', ':')).encode() for row in rows]
+    columns['card_offsets'] = np.cumsum([0] + [len(blob) for blob in blobs], dtype=np.int64)
+
+    layout = {}
+    position = 0
+    for name, array in columns.items():
+        array = np.ascontiguousarray(array)
+        columns[name] = array
+        layout[name] = {'dtype': array.dtype.str, 'offset': position, 'length': len(array)}
+        position += array.nbytes + _padding(array.nbytes)
+
+    header = json.dumps({
+        'version': version,
+        'count': len(rows),
+        'category_ids': list(Category.objects.values_list('id', flat=True)),
+        'columns': layout,
+        'cards': position,
+    }).encode()
+    prefix = MAGIC + HEADER_LENGTH.pack(len(header)) + header
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.catalog-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as snapshot:
+            snapshot.write(prefix + b'\0' * _padding(len(prefix)))
+            for array in columns.values():
+                snapshot.write(array.tobytes())
+                snapshot.write(b'\0' * _padding(array.nbytes))
+            for blob in blobs:
+                snapshot.write(blob)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        # mkstemp creates the file private to this user; workers may run as another
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+class MappedCatalog(ColumnarCatalog):
+    """
+    Read-only view of a snapshot file
+    """
+
+    def __init__(self, buffer):
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a catalog snapshot")
+        start = len(MAGIC) + HEADER_LENGTH.size
+        (header_length,) = HEADER_LENGTH.unpack_from(buffer, len(MAGIC))
+        header = json.loads(buffer[start:start + header_length])
+
+        data_start = start + header_length
+        data_start += _padding(data_start)
+        columns = {
+            name: np.frombuffer(buffer, dtype=column['dtype'], count=column['length'],
+                                offset=data_start + column['offset'])
+            for name, column in header['columns'].items()
+        }
+        self._buffer = buffer
+        self._card_offsets = columns.pop('card_offsets')
+        self._cards_start = data_start + header['cards']
+        super().__init__(columns, header['category_ids'], header['version'])
+
+    @classmethod
+    def open(cls, path):
+        """Map `path`, or return None if there is no snapshot yet"""
+        try:
+            with open(path, 'rb') as snapshot:
+                buffer = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        return cls(buffer)
+
+    def card(self, index):
+        start = self._cards_start + int(self._card_offsets[index])
+        end = self._cards_start + int(self._card_offsets[index + 1])
+        return json.loads(self._buffer[start:end])
+
+
+class SharedCatalogEngine(CatalogEngine):
+    """
+    CatalogEngine backed by the host-wide snapshot file.
+
+    The first worker to notice a new catalog version rewrites the snapshot
+    under an advisory lock; the others keep serving the previous mapping
+    until the new file is in place. Workers agree on the version even with
+    a per-process cache, as it then comes from the database.
+    """
+
+    def load(self, version):
+        path = get_snapshot_path()
+        catalog = MappedCatalog.open(path)
+        if catalog is not None and catalog.version == version:
+            return catalog
+
+        with open(path + '.lock', 'a') as lock:
+            if fcntl is not None:
+                try:
+                    # Wait only when there is nothing to serve in the meantime
+                    fcntl.flock(lock, fcntl.LOCK_EX if catalog is None else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return catalog
+
+            # Another worker may have written it while we waited for the lock
+            fresh = MappedCatalog.open(path)
+            if fresh is None or fresh.version != version:
+                write_snapshot(path, version)
+                fresh = MappedCatalog.open(path)
+            return fresh
@@ -0,0 +1,155 @@
+"""
+Conditional GET support for the catalog endpoints.
+
+Validators are computed from cheap watermarks, never from the response
+body: catalog-wide endpoints use the catalog version and the time it last
+moved (catalog_cache), and program details use the program's updated_at
+together with the catalog version, which carries its enrollment count.
+Both are the same in every worker, so any of them can answer a 304.
+Wrap an operation with `decorate_view(catalog_condition)` or
+`decorate_view(program_condition)` so a matching If-None-Match or
+If-Modified-Since is answered with 304 before the view runs.
+
+The receivers below keep Program.updated_at / AdvanceProgram.updated_at
+moving when the program's content (its category or syllabus) changes
+elsewhere; enrollments only move the catalog version, so they don't
+invalidate the syllabus trees cached by updated_at.
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .catalog_cache import get_catalog_watermark
+from .models import Program, AdvanceProgram, Category, Syllabus, Topic, AdvanceSyllabus, AdvanceTopic
+
+DETAILS_MODELS = {
+    'program': Program,
+    'advanced-program': AdvanceProgram,
+}
+
+
+def _catalog_watermark(request):
+    # condition() asks for the ETag and Last-Modified separately; look them up once
+    if not hasattr(request, '_catalog_watermark'):
+        request._catalog_watermark = get_catalog_watermark()
+    return request._catalog_watermark
+
+
+def catalog_etag(request, *args, **kwargs):
+    # ETags are per URL, so the query string needn't be part of it
+    return f'"catalog-{_catalog_watermark(request)[0]}"'
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return _catalog_watermark(request)[1]
+
+
+def _program_updated_at(request, program_type, program_id):
+    # condition() asks for the ETag and Last-Modified separately; look it up once
+    if not hasattr(request, '_program_updated_at'):
+        model = DETAILS_MODELS.get(program_type)
+        request._program_updated_at = None if model is None else (
+            model.objects.filter(pk=program_id).values_list('updated_at', flat=True).first()
+        )
+    return request._program_updated_at
+
+
+def program_etag(request, program_type, program_id, **kwargs):
+    updated_at = _program_updated_at(request, program_type, program_id)
+    if updated_at is None:
+        return None
+    version = _catalog_watermark(request)[0]
+    return f'"{program_type}-{program_id}-{int(updated_at.timestamp() * 1000000)}-{version}"'
+
+
+def program_last_modified(request, program_type, program_id, **kwargs):
+    updated_at = _program_updated_at(request, program_type, program_id)
+    if updated_at is None:
+        return None
+    return max(updated_at, _catalog_watermark(request)[1])
+
+
+def _strip_error_validators(response):
+    if response.status_code >= 400:
+        del response['ETag']
+        del response['Last-Modified']
+    return response
+
+
+def _precomputed_etag(request, *args, **kwargs):
+    return request._validators[0]
+
+
+def _precomputed_last_modified(request, *args, **kwargs):
+    return request._validators[1]
+
+
+def conditional(etag_func, last_modified_func):
+    """
+    condition() that keeps validators off error responses, so a client
+    can't revalidate its way into keeping an error body. Works on sync and
+    async views alike.
+    """
+    def wrap(view):
+        if iscoroutinefunction(view):
+            # condition() calls the validator functions synchronously, and they
+            # may query the database; compute them off the event loop first
+            conditional_view = condition(
+                etag_func=_precomputed_etag, last_modified_func=_precomputed_last_modified
+            )(view)
+
+            def validators(request, *args, **kwargs):
+                return etag_func(request, *args, **kwargs), last_modified_func(request, *args, **kwargs)
+            avalidators = sync_to_async(validators)
+
+            @wraps(view)
+            async def ainner(request, *args, **kwargs):
+                request._validators = await avalidators(request, *args, **kwargs)
+                return _strip_error_validators(await conditional_view(request, *args, **kwargs))
+            return ainner
+
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            return _strip_error_validators(conditional_view(request, *args, **kwargs))
+        return inner
+    return wrap
+
+
+catalog_condition = conditional(catalog_etag, catalog_last_modified)
+program_condition = conditional(program_etag, program_last_modified)
+
+
+def touch_programs(model, **lookup):
+    model.objects.filter(**lookup).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Category)
+def touch_category_programs(sender, instance, **kwargs):
+    # Details embed the category name
+    touch_programs(Program, category_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Syllabus)
+def touch_syllabus_program(sender, instance, **kwargs):
+    touch_programs(Program, pk=instance.program_id)
+
+
+@receiver([post_save, post_delete], sender=Topic)
+def touch_topic_program(sender, instance, **kwargs):
+    touch_programs(Program, syllabuses__pk=instance.syllabus_id)
+
+
+@receiver([post_save, post_delete], sender=AdvanceSyllabus)
+def touch_advance_syllabus_program(sender, instance, **kwargs):
+    touch_programs(AdvanceProgram, pk=instance.advance_program_id)
+
+
+@receiver([post_save, post_delete], sender=AdvanceTopic)
+def touch_advance_topic_program(sender, instance, **kwargs):
+    touch_programs(AdvanceProgram, syllabuses__pk=instance.advance_syllabus_id)
@@ -0,0 +1,206 @@
+"""
+Bounded pool for password hashing.
+
+PBKDF2 is slow on purpose, and a burst of sign-ins or sign-ups hashing
+inline can pin every request worker. Hashing is handed to a small thread
+pool instead: hashlib releases the GIL while it iterates, so the threads
+hash in parallel, and never more than PASSWORD_HASH_WORKERS at once. Up to
+PASSWORD_HASH_QUEUE_SIZE more requests may wait for a thread; anything
+beyond that, or anything that waits longer than PASSWORD_HASH_TIMEOUT
+seconds, gets PasswordHashPoolBusy straight away, which the endpoints turn
+into a 503 with a Retry-After header.
+
+Passwords checked through verify_user_password() are re-hashed and saved
+when the hasher or its parameters (e.g. the PBKDF2 iteration count) have
+changed since they were stored.
+
+get_hash_pool().stats() reports the queue depth and running totals; they
+are logged as a warning, at most every PASSWORD_HASH_STATS_LOG_INTERVAL
+seconds, while the pool turns requests away.
+"""
+import logging
+import os
+import threading
+import time
+
+import django
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHashPoolBusy(Exception):
+    """Raised when a hashing job can't be admitted or doesn't start in time"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PasswordHashPool:
+    """
+    ThreadPoolExecutor with admission control: at most `workers` running
+    jobs plus `queue_size` waiting ones
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        # Also run in forked children, whose copy of the pool has no threads
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._peak = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._logged_at = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            return self._executor
+
+    def _call(self, func, args):
+        with self._lock:
+            self._running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def _release(self, future=None):
+        with self._lock:
+            self._admitted -= 1
+        self._slots.release()
+
+    def run(self, func, *args):
+        """Run func(*args) on the pool and return its result"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            self._log_stats()
+            raise PasswordHashPoolBusy("Password hashing queue is full")
+        with self._lock:
+            self._admitted += 1
+            self._peak = max(self._peak, self._admitted)
+
+        try:
+            future = self._get_executor().submit(self._call, func, args)
+        except BaseException:
+            self._release()
+            raise
+        # Fires on completion and on cancellation alike
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # A job that already started finishes in the background
+            future.cancel()
+            with self._lock:
+                self._timed_out += 1
+            self._log_stats()
+            raise PasswordHashPoolBusy("Password hashing took too long")
+
+    def _log_stats(self):
+        interval = getattr(settings, 'PASSWORD_HASH_STATS_LOG_INTERVAL', 60)
+        now = time.monotonic()
+        with self._lock:
+            if self._logged_at is not None and now - self._logged_at < interval:
+                return
+            self._logged_at = now
+        logger.warning("Password hashing pool is shedding load: %s", self.stats())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'running': self._running,
+                'queued': self._admitted - self._running,
+                'peak_depth': self._peak,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+                _pool = PasswordHashPool(
+                    workers=workers,
+                    queue_size=getattr(settings, 'PASSWORD_HASH_QUEUE_SIZE', None) or workers * 4,
+                    timeout=getattr(settings, 'PASSWORD_HASH_TIMEOUT', 5),
+                )
+    return _pool
+
+
+def _reset_pool_after_fork():
+    if _pool is not None:
+        _pool._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def _verify(password, encoded):
+    is_correct, must_update = verify_password(password, encoded)
+    if is_correct and must_update:
+        return True, make_password(password)
+    return is_correct, None
+
+
+def verify_user_password(user, password):
+    """
+    Check `password` for `user` on the pool, saving a re-hashed password
+    when the stored one is out of date. With no user, a hash still runs so
+    unknown emails take as long as wrong passwords.
+    """
+    if user is None:
+        get_hash_pool().run(make_password, password)
+        return False
+    is_correct, new_encoded = get_hash_pool().run(_verify, password, user.password)
+    if new_encoded is not None:
+        user.password = new_encoded
+        user.save(update_fields=['password'])
+    return is_correct
+
+
+def hash_password(password):
+    """make_password() on the pool"""
+    return get_hash_pool().run(make_password, password)
+
+
+def setup_hashing_process():
+    """
+    Initializer of ProcessPoolExecutors running hash_passwords(); this module
+    imports no models, so spawned workers can load it before Django is set up
+    """
+    django.setup()
+
+
+def hash_passwords(passwords):
+    """Runs in the worker processes; a None password becomes an unusable one"""
+    return [make_password(password) for password in passwords]
@@ -0,0 +1,226 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+from topgrade_api.models import CustomUser, Program, UserBookmark
+
+BENCH_EMAIL = 'bench-asgi@example.invalid'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(len(values) * fraction) - 1, 0)] if values else 0.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def read_response(reader):
+    """Status and whether the connection may be reused, after draining the body"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif status not in (204, 304):
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/s and latency of the read-heavy endpoints under uvicorn (ASGI) "
+        "and a WSGI server, over keep-alive connections"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--asgi-url', help="Benchmark this running ASGI deployment instead of starting uvicorn")
+        parser.add_argument('--wsgi-url', help="Benchmark this running WSGI deployment instead of starting one")
+        parser.add_argument('--workers', type=int, default=1, help="Worker processes of each started server")
+        parser.add_argument('--threads', type=int, default=8, help="Threads per gunicorn worker")
+        parser.add_argument('--concurrency', type=int, default=32, help="Open connections")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per server")
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help="Path to request, repeatable; defaults to landing, filter, details and bookmarks",
+        )
+        parser.add_argument(
+            '--allow-writes', action='store_true',
+            help=f"Confirm that a throwaway user ({BENCH_EMAIL}) and its bookmarks may be created in the "
+                 "configured database; they are deleted when the benchmark ends",
+        )
+
+    def handle(self, *args, **options):
+        # The servers run in their own processes against the configured database, so the
+        # benchmark user has to live there too
+        if not options['allow_writes']:
+            raise CommandError(
+                f"bench_asgi creates {BENCH_EMAIL} and its bookmarks in the database "
+                f"{settings.DATABASES['default']['NAME']} for the authenticated endpoints; "
+                "pass --allow-writes to proceed"
+            )
+
+        targets = [
+            ('asgi', options['asgi_url'], self.asgi_command),
+            ('wsgi', options['wsgi_url'], self.wsgi_command),
+        ]
+        try:
+            CustomUser.objects.filter(email=BENCH_EMAIL).delete()
+            user = CustomUser.objects.create_user(email=BENCH_EMAIL, password=None, fullname="ASGI Benchmark")
+            programs = list(Program.objects.order_by('id')[:5])
+            UserBookmark.objects.bulk_create(
+                UserBookmark(user=user, program=program, program_type='program') for program in programs
+            )
+            token = str(RefreshToken.for_user(user).access_token)
+
+            paths = options['paths'] or [
+                '/api/landing',
+                '/api/programs/filter?limit=20',
+                *[f'/api/program/program/{program.id}/details' for program in programs[:2]],
+                '/api/bookmarks',
+            ]
+            for name, url, command in targets:
+                server = None
+                if url is None:
+                    port = free_port()
+                    label, argv = command(port, options)
+                    server = self.start_server(argv, port)
+                    url = f'http://127.0.0.1:{port}'
+                else:
+                    label = url
+                try:
+                    self.run_server(f'{name} ({label})', url, paths, token, options)
+                finally:
+                    if server is not None:
+                        server.terminate()
+                        server.wait()
+        finally:
+            # Takes the bookmarks with it
+            CustomUser.objects.filter(email=BENCH_EMAIL).delete()
+
+    def asgi_command(self, port, options):
+        argv = [
+            sys.executable, '-m', 'uvicorn', 'topgrade.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+        ]
+        return f"uvicorn, {options['workers']} workers", argv
+
+    def wsgi_command(self, port, options):
+        if importlib.util.find_spec('gunicorn') is None:
+            # Threaded like gunicorn's gthread workers, but a single process
+            return "runserver, install gunicorn for a production WSGI server", [
+                sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload',
+            ]
+        argv = [
+            sys.executable, '-m', 'gunicorn', 'topgrade.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+            '--threads', str(options['threads']), '--log-level', 'warning',
+        ]
+        return f"gunicorn, {options['workers']} workers x {options['threads']} threads", argv
+
+    def start_server(self, argv, port):
+        server = subprocess.Popen(
+            argv, cwd=settings.BASE_DIR, env=os.environ.copy(),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"{argv[2]} exited with status {server.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"{argv[2]} did not start listening on port {port}")
+
+    def run_server(self, name, url, paths, token, options):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        requests = [
+            (
+                path,
+                (
+                    f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+                    f'Authorization: Bearer {token}\r\nConnection: keep-alive\r\n\r\n'
+                ).encode(),
+            )
+            for path in paths
+        ]
+        latencies = {path: [] for path in paths}
+        statuses = Counter()
+
+        async def connection_loop(remaining):
+            reader = writer = None
+            try:
+                while remaining:
+                    remaining.pop()
+                    path, payload = requests[len(remaining) % len(requests)]
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(host, port)
+                    started = time.perf_counter()
+                    writer.write(payload)
+                    status, keep_alive = await read_response(reader)
+                    latencies[path].append((time.perf_counter() - started) * 1000)
+                    statuses[status] += 1
+                    if not keep_alive:
+                        writer.close()
+                        reader = writer = None
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        async def run(total):
+            remaining = list(range(total))
+            await asyncio.gather(*(connection_loop(remaining) for _ in range(options['concurrency'])))
+
+        # Warm up caches, snapshots and connections before measuring
+        asyncio.run(run(len(requests) * options['concurrency']))
+        for values in latencies.values():
+            values.clear()
+        statuses.clear()
+
+        started = time.perf_counter()
+        asyncio.run(run(options['requests']))
+        elapsed = time.perf_counter() - started
+
+        everything = [latency for values in latencies.values() for latency in values]
+        self.stdout.write(
+            f"{name}: {len(everything) / elapsed:.1f} req/s  p50 {statistics.median(everything):.1f} ms  "
+            f"p99 {percentile(everything, 0.99):.1f} ms  statuses {dict(sorted(statuses.items()))}"
+        )
+        for path, values in latencies.items():
+            self.stdout.write(
+                f"  {path:<40} p50 {statistics.median(values):.1f} ms  p99 {percentile(values, 0.99):.1f} ms"
+            )
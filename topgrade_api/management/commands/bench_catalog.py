@@ -0,0 +1,69 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from topgrade_api.catalog import get_sort_keys, list_programs
+from topgrade_api.catalog_engine import MemoryCatalog, np
+from topgrade_api.catalog_snapshot import MappedCatalog, write_snapshot
+
+SCENARIOS = [
+    ("default listing", {}, 'most_relevant', 'asc'),
+    ("best sellers by price", {'is_best_seller': True}, 'price', 'asc'),
+    ("price band by discount", {'min_price': 1000, 'max_price': 50000}, 'discounted_price', 'desc'),
+    ("top rated", {'min_rating': 4.0}, 'top_rated', 'asc'),
+    ("recently added", {}, 'recently_added', 'asc'),
+    ("by title", {}, 'title', 'asc'),
+]
+
+
+class Command(BaseCommand):
+    help = "Compare /programs/filter listing latency between the ORM path and the in-memory engine"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--engine', choices=['memory', 'shared'], default='memory')
+        parser.add_argument('--snapshot', default='bench-catalog.snapshot',
+                            help="Scratch snapshot file for --engine shared")
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("NumPy is required for the in-memory catalog engine: pip install numpy")
+
+        iterations = options['iterations']
+        limit = options['limit']
+
+        started = time.perf_counter()
+        if options['engine'] == 'shared':
+            write_snapshot(options['snapshot'], version=0)
+            catalog = MappedCatalog.open(options['snapshot'])
+        else:
+            catalog = MemoryCatalog.load(version=0)
+        load_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f"Loaded {catalog.size} programs into the {options['engine']} engine in {load_ms:.1f} ms")
+
+        self.stdout.write(f"{'scenario':<26}{'orm mean':>12}{'orm p95':>12}{'mem mean':>12}{'mem p95':>12}{'speedup':>10}")
+        for name, filters, sort_by, sort_order in SCENARIOS:
+            listing = {
+                'program_types': ['program', 'advanced_program'],
+                'sort_keys': get_sort_keys(sort_by, sort_order),
+                'limit': limit,
+                **filters,
+            }
+            orm = self.measure(lambda: list_programs(**listing), iterations)
+            memory = self.measure(lambda: catalog.list_programs(**listing), iterations)
+            self.stdout.write(
+                f"{name:<26}{orm[0]:>10.3f}ms{orm[1]:>10.3f}ms{memory[0]:>10.3f}ms{memory[1]:>10.3f}ms"
+                f"{orm[0] / memory[0]:>9.1f}x"
+            )
+
+    def measure(self, run, iterations):
+        """Mean and p95 latency in milliseconds"""
+        run()  # warm up
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.mean(timings), timings[int(len(timings) * 0.95) - 1]
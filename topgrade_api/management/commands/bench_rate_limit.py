@@ -0,0 +1,120 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from topgrade_api.models import CustomUser
+
+BENCH_PASSWORD = 'bench-rate-limit-password'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(len(values) * fraction) - 1, 0)] if values else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test /api/auth/signin: latency of legitimate clients alone and next to an abusive "
+        "client hammering from one address, and what rejecting that client costs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=4, help="Legitimate clients, one address each")
+        parser.add_argument('--signins', type=int, default=5, help="Sign-ins per legitimate client")
+        parser.add_argument('--pause', type=float, default=0.5, help="Seconds between a client's sign-ins")
+        parser.add_argument('--attack-rate', type=float, default=200, help="Abusive requests per second")
+        parser.add_argument(
+            '--ip-limit', type=int, help="Sign-ins per minute per address, instead of RATE_LIMITS['signin']"
+        )
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        emails = [f'bench-{run_id}-{number}@example.invalid' for number in range(options['clients'])]
+        for email in emails:
+            CustomUser.objects.create_user(email=email, password=BENCH_PASSWORD, fullname="Rate Limit Benchmark")
+
+        rate_limits = dict(getattr(settings, 'RATE_LIMITS', {}))
+        if options['ip_limit'] is not None:
+            rate_limits['signin'] = [('ip', options['ip_limit'], 60)]
+        try:
+            with override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS=rate_limits):
+                # Fresh addresses per phase, so the phases don't share buckets
+                baseline = self.run_phase(emails, options, '198.51.100', attack=False)
+                attacked = self.run_phase(emails, options, '203.0.113', attack=True)
+        finally:
+            CustomUser.objects.filter(email__in=emails).delete()
+
+        self.report("legitimate only", baseline)
+        self.report("under attack", attacked)
+        attacker = attacked['attacker']
+        rejected = attacker['rejected']
+        self.stdout.write(
+            f"attacker: {attacker['requests']} requests, {len(rejected)} rejected with 429; "
+            f"rejection p50 {statistics.median(rejected) if rejected else 0:.2f} ms, "
+            f"p99 {percentile(rejected, 0.99):.2f} ms"
+        )
+
+    def report(self, name, phase):
+        latencies = phase['latencies']
+        self.stdout.write(
+            f"{name:<16} {len(latencies)} sign-ins ({phase['failures']} failed): "
+            f"p50 {statistics.median(latencies) if latencies else 0:.1f} ms, p95 {percentile(latencies, 0.95):.1f} ms"
+        )
+
+    def run_phase(self, emails, options, network, attack):
+        latencies = []
+        failures = [0]
+        attacker = {'requests': 0, 'rejected': []}
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def legitimate(number, email):
+            client = Client(REMOTE_ADDR=f'{network}.{number + 1}')
+            body = {'email': email, 'password': BENCH_PASSWORD}
+            try:
+                for _ in range(options['signins']):
+                    started = time.perf_counter()
+                    response = client.post('/api/auth/signin', body, content_type='application/json')
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        if response.status_code == 200:
+                            latencies.append(elapsed)
+                        else:
+                            failures[0] += 1
+                    time.sleep(options['pause'])
+            finally:
+                connection.close()
+
+        def abusive():
+            client = Client(REMOTE_ADDR=f'{network}.250')
+            interval = 1 / options['attack_rate']
+            try:
+                while not done.wait(interval):
+                    # Guess passwords for another account from one address
+                    body = {'email': f'victim-{network}@example.invalid', 'password': uuid.uuid4().hex}
+                    started = time.perf_counter()
+                    response = client.post('/api/auth/signin', body, content_type='application/json')
+                    elapsed = (time.perf_counter() - started) * 1000
+                    attacker['requests'] += 1
+                    if response.status_code == 429:
+                        attacker['rejected'].append(elapsed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=legitimate, args=item) for item in enumerate(emails)]
+        attack_thread = threading.Thread(target=abusive) if attack else None
+        if attack_thread:
+            attack_thread.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        if attack_thread:
+            attack_thread.join()
+        return {'latencies': latencies, 'failures': failures[0], 'attacker': attacker}
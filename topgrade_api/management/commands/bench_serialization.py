@@ -0,0 +1,87 @@
+import itertools
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from ninja.renderers import JSONRenderer
+from django.db.models import Count
+from topgrade_api.catalog import CatalogQuery, serialize_catalog_row, serialize_syllabus_trees
+from topgrade_api.models import Program
+from topgrade_api.renderers import FastJSONRenderer, orjson
+from topgrade_api.schemas import ProgramDetailsResponseSchema, ProgramListResponseSchema
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of rendering 1,000 program cards, and the largest program's details, "
+        "with the default and fast JSON renderers and the response schemas"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000)
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        rows = CatalogQuery().rows()
+        if not rows:
+            raise CommandError("The catalog is empty; load some programs first")
+
+        cards = [serialize_catalog_row(row) for row in itertools.islice(itertools.cycle(rows), options['cards'])]
+        payload = {
+            "success": True,
+            "filters_applied": {"program_type": "all", "sort_by": "most_relevant", "sort_order": "asc"},
+            "statistics": {
+                "total_count": len(cards), "regular_programs_count": len(cards), "advanced_programs_count": 0
+            },
+            "pagination": {"limit": len(cards), "count": len(cards), "has_more": False, "next_cursor": None},
+            "programs": cards,
+        }
+        if orjson is None:
+            self.stdout.write("orjson is not installed; the fast renderer falls back to the default one")
+
+        default_renderer = JSONRenderer()
+        fast_renderer = FastJSONRenderer()
+
+        def validate():
+            return ProgramListResponseSchema.model_validate(payload).model_dump()
+
+        per_thousand = 1000 / len(cards)
+        results = [
+            ("default renderer", lambda: default_renderer.render(None, payload, response_status=200)),
+            ("fast renderer", lambda: fast_renderer.render(None, payload, response_status=200)),
+            ("response schema", validate),
+        ]
+        for name, run in results:
+            mean, p95 = self.measure(run, options['iterations'])
+            self.stdout.write(
+                f"{name:<20}{mean * per_thousand:>10.3f} ms / 1,000 cards (p95 {p95 * per_thousand:.3f} ms)"
+            )
+
+        # Program details, the largest payload, validated and rendered per request
+        program = Program.objects.annotate(topics=Count('syllabuses__topics')).order_by('-topics').first()
+        details = {
+            "success": True,
+            "program": cards[0],
+            "syllabus": serialize_syllabus_trees(program, 'program')["unlocked"],
+        }
+
+        def render_details():
+            data = ProgramDetailsResponseSchema.model_validate(details).model_dump(exclude_unset=True)
+            return fast_renderer.render(None, data, response_status=200)
+
+        mean, p95 = self.measure(render_details, options['iterations'])
+        self.stdout.write(
+            f"{'program details':<20}{mean:>10.3f} ms / response ({details['syllabus']['total_topics']} topics, "
+            f"p95 {p95:.3f} ms)"
+        )
+
+    def measure(self, run, iterations):
+        """Mean and p95 latency in milliseconds"""
+        run()  # warm up
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.mean(timings), timings[int(len(timings) * 0.95) - 1]
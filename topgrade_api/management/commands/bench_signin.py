@@ -0,0 +1,85 @@
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from topgrade_api import hashing
+from topgrade_api.models import CustomUser
+
+BENCH_EMAIL = 'bench-signin@example.invalid'
+BENCH_PASSWORD = 'bench-signin-password'
+
+
+class Command(BaseCommand):
+    help = "Measure /api/auth/signin throughput and latency at increasing concurrency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--requests', type=int, default=200, help="Sign-ins per concurrency level")
+        parser.add_argument('--workers', type=int, help="Override PASSWORD_HASH_WORKERS")
+        parser.add_argument('--queue-size', type=int, help="Override PASSWORD_HASH_QUEUE_SIZE")
+
+    def handle(self, *args, **options):
+        pool = hashing.get_hash_pool()
+        workers = options['workers'] or pool.workers
+        queue_size = options['queue_size'] if options['queue_size'] is not None else pool.queue_size
+        timeout = pool.timeout
+
+        CustomUser.objects.filter(email=BENCH_EMAIL).delete()
+        CustomUser.objects.create_user(email=BENCH_EMAIL, password=BENCH_PASSWORD, fullname="Signin Benchmark")
+        self.stdout.write(f"hashing pool: {workers} workers, queue of {queue_size}, {timeout}s timeout")
+        try:
+            for concurrency in options['concurrency']:
+                # A fresh pool per level, so its peak depth and totals are the level's own
+                pool = hashing._pool = hashing.PasswordHashPool(workers, queue_size, timeout)
+                self.run_level(pool, concurrency, options['requests'])
+        finally:
+            CustomUser.objects.filter(email=BENCH_EMAIL).delete()
+
+    def run_level(self, pool, concurrency, total):
+        remaining = iter(range(total))
+        remaining_lock = threading.Lock()
+        latencies = []
+        statuses = Counter()
+        results_lock = threading.Lock()
+
+        def client_loop():
+            client = Client()
+            body = {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}
+            try:
+                while True:
+                    with remaining_lock:
+                        if next(remaining, None) is None:
+                            return
+                    started = time.perf_counter()
+                    response = client.post('/api/auth/signin', body, content_type='application/json')
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with results_lock:
+                        statuses[response.status_code] += 1
+                        if response.status_code == 200:
+                            latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        stats = pool.stats()
+        latencies.sort()
+        line = f"concurrency {concurrency:>4}: {statuses[200] / elapsed:>8.1f} signins/s"
+        if latencies:
+            p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+            line += f"  p50 {statistics.median(latencies):.1f} ms  p95 {p95:.1f} ms"
+        line += (
+            f"  peak depth {stats['peak_depth']}  rejected {stats['rejected']}  timed out {stats['timed_out']}"
+            f"  statuses {dict(sorted(statuses.items()))}"
+        )
+        self.stdout.write(line)
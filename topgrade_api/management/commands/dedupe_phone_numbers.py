@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from topgrade_api.models import CustomUser
+
+CONSTRAINT_NAME = 'unique_user_phone_number'
+
+
+class Command(BaseCommand):
+    help = (
+        "Give every phone number to at most one user, then add the unique phone number "
+        "constraint to an existing database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report duplicated phone numbers without changing anything",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        with transaction.atomic():
+            blank = CustomUser.objects.filter(phone_number='')
+            blank_count = blank.count() if dry_run else blank.update(phone_number=None)
+
+            duplicated = (
+                CustomUser.objects.filter(phone_number__isnull=False)
+                .values_list('phone_number', flat=True)
+                .annotate(users=Count('id'))
+                .filter(users__gt=1)
+                .order_by()
+            )
+            released = []
+            for phone_number in duplicated:
+                # Keep the number on the account with the most purchases, the oldest on a tie
+                users = list(
+                    CustomUser.objects.filter(phone_number=phone_number)
+                    .annotate(purchase_count=Count('purchases'))
+                    .order_by('-purchase_count', 'id')
+                    .values_list('id', 'email')
+                )
+                keeper_id, keeper_email = users[0]
+                self.stdout.write(
+                    f"{phone_number}: keeping user #{keeper_id} ({keeper_email}), "
+                    f"clearing {', '.join(f'#{user_id}' for user_id, _ in users[1:])}"
+                )
+                released.extend(user_id for user_id, _ in users[1:])
+
+            if released and not dry_run:
+                CustomUser.objects.filter(pk__in=released).update(phone_number=None)
+
+        verb = "Would clear" if dry_run else "Cleared"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(released)} duplicated and {blank_count} blank phone numbers"
+        ))
+
+        if not dry_run:
+            self.add_constraint()
+
+    def add_constraint(self):
+        """Install the constraint on databases created before it was declared"""
+        table = CustomUser._meta.db_table
+        with connection.cursor() as cursor:
+            existing = connection.introspection.get_constraints(cursor, table)
+        if CONSTRAINT_NAME in existing:
+            self.stdout.write(f"{CONSTRAINT_NAME} already exists")
+            return
+
+        constraint = next(
+            constraint for constraint in CustomUser._meta.constraints if constraint.name == CONSTRAINT_NAME
+        )
+        with connection.schema_editor() as editor:
+            editor.add_constraint(CustomUser, constraint)
+        self.stdout.write(self.style.SUCCESS(f"Added {CONSTRAINT_NAME} on {table}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from topgrade_api.progress_buffer import flush, get_progress_buffer, uses_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the watch positions buffered by PROGRESS_WRITE_BEHIND now instead of at the "
+        "next flush interval, e.g. before a deploy. Only a cache-backed buffer is shared with "
+        "this process; in-memory buffers are flushed by their own process on exit."
+    )
+
+    def handle(self, *args, **options):
+        buffer = get_progress_buffer()
+        if buffer is None:
+            raise CommandError("PROGRESS_WRITE_BEHIND is off; there is nothing to flush")
+        if not uses_cache():
+            raise CommandError("The progress buffer is per process here; each worker flushes its own on exit")
+
+        written = flush(buffer)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} buffered topic positions"))
@@ -0,0 +1,232 @@
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+from topgrade_api.hashing import hash_passwords, setup_hashing_process
+from topgrade_api.models import AdvanceProgram, CustomUser, Program, UserPurchase, adjust_enrolled_students
+
+
+def parse_ids(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [part for part in value.replace(',', ';').split(';') if part.strip()]
+    return [int(part) for part in value]
+
+
+def read_rows(path, file_format):
+    """
+    (line number, row) of every learner in a CSV or JSONL file; a row is a
+    dict, or the error message of a line that couldn't be read as one
+    """
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, f"invalid JSON ({e})"
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, "expected a JSON object"
+                    continue
+                yield line_number, row
+
+
+class Command(BaseCommand):
+    help = (
+        "Import learners from a CSV or JSONL file (email, fullname, phone_number, area_of_intrest, "
+        "password, programs, advanced_programs), hashing passwords on a process pool and inserting "
+        "users and their enrollments in chunks. Already registered emails are skipped, so an "
+        "interrupted import can simply be run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV with a header row, or JSON Lines")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=500, help="Users per insert transaction")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Password hashing processes")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+
+        self.program_ids = set(Program.objects.values_list('id', flat=True))
+        self.advanced_program_ids = set(AdvanceProgram.objects.values_list('id', flat=True))
+        # Across chunks, so a learner listed twice is imported once
+        self.seen_emails = set()
+        self.seen_phones = set()
+        self.totals = Counter()
+
+        started = time.perf_counter()
+        rows = read_rows(path, file_format)
+        # Fork where possible so workers inherit settings; spawned workers set Django up themselves
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=context, initializer=setup_hashing_process
+        ) as pool:
+            pending = None
+            while True:
+                batch = list(itertools.islice(rows, options['batch_size']))
+                chunk = self.prepare(batch)
+                # Hash this chunk while the previous one is inserted
+                hashing = self.submit_hashing(pool, chunk, options['workers']) if chunk else None
+                if pending is not None:
+                    self.insert(*pending)
+                    pending = None
+                if not batch:
+                    break
+                if chunk:
+                    pending = (chunk, hashing)
+
+        elapsed = time.perf_counter() - started
+        totals = self.totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['users']} learners and {totals['purchases']} enrollments in {elapsed:.1f}s "
+            f"({totals['users'] / elapsed if elapsed else 0:.1f} learners/s); skipped {totals['existing']} "
+            f"already registered and {totals['invalid']} invalid rows"
+        ))
+
+    def prepare(self, rows):
+        """Validated, not yet imported learners of one chunk of input rows"""
+        learners = []
+        for line_number, row in rows:
+            try:
+                if isinstance(row, str):
+                    raise ValueError(row)
+                learner = self.clean(row)
+            except (ValueError, ValidationError) as e:
+                message = e.messages[0] if isinstance(e, ValidationError) else str(e)
+                self.stderr.write(f"line {line_number}: {message}")
+                self.totals['invalid'] += 1
+                continue
+            if learner['email'] in self.seen_emails:
+                self.stderr.write(f"line {line_number}: {learner['email']} is listed twice")
+                self.totals['invalid'] += 1
+                continue
+            self.seen_emails.add(learner['email'])
+            learners.append((line_number, learner))
+
+        # One lookup per chunk; on a resumed import this skips everything already done
+        existing = set(
+            CustomUser.objects.filter(email__in=[learner['email'] for _, learner in learners])
+            .values_list('email', flat=True)
+        )
+        phones = [learner['phone_number'] for _, learner in learners if learner['phone_number']]
+        taken_phones = set(
+            CustomUser.objects.filter(phone_number__in=phones).values_list('phone_number', flat=True)
+        )
+
+        chunk = []
+        for line_number, learner in learners:
+            if learner['email'] in existing:
+                self.totals['existing'] += 1
+                continue
+            phone_number = learner['phone_number']
+            if phone_number and (phone_number in taken_phones or phone_number in self.seen_phones):
+                self.stderr.write(f"line {line_number}: phone number {phone_number} belongs to another user")
+                self.totals['invalid'] += 1
+                continue
+            if phone_number:
+                self.seen_phones.add(phone_number)
+            chunk.append(learner)
+        return chunk
+
+    def clean(self, row):
+        email = CustomUser.objects.normalize_email((row.get('email') or '').strip())
+        if not email:
+            raise ValueError("email is required")
+        validate_email(email)
+
+        programs = parse_ids(row.get('programs'))
+        advanced_programs = parse_ids(row.get('advanced_programs'))
+        unknown = [pk for pk in programs if pk not in self.program_ids]
+        unknown += [pk for pk in advanced_programs if pk not in self.advanced_program_ids]
+        if unknown:
+            raise ValueError(f"unknown program ids {unknown}")
+
+        return {
+            'email': email,
+            'fullname': (row.get('fullname') or '').strip() or None,
+            # Blank numbers are stored as NULL, which the unique constraint ignores
+            'phone_number': (row.get('phone_number') or row.get('phone') or '').strip() or None,
+            'area_of_intrest': (row.get('area_of_intrest') or '').strip() or None,
+            'password': row.get('password') or None,
+            'programs': programs,
+            'advanced_programs': advanced_programs,
+        }
+
+    def submit_hashing(self, pool, chunk, workers):
+        passwords = [learner['password'] for learner in chunk]
+        size = -(-len(passwords) // workers)
+        return [pool.submit(hash_passwords, passwords[i:i + size]) for i in range(0, len(passwords), size)]
+
+    def insert(self, chunk, hashing):
+        started = time.perf_counter()
+        encoded = [password for future in hashing for password in future.result()]
+        hashed = time.perf_counter()
+
+        users = []
+        for learner, password in zip(chunk, encoded):
+            users.append(CustomUser(
+                email=learner['email'],
+                # save() would derive it; bulk_create doesn't call save()
+                username=learner['email'].split('@')[0],
+                fullname=learner['fullname'],
+                phone_number=learner['phone_number'],
+                area_of_intrest=learner['area_of_intrest'],
+                password=password,
+            ))
+
+        # Users, enrollments and counters of a chunk land together or not at all
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users, batch_size=500)
+            user_ids = dict(
+                CustomUser.objects.filter(email__in=[user.email for user in users]).values_list('email', 'id')
+            )
+            purchases = []
+            enrollments = Counter()
+            for learner in chunk:
+                for program_type, key in (('program', 'programs'), ('advanced_program', 'advanced_programs')):
+                    for program_id in dict.fromkeys(learner[key]):
+                        purchases.append(UserPurchase(
+                            user_id=user_ids[learner['email']],
+                            program_type=program_type,
+                            program_id=program_id if program_type == 'program' else None,
+                            advanced_program_id=program_id if program_type == 'advanced_program' else None,
+                            status='completed',
+                        ))
+                        enrollments[program_type, program_id] += 1
+            UserPurchase.objects.bulk_create(purchases, batch_size=500)
+
+            # bulk_create skips UserPurchase.save(), which keeps the counters
+            for (program_type, program_id), count in enrollments.items():
+                if program_type == 'program':
+                    adjust_enrolled_students(program_id, None, count)
+                else:
+                    adjust_enrolled_students(None, program_id, count)
+
+        self.totals['users'] += len(users)
+        self.totals['purchases'] += len(purchases)
+        inserted = time.perf_counter()
+        self.stdout.write(
+            f"{self.totals['users']} learners: {len(users)} hashed (waited {hashed - started:.2f}s) "
+            f"and inserted with {len(purchases)} enrollments in {inserted - hashed:.2f}s"
+        )
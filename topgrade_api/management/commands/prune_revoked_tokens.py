@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from topgrade_api.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = "Delete revoked tokens that have expired; run it periodically (e.g. hourly from cron)"
+
+    def handle(self, *args, **options):
+        # A range scan on the expires_at index
+        deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} expired revoked tokens"))
@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from topgrade_api.models import UserTopicProgress
+
+# Bytes used by a table and its indexes, per database vendor
+TABLE_SIZE_SQL = {
+    # dbstat is only there when SQLite was built with it
+    'sqlite': "SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+    'postgresql': "SELECT pg_total_relation_size(%s)",
+    'mysql': (
+        "SELECT data_length + index_length FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name = %s"
+    ),
+}
+
+
+def table_size(table):
+    """Bytes used by `table` and its indexes, or None where that can't be measured"""
+    sql = TABLE_SIZE_SQL.get(connection.vendor)
+    if sql is None:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row else None
+
+
+def describe_size(size):
+    return "unknown size" if size is None else f"{size / 1024:.0f} KiB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the untouched not_started topic progress rows that opening a course used to "
+        "create for every topic, and report how much the table shrank. Topic progress is "
+        "sparse now: a topic without a row reads as not started."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report what would be deleted without deleting it",
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows deleted per transaction")
+
+    def handle(self, *args, **options):
+        table = UserTopicProgress._meta.db_table
+        untouched = UserTopicProgress.objects.filter(status='not_started', watch_time_seconds=0)
+
+        rows_before = UserTopicProgress.objects.count()
+        size_before = table_size(table)
+        prunable = untouched.count()
+        share = prunable / rows_before * 100 if rows_before else 0
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Would delete {prunable} of {rows_before} topic progress rows ({share:.1f}%); "
+                f"{table} is {describe_size(size_before)}"
+            ))
+            return
+
+        deleted = 0
+        while True:
+            # Small transactions keep the table writable for heartbeats meanwhile; the lock
+            # keeps a heartbeat from starting a topic between the lookup and the delete
+            with transaction.atomic():
+                ids = list(untouched.select_for_update().values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                UserTopicProgress.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            self.stdout.write(f"Deleted {deleted} of {prunable} untouched rows")
+
+        rows_after = UserTopicProgress.objects.count()
+        size_after = table_size(table)
+        shrinkage = (rows_before - rows_after) / rows_before * 100 if rows_before else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{table}: {rows_before} -> {rows_after} rows ({shrinkage:.1f}% fewer), "
+            f"{describe_size(size_before)} -> {describe_size(size_after)}"
+        ))
+        if connection.vendor in ('sqlite', 'postgresql'):
+            self.stdout.write("Run VACUUM to return the freed pages to the operating system")
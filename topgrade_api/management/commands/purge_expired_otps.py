@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from topgrade_api.otp_store import DATABASE_MODELS, DatabaseOTPStore
+
+
+class Command(BaseCommand):
+    help = "Delete expired OTP challenges from the database (the cache store expires its own)"
+
+    def handle(self, *args, **options):
+        lifetime = getattr(settings, 'OTP_LIFETIME', 10 * 60)
+        # Rows can be left over from before a switch to the cache store, so always sweep the tables
+        for purpose, (model, field) in DATABASE_MODELS.items():
+            removed = DatabaseOTPStore(purpose, lifetime, model, field).purge_expired()
+            self.stdout.write(f"{model.__name__}: removed {removed} expired challenges")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from topgrade_api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the program full-text search index from the database"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.setup()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index using {backend.__class__.__name__}"))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from topgrade_api.models import AdvanceTopic, Topic, UserCourseProgress, UserTopicProgress
+
+COUNTER_FIELDS = ['total_topics', 'completed_topics', 'in_progress_topics', 'total_watch_time_seconds']
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every course progress summary from its topic progress rows and its "
+        "program's topic count, repairing counters that drifted from the incremental updates"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report drifted summaries without writing them",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        with transaction.atomic():
+            # One GROUP BY pass over the topic rows
+            totals = {
+                row['purchase']: row
+                for row in UserTopicProgress.objects.values('purchase').annotate(
+                    completed=models.Count('id', filter=models.Q(status='completed')),
+                    in_progress=models.Count('id', filter=models.Q(status='in_progress')),
+                    watch_time=models.Sum('watch_time_seconds'),
+                ).order_by()
+            }
+
+            # Topic rows are sparse, so totals come from the syllabi
+            program_topics = dict(
+                Topic.objects.values('syllabus__program').annotate(count=models.Count('id'))
+                .values_list('syllabus__program', 'count').order_by()
+            )
+            advanced_program_topics = dict(
+                AdvanceTopic.objects.values('advance_syllabus__advance_program').annotate(count=models.Count('id'))
+                .values_list('advance_syllabus__advance_program', 'count').order_by()
+            )
+
+            drifted = []
+            for course in UserCourseProgress.objects.select_for_update().select_related('purchase'):
+                row = totals.get(course.purchase_id, {})
+                purchase = course.purchase
+                if purchase.program_id:
+                    total = program_topics.get(purchase.program_id, 0)
+                else:
+                    total = advanced_program_topics.get(purchase.advanced_program_id, 0)
+                before = [getattr(course, field) for field in COUNTER_FIELDS]
+                course.set_totals(
+                    total, row.get('completed', 0), row.get('in_progress', 0), row.get('watch_time') or 0
+                )
+                after = [getattr(course, field) for field in COUNTER_FIELDS]
+                if before != after:
+                    self.stdout.write(f"Course progress #{course.id} (purchase #{course.purchase_id}): {before} -> {after}")
+                    drifted.append(course)
+
+            if drifted and not dry_run:
+                UserCourseProgress.objects.bulk_update(
+                    drifted,
+                    COUNTER_FIELDS + ['completion_percentage', 'is_completed', 'completed_at', 'started_at'],
+                    batch_size=500,
+                )
+
+        verb = "Would fix" if dry_run else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drifted)} course progress summaries"))
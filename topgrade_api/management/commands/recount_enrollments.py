@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from topgrade_api.models import Program, AdvanceProgram, UserPurchase, enrollment_changed
+
+
+class Command(BaseCommand):
+    help = "Recompute enrolled_students on programs and advanced programs from completed purchases"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report drifted counters without writing them",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        with transaction.atomic():
+            # One GROUP BY pass per program table
+            program_counts = dict(
+                UserPurchase.objects.filter(status='completed', program__isnull=False)
+                .values_list('program')
+                .annotate(total=Count('id'))
+                .order_by()
+            )
+            advanced_counts = dict(
+                UserPurchase.objects.filter(status='completed', advanced_program__isnull=False)
+                .values_list('advanced_program')
+                .annotate(total=Count('id'))
+                .order_by()
+            )
+
+            fixed_programs = self.repair(Program, program_counts, dry_run)
+            fixed_advanced = self.repair(AdvanceProgram, advanced_counts, dry_run)
+
+        verb = "Would fix" if dry_run else "Fixed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {fixed_programs} program and {fixed_advanced} advanced program counters"
+        ))
+
+    def repair(self, model, counts, dry_run):
+        """Bring every counter of the model in line with counts; returns how many drifted"""
+        drifted = []
+        for program in model.objects.select_for_update().only('id', 'enrolled_students'):
+            expected = counts.get(program.id, 0)
+            if program.enrolled_students != expected:
+                self.stdout.write(
+                    f"{model.__name__} #{program.id}: {program.enrolled_students} -> {expected}"
+                )
+                drifted.append((program, expected - program.enrolled_students))
+                program.enrolled_students = expected
+
+        if drifted and not dry_run:
+            model.objects.bulk_update([program for program, _ in drifted], ['enrolled_students'], batch_size=500)
+            # Cached listings and the catalog engines follow the catalog version this bumps on commit
+            for program, delta in drifted:
+                enrollment_changed.send(sender=model, program_id=program.id, delta=delta)
+        return len(drifted)
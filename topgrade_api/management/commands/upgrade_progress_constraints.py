@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from topgrade_api.models import UserTopicProgress
+
+# The partial unique indexes these constraints were declared as before
+PARTIAL_CONDITIONS = {
+    'unique_user_topic_progress': models.Q(topic__isnull=False),
+    'unique_user_advance_topic_progress': models.Q(advance_topic__isnull=False),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace the partial unique indexes on topic progress with the plain unique "
+        "constraints that batched progress upserts need, on databases created before them"
+    )
+
+    def handle(self, *args, **options):
+        table = UserTopicProgress._meta.db_table
+        with connection.schema_editor() as editor:
+            for constraint in UserTopicProgress._meta.constraints:
+                name = constraint.name
+                # Looked up again each time: SQLite rebuilds the whole table for a new constraint
+                with connection.cursor() as cursor:
+                    current = connection.introspection.get_constraints(cursor, table).get(name)
+                # A unique constraint introspects as a constraint, the old partial one as an index
+                if current is not None and not current['index']:
+                    self.stdout.write(f"{name} is already up to date")
+                    continue
+                if current is not None:
+                    partial = models.UniqueConstraint(
+                        fields=constraint.fields, condition=PARTIAL_CONDITIONS[name], name=name
+                    )
+                    editor.remove_constraint(UserTopicProgress, partial)
+                editor.add_constraint(UserTopicProgress, constraint)
+                self.stdout.write(self.style.SUCCESS(f"Added {name} on {table}"))
@@ -1,16 +1,25 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
 from django.utils import timezone
 import datetime
+import secrets
 
 class CustomUserManager(BaseUserManager):
-    def create_user(self, email, password=None, **extra_fields):
+    def create_user(self, email, password=None, encoded_password=None, **extra_fields):
         if not email:
             raise ValueError('The Email field must be set')
         email = self.normalize_email(email)
         username = email.split('@')[0]  # Auto-generate username from email
         user = self.model(email=email, username=username, **extra_fields)
-        user.set_password(password)
+        if encoded_password is not None:
+            # Already hashed, e.g. on the password hashing pool
+            user.password = encoded_password
+        else:
+            user.set_password(password)
         user.save(using=self._db)
         return user
 
@@ -26,6 +35,29 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def get_or_create_phone_user(self, phone_number, **extra_fields):
+        """
+        Fetch the user with this phone number, inserting one on a miss.
+
+        The insert ignores conflicts on the unique phone number, so when
+        several first sign-ins from one number race, exactly one row is
+        created and every caller reads that row back. Phone users sign in
+        by OTP only, so they get an unusable password. Returns (user, created).
+        """
+        user = self.filter(phone_number=phone_number).first()
+        if user is not None:
+            return user, False
+        
+        clean_phone = ''.join(character for character in phone_number if character.isdigit())
+        # Random, so the only conflict the insert can hit is the phone number
+        email = f"phone_{clean_phone}_{secrets.token_hex(6)}@tempuser.com"
+        candidate = self.model(email=email, username=email.split('@')[0], phone_number=phone_number, **extra_fields)
+        candidate.set_unusable_password()
+        self.bulk_create([candidate], ignore_conflicts=True)
+        
+        user = self.get(phone_number=phone_number)
+        return user, user.email == email
+
 class CustomUser(AbstractUser):
     USER_ROLES = [
         ('student', 'Student'),
@@ -43,10 +75,26 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
     
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Also serves phone sign-in lookups
+            models.UniqueConstraint(
+                fields=['phone_number'],
+                condition=models.Q(phone_number__isnull=False),
+                name='unique_user_phone_number'
+            ),
+        ]
+    
     def save(self, *args, **kwargs):
-        if self.email and not self.username:
+        # Users built by API authentication defer most fields; save() only writes the loaded
+        # ones, so leave deferred fields alone instead of loading each of them here
+        deferred = self.get_deferred_fields()
+        if not deferred & {'email', 'username'} and self.email and not self.username:
             # Extract username from email (part before @)
             self.username = self.email.split('@')[0]
+        if 'phone_number' not in deferred and not self.phone_number:
+            # Blank numbers are stored as NULL, which the unique constraint ignores
+            self.phone_number = None
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -96,6 +144,27 @@ class PhoneOTPVerification(models.Model):
     def __str__(self):
         return f"Phone OTP for {self.phone_number} - Verified: {self.is_verified}"
 
+class RevokedToken(models.Model):
+    """
+    A revoked JWT, kept only until it would have expired anyway
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"Revoked token {self.jti}"
+
+class CatalogVersion(models.Model):
+    """
+    The catalog version (see catalog_cache) when the cache isn't shared
+    between processes; a single row
+    """
+    version = models.BigIntegerField()
+    modified_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
@@ -126,6 +195,8 @@ class Program(models.Model):
     icon = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Program price")
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0.00, help_text="Discount percentage (0-100)")
+    enrolled_students = models.PositiveIntegerField(default=0, help_text="Completed purchases, maintained by UserPurchase")
+    updated_at = models.DateTimeField(auto_now=True, help_text="Last change to the program, its category or its syllabus")
 
     def __str__(self):
         return self.title
@@ -145,6 +216,13 @@ class Topic(models.Model):
     is_free_trail = models.BooleanField(default=False)
     is_intro = models.BooleanField(default=False)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        topic = super().from_db(db, field_names, values)
+        # So a save can tell whether the topic moved to another syllabus
+        topic._loaded_syllabus_id = topic.__dict__.get('syllabus_id')
+        return topic
+
     def __str__(self):
         return self.topic_title
 
@@ -164,6 +242,8 @@ class AdvanceProgram(models.Model):
     icon = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Advanced program price")
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0.00, help_text="Discount percentage (0-100)")
+    enrolled_students = models.PositiveIntegerField(default=0, help_text="Completed purchases, maintained by UserPurchase")
+    updated_at = models.DateTimeField(auto_now=True, help_text="Last change to the program, its category or its syllabus")
 
     def __str__(self):
         return self.title
@@ -181,10 +261,39 @@ class AdvanceTopic(models.Model):
     video_url = models.URLField(blank=True, null=True)
     description = models.TextField(blank=True, null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        topic = super().from_db(db, field_names, values)
+        topic._loaded_syllabus_id = topic.__dict__.get('advance_syllabus_id')
+        return topic
+
     def __str__(self):
         return self.topic_title
 
 
+# Sent with the program model and id whenever an enrolled_students counter moves
+enrollment_changed = Signal()
+
+
+def adjust_enrolled_students(program_id, advanced_program_id, delta):
+    """
+    Apply an enrollment delta to the program a purchase points at
+    """
+    if program_id:
+        model, pk = Program, program_id
+    elif advanced_program_id:
+        model, pk = AdvanceProgram, advanced_program_id
+    else:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        # Never let the counter go negative if it has drifted
+        queryset = queryset.filter(enrolled_students__gte=-delta)
+    # Leaves updated_at alone: the count reaches clients through the catalog version
+    if queryset.update(enrolled_students=models.F('enrolled_students') + delta):
+        enrollment_changed.send(sender=model, program_id=pk, delta=delta)
+
+
 class UserPurchase(models.Model):
     """
     Simple model to track user purchases - courses are automatically assigned
@@ -233,6 +342,128 @@ class UserPurchase(models.Model):
             return f"{self.user.email} - {self.advanced_program.title}"
         return f"{self.user.email} - Purchase #{self.id}"
 
+    def save(self, *args, **kwargs):
+        """Save and keep the program's enrolled_students counter in the same transaction"""
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = None
+            if self.pk:
+                previous = UserPurchase.objects.select_for_update().filter(pk=self.pk).values(
+                    'status', 'program_id', 'advanced_program_id'
+                ).first()
+            super().save(*args, **kwargs)
+
+            was_completed = bool(previous) and previous['status'] == 'completed'
+            is_completed = self.status == 'completed'
+            if was_completed and is_completed and \
+                    previous['program_id'] == self.program_id and \
+                    previous['advanced_program_id'] == self.advanced_program_id:
+                return
+            if was_completed:
+                adjust_enrolled_students(previous['program_id'], previous['advanced_program_id'], -1)
+            if is_completed:
+                adjust_enrolled_students(self.program_id, self.advanced_program_id, 1)
+
+
+@receiver(post_delete, sender=UserPurchase)
+def release_enrollment(sender, instance, **kwargs):
+    """Deleting a completed purchase (directly or by cascade) frees its enrollment"""
+    # post_delete runs inside the deletion transaction
+    if instance.status == 'completed':
+        adjust_enrolled_students(instance.program_id, instance.advanced_program_id, -1)
+
+
+TOPIC_COUNT_KEY_PREFIX = 'catalog:topic-count'
+TOPIC_COUNT_TIMEOUT = 60 * 60  # seconds; also bounds how long a bulk syllabus import goes unnoticed
+
+
+def _topic_count_key(program_id, advanced_program_id):
+    if program_id:
+        return f'{TOPIC_COUNT_KEY_PREFIX}:program:{program_id}'
+    return f'{TOPIC_COUNT_KEY_PREFIX}:advanced_program:{advanced_program_id}'
+
+
+def program_topic_count(program_id, advanced_program_id):
+    """
+    Topics in the syllabus of the program a purchase points at, cached until
+    the syllabus changes
+    """
+    key = _topic_count_key(program_id, advanced_program_id)
+    count = cache.get(key)
+    if count is None:
+        if program_id:
+            count = Topic.objects.filter(syllabus__program_id=program_id).count()
+        else:
+            count = AdvanceTopic.objects.filter(advance_syllabus__advance_program_id=advanced_program_id).count()
+        cache.set(key, count, timeout=TOPIC_COUNT_TIMEOUT)
+    return count
+
+
+def forget_topic_count(program_id, advanced_program_id):
+    key = _topic_count_key(program_id, advanced_program_id)
+    # After commit, so a concurrent miss can't cache the count from before the change
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver([post_save, post_delete], sender=Syllabus)
+def syllabus_topics_changed(sender, instance, **kwargs):
+    forget_topic_count(instance.program_id, None)
+
+
+@receiver([post_save, post_delete], sender=AdvanceSyllabus)
+def advance_syllabus_topics_changed(sender, instance, **kwargs):
+    forget_topic_count(None, instance.advance_program_id)
+
+
+def moved_syllabus_ids(instance, syllabus_id, created):
+    """
+    Syllabi whose program's topic count a topic save may have moved: the new
+    one on creation, both on a move, none on an edit in place
+    """
+    loaded_syllabus_id = getattr(instance, '_loaded_syllabus_id', syllabus_id)
+    instance._loaded_syllabus_id = syllabus_id
+    if created:
+        return [syllabus_id]
+    if loaded_syllabus_id != syllabus_id:
+        return [loaded_syllabus_id, syllabus_id]
+    return []
+
+
+def forget_syllabus_topic_counts(syllabus_ids):
+    for program_id in Syllabus.objects.filter(pk__in=syllabus_ids).values_list('program_id', flat=True):
+        forget_topic_count(program_id, None)
+
+
+def forget_advance_syllabus_topic_counts(syllabus_ids):
+    for advance_program_id in AdvanceSyllabus.objects.filter(pk__in=syllabus_ids).values_list(
+        'advance_program_id', flat=True
+    ):
+        forget_topic_count(None, advance_program_id)
+
+
+@receiver(post_save, sender=Topic)
+def topic_saved(sender, instance, created, **kwargs):
+    syllabus_ids = moved_syllabus_ids(instance, instance.syllabus_id, created)
+    if syllabus_ids:
+        forget_syllabus_topic_counts(syllabus_ids)
+
+
+@receiver(post_delete, sender=Topic)
+def topic_deleted(sender, instance, **kwargs):
+    # In a cascade from the syllabus this finds nothing; its own receiver covers it
+    forget_syllabus_topic_counts([instance.syllabus_id])
+
+
+@receiver(post_save, sender=AdvanceTopic)
+def advance_topic_saved(sender, instance, created, **kwargs):
+    syllabus_ids = moved_syllabus_ids(instance, instance.advance_syllabus_id, created)
+    if syllabus_ids:
+        forget_advance_syllabus_topic_counts(syllabus_ids)
+
+
+@receiver(post_delete, sender=AdvanceTopic)
+def advance_topic_deleted(sender, instance, **kwargs):
+    forget_advance_syllabus_topic_counts([instance.advance_syllabus_id])
+
 
 class UserBookmark(models.Model):
     """
@@ -278,7 +509,8 @@ class UserBookmark(models.Model):
 
 class UserTopicProgress(models.Model):
     """
-    Track user progress for individual topics/videos
+    Track user progress for individual topics/videos. Rows only exist for
+    topics the user has watched; a topic without one reads as not_started.
     """
     PROGRESS_STATUS_CHOICES = [
         ('not_started', 'Not Started'),
@@ -342,15 +574,16 @@ class UserTopicProgress(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        # Not partial: NULL topics never conflict anyway, and ON CONFLICT
+        # upserts (bulk_create(update_conflicts=True)) can only target plain
+        # unique constraints
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'topic'],
-                condition=models.Q(topic__isnull=False),
                 name='unique_user_topic_progress'
             ),
             models.UniqueConstraint(
                 fields=['user', 'advance_topic'],
-                condition=models.Q(advance_topic__isnull=False),
                 name='unique_user_advance_topic_progress'
             )
         ]
@@ -373,8 +606,32 @@ class UserTopicProgress(models.Model):
             return 0
         return min(100, (self.watch_time_seconds / self.total_duration_seconds) * 100)
 
+    def save(self, *args, **kwargs):
+        """Save and apply the change to the course summary in the same transaction"""
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = None
+            if not self._state.adding:
+                # Locked, so concurrent heartbeats for the topic apply their deltas in turn
+                previous = UserTopicProgress.objects.select_for_update().filter(pk=self.pk).values(
+                    'status', 'watch_time_seconds'
+                ).first()
+            super().save(*args, **kwargs)
+
+            if previous is None:
+                UserCourseProgress.apply_topic_change(self.purchase_id, None, self.status, self.watch_time_seconds)
+            else:
+                UserCourseProgress.apply_topic_change(
+                    self.purchase_id, previous['status'], self.status,
+                    self.watch_time_seconds - previous['watch_time_seconds'],
+                )
+
     def update_progress(self, watch_time_seconds, total_duration_seconds=None):
         """Update progress based on watch time"""
+        self.apply_watch_time(watch_time_seconds, total_duration_seconds)
+        self.save()
+
+    def apply_watch_time(self, watch_time_seconds, total_duration_seconds=None):
+        """Set the watch time and derive completion and status, without saving"""
         self.watch_time_seconds = watch_time_seconds
         
         if total_duration_seconds:
@@ -393,8 +650,6 @@ class UserTopicProgress(models.Model):
             self.status = 'in_progress'
             if not self.started_at:
                 self.started_at = timezone.now()
-        
-        self.save()
 
 
 class UserCourseProgress(models.Model):
@@ -450,17 +705,103 @@ class UserCourseProgress(models.Model):
             return self.purchase.advanced_program.title
         return "Unknown Program"
 
+    @classmethod
+    def apply_topic_change(cls, purchase_id, old_status, new_status, watch_time_delta):
+        """
+        Move the course summary of a purchase by one topic's change with a
+        single UPDATE of F() deltas; completion fields are derived in the
+        same statement. A missing summary is left to update_progress().
+        """
+        cls.apply_deltas(
+            purchase_id,
+            completed=(new_status == 'completed') - (old_status == 'completed'),
+            in_progress=(new_status == 'in_progress') - (old_status == 'in_progress'),
+            watch_time=watch_time_delta,
+        )
+
+    @classmethod
+    def apply_deltas(cls, purchase_id, topics=0, completed=0, in_progress=0, watch_time=0):
+        """
+        apply_topic_change() for the summed changes of any number of topics;
+        `topics` moves total_topics when the syllabus grew or shrank
+        """
+        now = timezone.now()
+
+        # Conditions on the values after this update, in terms of the current ones
+        has_topics = models.Q(total_topics__gt=-topics)
+        all_completed = has_topics & models.Q(completed_topics__gte=models.F('total_topics') + (topics - completed))
+        any_completed = has_topics & models.Q(completed_topics__gt=-completed)
+
+        cls.objects.filter(purchase_id=purchase_id).update(
+            # Clamped, so a drifted counter can't break the heartbeat; update_progress() repairs it
+            total_topics=Greatest(models.F('total_topics') + topics, 0),
+            completed_topics=Greatest(models.F('completed_topics') + completed, 0),
+            in_progress_topics=Greatest(models.F('in_progress_topics') + in_progress, 0),
+            total_watch_time_seconds=Greatest(models.F('total_watch_time_seconds') + watch_time, 0),
+            completion_percentage=models.Case(
+                models.When(
+                    has_topics,
+                    then=models.ExpressionWrapper(
+                        Greatest(models.F('completed_topics') + completed, 0) * models.Value(100.0)
+                        / (models.F('total_topics') + topics),
+                        output_field=models.DecimalField(max_digits=5, decimal_places=2),
+                    ),
+                ),
+                default=models.F('completion_percentage'),
+            ),
+            # Cleared again when topics are added to a completed course
+            is_completed=models.Case(
+                models.When(all_completed, then=models.Value(True)),
+                models.When(has_topics, then=models.Value(False)),
+                default=models.F('is_completed'),
+            ),
+            completed_at=models.Case(
+                models.When(all_completed & models.Q(completed_at__isnull=True), then=models.Value(now)),
+                models.When(all_completed, then=models.F('completed_at')),
+                models.When(has_topics, then=models.Value(None)),
+                default=models.F('completed_at'),
+            ),
+            started_at=models.Case(
+                models.When(any_completed & models.Q(started_at__isnull=True), then=models.Value(now)),
+                default=models.F('started_at'),
+            ),
+            last_activity_at=now,
+        )
+
     def update_progress(self):
-        """Recalculate progress based on topic progress"""
-        # Get all topic progress for this course
-        topic_progress = UserTopicProgress.objects.filter(
-            user=self.user,
-            purchase=self.purchase
+        """
+        Recompute the summary from the purchase's topic progress rows and its
+        program's topic count. Topic saves keep it current incrementally
+        (apply_topic_change()); this seeds new summaries and repairs drifted ones.
+        """
+        totals = UserTopicProgress.objects.filter(
+            user=self.user_id,
+            purchase=self.purchase_id
+        ).aggregate(
+            completed=models.Count('id', filter=models.Q(status='completed')),
+            in_progress=models.Count('id', filter=models.Q(status='in_progress')),
+            watch_time=models.Sum('watch_time_seconds'),
         )
-        
-        self.total_topics = topic_progress.count()
-        self.completed_topics = topic_progress.filter(status='completed').count()
-        self.in_progress_topics = topic_progress.filter(status='in_progress').count()
+        total = program_topic_count(self.purchase.program_id, self.purchase.advanced_program_id)
+        self.set_totals(total, totals['completed'], totals['in_progress'], totals['watch_time'] or 0)
+        self.save()
+
+    def sync_total_topics(self, purchase):
+        """
+        Move total_topics to the cached topic count of the purchase's program
+        if its syllabus changed; `purchase` is this summary's, already loaded
+        """
+        total = program_topic_count(purchase.program_id, purchase.advanced_program_id)
+        if self.total_topics != total:
+            UserCourseProgress.apply_deltas(self.purchase_id, topics=total - self.total_topics)
+            self.refresh_from_db(fields=['total_topics', 'completion_percentage', 'is_completed', 'completed_at'])
+
+    def set_totals(self, total, completed, in_progress, watch_time):
+        """Set the counters to recomputed totals and derive the completion fields"""
+        self.total_topics = total
+        self.completed_topics = completed
+        self.in_progress_topics = in_progress
+        self.total_watch_time_seconds = watch_time
         
         # Calculate overall completion percentage
         if self.total_topics > 0:
@@ -471,14 +812,21 @@ class UserCourseProgress(models.Model):
             self.is_completed = True
             if not self.completed_at:
                 self.completed_at = timezone.now()
+        elif self.total_topics > 0:
+            self.is_completed = False
+            self.completed_at = None
         
         # Update start time if any progress exists
         if self.completion_percentage > 0 and not self.started_at:
             self.started_at = timezone.now()
-        
-        # Calculate total watch time
-        self.total_watch_time_seconds = sum(
-            progress.watch_time_seconds for progress in topic_progress
-        )
-        
-        self.save()
+
+
+@receiver(post_delete, sender=UserTopicProgress)
+def release_topic_progress(sender, instance, **kwargs):
+    """Deleting topic progress takes it out of the course summary"""
+    # An untouched row counts for nothing, so pruning them costs no updates
+    if instance.status == 'not_started' and not instance.watch_time_seconds:
+        return
+    UserCourseProgress.apply_topic_change(
+        instance.purchase_id, instance.status, None, -instance.watch_time_seconds
+    )
@@ -0,0 +1,183 @@
+"""
+Where pending OTP challenges live.
+
+A challenge is issued for an identifier (an email or a phone number), may
+be marked verified, and is consumed exactly once. CacheOTPStore keeps it in
+the cache under a random nonce, so a re-issued challenge starts unverified;
+DatabaseOTPStore keeps the OTPVerification / PhoneOTPVerification rows.
+OTP_STORE picks 'cache', 'database' or 'auto', the cache only when shared.
+"""
+import datetime
+import math
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import OTPVerification, PhoneOTPVerification
+
+OTP_KEY_PREFIX = 'otp'
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# purpose -> (model, identifier field) of the database store
+DATABASE_MODELS = {
+    'password_reset': (OTPVerification, 'email'),
+    'phone_signin': (PhoneOTPVerification, 'phone_number'),
+}
+
+
+class OTPState:
+    def __init__(self, verified, expires_at):
+        self.verified = verified
+        self.expires_at = expires_at
+
+    def is_expired(self):
+        return timezone.now() > self.expires_at
+
+
+class OTPStore:
+    """
+    Interface of an OTP store bound to one purpose
+    """
+
+    def __init__(self, purpose, lifetime):
+        self.purpose = purpose
+        self.lifetime = lifetime
+
+    def issue(self, identifier):
+        """Start a new unverified challenge, replacing any previous one"""
+        raise NotImplementedError
+
+    def get(self, identifier):
+        """OTPState of the current challenge, or None if there is none"""
+        raise NotImplementedError
+
+    def mark_verified(self, identifier):
+        """Mark a live challenge verified; False if there is none"""
+        raise NotImplementedError
+
+    def consume(self, identifier, verified_only=False):
+        """
+        End a live challenge (only a verified one with `verified_only`).
+        True for exactly one caller per challenge.
+        """
+        raise NotImplementedError
+
+    def purge_expired(self):
+        """Drop expired challenges; returns how many were removed"""
+        return 0
+
+
+class CacheOTPStore(OTPStore):
+    def __init__(self, purpose, lifetime, cache):
+        super().__init__(purpose, lifetime)
+        self.cache = cache
+
+    def _key(self, identifier):
+        return f'{OTP_KEY_PREFIX}:{self.purpose}:{identifier}'
+
+    def _timeout(self, expires_at):
+        return max(math.ceil((expires_at - timezone.now()).total_seconds()), 1)
+
+    def _load(self, identifier):
+        key = self._key(identifier)
+        # The verified marker holds the nonce of the challenge it belongs to
+        values = self.cache.get_many([key, f'{key}:verified'])
+        challenge = values.get(key)
+        if challenge is None or challenge['expires_at'] <= timezone.now():
+            return None, False
+        return challenge, values.get(f'{key}:verified') == challenge['nonce']
+
+    def issue(self, identifier):
+        expires_at = timezone.now() + datetime.timedelta(seconds=self.lifetime)
+        challenge = {'nonce': secrets.token_hex(8), 'expires_at': expires_at}
+        self.cache.set(self._key(identifier), challenge, timeout=self.lifetime)
+
+    def get(self, identifier):
+        challenge, verified = self._load(identifier)
+        if challenge is None:
+            return None
+        return OTPState(verified, challenge['expires_at'])
+
+    def mark_verified(self, identifier):
+        challenge, _ = self._load(identifier)
+        if challenge is None:
+            return False
+        self.cache.set(
+            f'{self._key(identifier)}:verified', challenge['nonce'], timeout=self._timeout(challenge['expires_at'])
+        )
+        return True
+
+    def consume(self, identifier, verified_only=False):
+        challenge, verified = self._load(identifier)
+        if challenge is None or (verified_only and not verified):
+            return False
+        key = self._key(identifier)
+        if not self.cache.add(
+            f"{key}:consumed:{challenge['nonce']}", True, timeout=self._timeout(challenge['expires_at'])
+        ):
+            return False
+        self.cache.delete_many([key, f'{key}:verified'])
+        return True
+
+
+class DatabaseOTPStore(OTPStore):
+    def __init__(self, purpose, lifetime, model, field):
+        super().__init__(purpose, lifetime)
+        self.model = model
+        self.field = field
+
+    def _live(self, identifier):
+        return self.model.objects.filter(**{self.field: identifier, 'expires_at__gt': timezone.now()})
+
+    def issue(self, identifier):
+        self.model.objects.update_or_create(
+            **{self.field: identifier},
+            defaults={
+                'is_verified': False,
+                'verified_at': None,
+                'expires_at': timezone.now() + datetime.timedelta(seconds=self.lifetime),
+            },
+        )
+
+    def get(self, identifier):
+        row = self.model.objects.filter(**{self.field: identifier}).values('is_verified', 'expires_at').first()
+        if row is None:
+            return None
+        return OTPState(row['is_verified'], row['expires_at'])
+
+    def mark_verified(self, identifier):
+        return self._live(identifier).update(is_verified=True, verified_at=timezone.now()) > 0
+
+    def consume(self, identifier, verified_only=False):
+        challenges = self._live(identifier)
+        if verified_only:
+            challenges = challenges.filter(is_verified=True)
+        # Only one concurrent DELETE can remove the row
+        deleted, _ = challenges.delete()
+        return deleted > 0
+
+    def purge_expired(self):
+        deleted, _ = self.model.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+def uses_cache():
+    store = getattr(settings, 'OTP_STORE', 'auto')
+    if store == 'auto':
+        alias = getattr(settings, 'OTP_CACHE_ALIAS', 'default')
+        return settings.CACHES[alias]['BACKEND'] not in PER_PROCESS_CACHES
+    return store == 'cache'
+
+
+def get_otp_store(purpose):
+    """OTP store for 'password_reset' or 'phone_signin', as configured by OTP_STORE"""
+    lifetime = getattr(settings, 'OTP_LIFETIME', 10 * 60)
+    if uses_cache():
+        return CacheOTPStore(purpose, lifetime, caches[getattr(settings, 'OTP_CACHE_ALIAS', 'default')])
+    model, field = DATABASE_MODELS[purpose]
+    return DatabaseOTPStore(purpose, lifetime, model, field)
@@ -0,0 +1,352 @@
+"""
+Write-behind buffer for watch-time heartbeats.
+
+With PROGRESS_WRITE_BEHIND on, a heartbeat that only moves a topic's watch
+position is buffered instead of written, and a flusher thread in every
+process writes the buffered positions every PROGRESS_FLUSH_INTERVAL seconds.
+A buffered position only applies while it is newer than the row's
+last_watched_at. PROGRESS_BUFFER picks 'cache', 'memory' or 'auto'.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, models, transaction
+
+from .models import UserCourseProgress, UserTopicProgress
+from .otp_store import PER_PROCESS_CACHES
+
+PROGRESS_KEY_PREFIX = 'progress'
+
+logger = logging.getLogger(__name__)
+
+# Columns a flush writes; the status never changes while a position is buffered
+FLUSH_FIELDS = ['watch_time_seconds', 'total_duration_seconds', 'completion_percentage', 'last_watched_at']
+
+
+def buffer_entry(progress):
+    """The buffered form of an unsaved UserTopicProgress position"""
+    return {
+        'purchase_id': progress.purchase_id,
+        'watch_time_seconds': progress.watch_time_seconds,
+        'total_duration_seconds': progress.total_duration_seconds,
+        'completion_percentage': progress.completion_percentage,
+        'at': progress.last_watched_at,
+    }
+
+
+def topic_key(progress):
+    if progress.topic_id:
+        return ('topic', progress.topic_id)
+    return ('advance_topic', progress.advance_topic_id)
+
+
+def merge_buffered(progress, entry):
+    """Apply a buffered position to a row read from the database, if it is newer; True if it was"""
+    if entry is None or entry['at'] <= progress.last_watched_at:
+        return False
+    progress.watch_time_seconds = entry['watch_time_seconds']
+    progress.total_duration_seconds = entry['total_duration_seconds']
+    progress.completion_percentage = entry['completion_percentage']
+    progress.last_watched_at = entry['at']
+    return True
+
+
+class ProgressBuffer:
+    """
+    Interface of a buffer of the latest watch position per (user, topic)
+    """
+
+    def record(self, user_id, key, entry):
+        """Buffer `entry` as the position of topic `key` ((topic_type, topic_id)) for the user"""
+        raise NotImplementedError
+
+    def get(self, user_id, key):
+        """The buffered position of one topic, or None"""
+        return self.user_entries(user_id).get(key)
+
+    def user_entries(self, user_id):
+        """{(topic_type, topic_id): entry} of everything buffered for the user"""
+        raise NotImplementedError
+
+    def drain(self):
+        """Take the positions recorded since the last drain as (user_id, key, entry) triples"""
+        raise NotImplementedError
+
+    def requeue(self, drained):
+        """Put drained positions back for the next flush, e.g. after it failed"""
+        raise NotImplementedError
+
+
+class MemoryProgressBuffer(ProgressBuffer):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = defaultdict(dict)
+        self._dirty = set()
+
+    def record(self, user_id, key, entry):
+        with self._lock:
+            self._entries[user_id][key] = entry
+            self._dirty.add((user_id, key))
+
+    def user_entries(self, user_id):
+        with self._lock:
+            return dict(self._entries.get(user_id, {}))
+
+    def drain(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            drained = [(user_id, key, self._entries[user_id][key]) for user_id, key in dirty]
+            # Keep serving reads until the flush lands; newer rows supersede them after that
+            return drained
+
+    def requeue(self, drained):
+        with self._lock:
+            # The entries themselves are still here, possibly newer
+            self._dirty.update((user_id, key) for user_id, key, _ in drained)
+
+    def discard(self, drained):
+        """Forget flushed positions that weren't overwritten meanwhile"""
+        with self._lock:
+            for user_id, key, entry in drained:
+                entries = self._entries.get(user_id)
+                if entries and entries.get(key) is entry and (user_id, key) not in self._dirty:
+                    del entries[key]
+                    if not entries:
+                        del self._entries[user_id]
+
+
+class CacheProgressBuffer(ProgressBuffer):
+    """
+    Positions live under one key per (user, topic), plus a per-user index
+    of those keys for readers. Recording also appends the key to a dirty
+    log: a slot number from the cache's atomic incr(), then the key in
+    that slot. The flusher reads the log from its cursor onwards.
+    Flushed positions are left to expire, as they are no newer than their rows.
+    """
+
+    def __init__(self, cache, timeout):
+        self.cache = cache
+        self.timeout = timeout
+
+    def _entry_key(self, user_id, key):
+        return f'{PROGRESS_KEY_PREFIX}:{user_id}:{key[0]}:{key[1]}'
+
+    def _index_key(self, user_id):
+        return f'{PROGRESS_KEY_PREFIX}:{user_id}:index'
+
+    def _slot_key(self, slot):
+        return f'{PROGRESS_KEY_PREFIX}:dirty:{slot}'
+
+    def record(self, user_id, key, entry):
+        self.cache.set(self._entry_key(user_id, key), entry, timeout=self.timeout)
+        index = self.cache.get(self._index_key(user_id)) or []
+        if key not in index:
+            # A lost race here only hides the position from readers until it is flushed
+            self.cache.set(self._index_key(user_id), index + [key], timeout=self.timeout)
+
+        self._mark_dirty(user_id, key)
+
+    def _mark_dirty(self, user_id, key):
+        seq_key = f'{PROGRESS_KEY_PREFIX}:dirty:seq'
+        self.cache.add(seq_key, 0, timeout=None)
+        slot = self.cache.incr(seq_key)
+        self.cache.set(self._slot_key(slot), (user_id, key), timeout=self.timeout)
+
+    def requeue(self, drained):
+        for user_id, key, _ in drained:
+            self._mark_dirty(user_id, key)
+
+    def get(self, user_id, key):
+        return self.cache.get(self._entry_key(user_id, key))
+
+    def user_entries(self, user_id):
+        index = self.cache.get(self._index_key(user_id)) or []
+        entries = self.cache.get_many([self._entry_key(user_id, key) for key in index])
+        return {
+            key: entries[self._entry_key(user_id, key)]
+            for key in index if self._entry_key(user_id, key) in entries
+        }
+
+    def drain(self):
+        lock_key = f'{PROGRESS_KEY_PREFIX}:dirty:lock'
+        # One flusher at a time across processes
+        if not self.cache.add(lock_key, True, timeout=60):
+            return []
+        try:
+            head = self.cache.get(f'{PROGRESS_KEY_PREFIX}:dirty:seq', 0)
+            cursor = self.cache.get(f'{PROGRESS_KEY_PREFIX}:dirty:cursor', 0)
+            stalled = self.cache.get(f'{PROGRESS_KEY_PREFIX}:dirty:stalled')
+            slots = self.cache.get_many([self._slot_key(slot) for slot in range(cursor + 1, head + 1)])
+
+            dirty = set()
+            for slot in range(cursor + 1, head + 1):
+                item = slots.get(self._slot_key(slot))
+                if item is None and slot != stalled:
+                    # Allocated but not written yet; wait for it unless it was already missing last time
+                    self.cache.set(f'{PROGRESS_KEY_PREFIX}:dirty:stalled', slot, timeout=None)
+                    break
+                if item is not None:
+                    dirty.add(item)
+                cursor = slot
+
+            entries = self.cache.get_many([self._entry_key(user_id, key) for user_id, key in dirty])
+            self.cache.set(f'{PROGRESS_KEY_PREFIX}:dirty:cursor', cursor, timeout=None)
+            self.cache.delete_many(list(slots))
+            return [
+                (user_id, key, entries[self._entry_key(user_id, key)])
+                for user_id, key in dirty if self._entry_key(user_id, key) in entries
+            ]
+        finally:
+            self.cache.delete(lock_key)
+
+
+def flush(buffer):
+    """Write drained positions that are still newer than their rows; returns how many were written"""
+    drained = buffer.drain()
+    if not drained:
+        return 0
+
+    by_user = defaultdict(dict)
+    for user_id, key, entry in drained:
+        by_user[user_id][key] = entry
+
+    try:
+        written = _write(by_user, drained)
+    except Exception:
+        buffer.requeue(_retryable(buffer, drained))
+        raise
+
+    for user_id, key, _ in drained:
+        _failures.pop((user_id, key), None)
+    if isinstance(buffer, MemoryProgressBuffer):
+        buffer.discard(drained)
+    return written
+
+
+# Failed flushes per buffered (user, topic) in this process
+_failures = {}
+
+
+def _retryable(buffer, drained):
+    """The drained positions to requeue; ones that failed PROGRESS_FLUSH_MAX_ATTEMPTS times are dropped"""
+    max_attempts = getattr(settings, 'PROGRESS_FLUSH_MAX_ATTEMPTS', 5)
+    retry, dropped = [], []
+    for item in drained:
+        user_id, key, _ = item
+        attempts = _failures.get((user_id, key), 0) + 1
+        if attempts < max_attempts:
+            _failures[(user_id, key)] = attempts
+            retry.append(item)
+        else:
+            _failures.pop((user_id, key), None)
+            dropped.append(item)
+    if dropped:
+        logger.error("Dropped %d buffered positions after %d failed flushes", len(dropped), max_attempts)
+        if isinstance(buffer, MemoryProgressBuffer):
+            buffer.discard(dropped)
+    return retry
+
+
+def _write(by_user, drained):
+    written = []
+    watch_time_deltas = defaultdict(int)
+    with transaction.atomic():
+        rows = UserTopicProgress.objects.select_for_update().filter(
+            models.Q(topic_id__in=[key[1] for user_id, key, _ in drained if key[0] == 'topic'])
+            | models.Q(advance_topic_id__in=[key[1] for user_id, key, _ in drained if key[0] == 'advance_topic']),
+            user_id__in=by_user,
+        )
+        for row in rows:
+            entry = by_user[row.user_id].get(topic_key(row))
+            previous_watch_time = row.watch_time_seconds
+            if merge_buffered(row, entry):
+                written.append(row)
+                watch_time_deltas[row.purchase_id] += row.watch_time_seconds - previous_watch_time
+
+        if written:
+            UserTopicProgress.objects.bulk_update(written, FLUSH_FIELDS, batch_size=500)
+            for purchase_id, delta in watch_time_deltas.items():
+                UserCourseProgress.apply_deltas(purchase_id, watch_time=delta)
+    return len(written)
+
+
+class Flusher:
+    """Daemon thread flushing the buffer of this process every `interval` seconds"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._reset()
+
+    def _reset(self):
+        # Also run in forked children, which don't inherit the thread
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='progress-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush_now()
+
+    def flush_now(self):
+        buffer = get_progress_buffer()
+        if buffer is None:
+            return
+        try:
+            flush(buffer)
+        except Exception:
+            # Requeued by flush(); the next interval tries again
+            logger.exception("Flushing the progress buffer failed")
+        finally:
+            close_old_connections()
+
+
+_buffer = None
+_flusher = Flusher(getattr(settings, 'PROGRESS_FLUSH_INTERVAL', 10))
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_flusher._reset)
+atexit.register(_flusher.flush_now)
+
+
+def uses_cache():
+    backend = getattr(settings, 'PROGRESS_BUFFER', 'auto')
+    if backend == 'auto':
+        alias = getattr(settings, 'PROGRESS_CACHE_ALIAS', 'default')
+        return settings.CACHES[alias]['BACKEND'] not in PER_PROCESS_CACHES
+    return backend == 'cache'
+
+
+def get_progress_buffer():
+    """The configured buffer, or None when PROGRESS_WRITE_BEHIND is off"""
+    global _buffer
+    if not getattr(settings, 'PROGRESS_WRITE_BEHIND', False):
+        return None
+    if _buffer is None:
+        if uses_cache():
+            _buffer = CacheProgressBuffer(
+                caches[getattr(settings, 'PROGRESS_CACHE_ALIAS', 'default')],
+                # Long enough to outlive any flush backlog
+                timeout=max(getattr(settings, 'PROGRESS_FLUSH_INTERVAL', 10) * 60, 3600),
+            )
+        else:
+            _buffer = MemoryProgressBuffer()
+    return _buffer
+
+
+def record_position(user_id, progress):
+    """Buffer the unsaved position of `progress` and make sure this process flushes it"""
+    get_progress_buffer().record(user_id, topic_key(progress), buffer_entry(progress))
+    _flusher.ensure_started()
@@ -0,0 +1,158 @@
+"""
+Rate limiting for the authentication endpoints.
+
+Wrap an operation with `decorate_view(rate_limit('<scope>'))`; the limits
+of a scope come from the RATE_LIMITS setting as (key, limit, period)
+triples, where key is 'ip' or a JSON body field such as 'email' or
+'phone_number':
+
+    RATE_LIMITS = {'signin': [('ip', 30, 60), ('email', 10, 60)]}
+
+Each limit is a sliding-window counter, which approximates a bucket of
+`limit` tokens refilling over `period` seconds with nothing but atomic
+incr()/decr(): one counter per period window, and a request is let in
+while the current window's count plus the unexpired share of the previous
+window's stays within the limit. Rejected requests are given back, so a
+client retrying in a loop is admitted again once its earlier requests
+age out. Limits are checked before the view runs, so a rejected request
+costs a few cache operations and never reaches password hashing or the
+database. It gets a 429 with a Retry-After header.
+
+State lives in CACHES[RATE_LIMIT_CACHE_ALIAS]; like the catalog version it
+needs a shared cache to hold across workers.
+"""
+import hashlib
+import json
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+RATE_LIMIT_KEY_PREFIX = 'ratelimit'
+
+
+def client_ip(request):
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        # The left-most address is the client; proxies append theirs
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def normalize_identifier(field, value):
+    value = str(value).strip().lower()
+    if field == 'phone_number':
+        # The views accept the same number with or without separators
+        value = ''.join(character for character in value if character.isdigit())
+    return value
+
+
+def _window_key(key, period, now):
+    return f'{key}:{int(now // period)}'
+
+
+def release(cache, key, period, now):
+    """Give back a request counted by hit() at `now`"""
+    try:
+        cache.decr(_window_key(key, period, now))
+    except ValueError:
+        # The window already expired
+        pass
+
+
+def hit(cache, key, limit, period, now=None):
+    """
+    Take one token from the bucket at `key`. Returns 0 if it was allowed,
+    otherwise the seconds until a token is available; a rejected request
+    isn't counted.
+    """
+    now = time.time() if now is None else now
+    window = int(now // period)
+    current_key = _window_key(key, period, now)
+    previous_key = f'{key}:{window - 1}'
+
+    # Windows are read back until the next one ends
+    cache.add(current_key, 0, timeout=period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.add(current_key, 1, timeout=period * 2)
+        current = 1
+    previous = cache.get(previous_key, 0)
+
+    elapsed = now - window * period
+    weight = 1 - elapsed / period
+    if current + previous * weight <= limit:
+        return 0
+    release(cache, key, period, now)
+
+    # Time until the previous window's share has decayed enough, or until
+    # the current window rolls over if it is full on its own
+    if previous and current <= limit:
+        wait = period * (1 - (limit - current) / previous) - elapsed
+    else:
+        wait = period - elapsed
+    return max(math.ceil(wait), 1)
+
+
+def _request_keys(request, limits):
+    """Bucket identifiers of the request, one per configured limit"""
+    body = None
+    for field, limit, period in limits:
+        if field == 'ip':
+            yield field, client_ip(request), limit, period
+            continue
+        if body is None:
+            try:
+                body = json.loads(request.body or b'{}')
+            except ValueError:
+                body = {}
+            if not isinstance(body, dict):
+                body = {}
+        if body.get(field):
+            yield field, normalize_identifier(field, body[field]), limit, period
+
+
+def _bucket_key(scope, field, identifier):
+    # Hashed: raw emails can hold characters memcached doesn't allow in keys, and stay out of the cache
+    digest = hashlib.blake2b(identifier.encode(), digest_size=16).hexdigest()
+    return f'{RATE_LIMIT_KEY_PREFIX}:{scope}:{field}:{digest}'
+
+
+def check_rate_limit(request, scope):
+    """Seconds the client has to wait before `scope` admits it again; 0 if it may go ahead"""
+    if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return 0
+    limits = getattr(settings, 'RATE_LIMITS', {}).get(scope, [])
+    cache = caches[getattr(settings, 'RATE_LIMIT_CACHE_ALIAS', 'default')]
+    now = time.time()
+    taken = []
+    for field, identifier, limit, period in _request_keys(request, limits):
+        key = _bucket_key(scope, field, identifier)
+        retry_after = hit(cache, key, limit, period, now)
+        if retry_after:
+            # The request doesn't go ahead, so it counts against none of its buckets
+            for taken_key, taken_period in taken:
+                release(cache, taken_key, taken_period, now)
+            return retry_after
+        taken.append((key, period))
+    return 0
+
+
+def rate_limit(scope):
+    """View decorator applying the RATE_LIMITS of `scope`"""
+    def wrap(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            retry_after = check_rate_limit(request, scope)
+            if retry_after:
+                response = JsonResponse({"message": "Too many requests. Please try again later."}, status=429)
+                response['Retry-After'] = str(retry_after)
+                return response
+            return view(request, *args, **kwargs)
+        return inner
+    return wrap
@@ -0,0 +1,34 @@
+"""
+JSON renderer shared by the general and authentication APIs.
+
+With orjson installed, responses are encoded in native code: datetimes,
+dates, UUIDs and dataclasses are handled directly (datetimes come out in
+the same isoformat() form the views already use for their own fields).
+Decimals are rendered as strings, like Django's encoder, and anything else
+orjson doesn't know goes through Ninja's encoder. Without orjson this is
+Ninja's stock JSONRenderer.
+"""
+from decimal import Decimal
+
+from ninja.renderers import JSONRenderer
+from ninja.responses import NinjaJSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+_fallback_encoder = NinjaJSONEncoder()
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    return _fallback_encoder.default(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, request, data, *, response_status):
+        if orjson is None:
+            return super().render(request, data, response_status=response_status)
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,164 @@
+"""
+Revoked JWTs.
+
+A revoked token is one RevokedToken row (its jti and expiry) that
+prune_revoked_tokens deletes once the token has expired anyway, so the
+table only ever holds tokens that could still be presented.
+
+Every process keeps a Bloom filter of the revoked jtis in front of the
+table. Nearly every token checked was never revoked, and for those the
+filter answers "not revoked" from memory with a few hashes; only a
+possible hit (a revoked token or a rare false positive) costs a unique
+index lookup. The filter picks up revocations made by other processes
+every TOKEN_REVOCATION_SYNC_INTERVAL seconds with an indexed
+`id > last seen` query, and is rebuilt from scratch every
+TOKEN_REVOCATION_REBUILD_INTERVAL seconds, which also sheds pruned rows.
+
+A row that commits after a higher id was already synced is only picked up
+by the next rebuild, so refresh tokens, which outlive that and are only
+checked by /refresh, always go to the table.
+"""
+import datetime
+import hashlib
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives and about `error_rate` false
+    positives at `capacity` members
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing over two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    def __init__(self, capacity, sync_interval, rebuild_interval):
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._built_at = 0.0
+
+    def _rebuild(self):
+        rows = list(RevokedToken.objects.order_by('id').values_list('id', 'jti'))
+        # Leave room to grow until the next rebuild
+        bloom = BloomFilter(max(self.capacity, len(rows) * 2))
+        for _, jti in rows:
+            bloom.add(jti)
+        self._filter = bloom
+        self._last_id = rows[-1][0] if rows else 0
+        self._built_at = self._synced_at = time.monotonic()
+
+    def _needs_sync(self):
+        return self._filter is None or time.monotonic() - self._synced_at >= self.sync_interval
+
+    def _sync(self):
+        if not self._needs_sync():
+            return
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._filter is None
+                or now - self._built_at >= self.rebuild_interval
+                or self._filter.count >= self._filter.capacity
+            ):
+                self._rebuild()
+            elif now - self._synced_at >= self.sync_interval:
+                for row_id, jti in RevokedToken.objects.filter(id__gt=self._last_id).values_list('id', 'jti'):
+                    self._filter.add(jti)
+                    self._last_id = max(self._last_id, row_id)
+                self._synced_at = now
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    async def ais_revoked(self, jti):
+        if self._needs_sync():
+            await sync_to_async(self._sync)()
+        if jti not in self._filter:
+            return False
+        return await RevokedToken.objects.filter(jti=jti).aexists()
+
+    def revoke(self, jti, expires_at):
+        """Revoke `jti`; False if it already was, so only one caller wins"""
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        self._sync()
+        with self._lock:
+            self._filter.add(jti)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+
+
+revocation_store = RevocationStore(
+    capacity=getattr(settings, 'TOKEN_REVOCATION_BLOOM_CAPACITY', 100000),
+    sync_interval=getattr(settings, 'TOKEN_REVOCATION_SYNC_INTERVAL', 5),
+    rebuild_interval=getattr(settings, 'TOKEN_REVOCATION_REBUILD_INTERVAL', 60 * 60),
+)
+
+
+def _is_refresh(token):
+    return token.get(api_settings.TOKEN_TYPE_CLAIM) == 'refresh'
+
+
+def is_token_revoked(token):
+    if _is_refresh(token):
+        return RevokedToken.objects.filter(jti=token[api_settings.JTI_CLAIM]).exists()
+    return revocation_store.is_revoked(token[api_settings.JTI_CLAIM])
+
+
+async def ais_token_revoked(token):
+    if _is_refresh(token):
+        return await RevokedToken.objects.filter(jti=token[api_settings.JTI_CLAIM]).aexists()
+    return await revocation_store.ais_revoked(token[api_settings.JTI_CLAIM])
+
+
+def revoke_token(token):
+    """Revoke a decoded token until its expiry; False if it was already revoked"""
+    expires_at = datetime.datetime.fromtimestamp(token['exp'], tz=datetime.timezone.utc)
+    return revocation_store.revoke(token[api_settings.JTI_CLAIM], expires_at)
+
+
+arevoke_token = sync_to_async(revoke_token)
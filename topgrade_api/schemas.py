@@ -1,4 +1,8 @@
+from datetime import datetime
+from typing import List, Optional
+
 from ninja import Schema
+from pydantic import BaseModel
 
 class LoginSchema(Schema):
     email: str
@@ -48,4 +52,260 @@ class UpdateProgressSchema(Schema):
     topic_id: int
     topic_type: str  # 'topic' or 'advance_topic'
     watch_time_seconds: int
-    total_duration_seconds: int = None  # optional
\ No newline at end of file
+    total_duration_seconds: int = None  # optional
+
+class ProgressUpdateItemSchema(UpdateProgressSchema):
+    client_ts: datetime = None  # when the player recorded it; orders updates to the same topic
+
+
+# Response schemas
+# Plain pydantic models: the views return dicts, so Ninja's Schema getter for
+# Django objects would only slow down validating every nested card
+
+class CategoryRefSchema(BaseModel):
+    id: int
+    name: str
+
+class CategoriesResponseSchema(BaseModel):
+    success: bool
+    count: int
+    categories: List[CategoryRefSchema]
+
+class PricingSchema(BaseModel):
+    original_price: float
+    discount_percentage: float
+    discounted_price: float
+    savings: float
+
+class ProgramCardSchema(BaseModel):
+    id: int
+    type: str  # 'program' or 'advanced_program'
+    title: str
+    subtitle: Optional[str] = None
+    description: Optional[str] = None
+    category: Optional[CategoryRefSchema] = None  # Advanced programs don't have categories
+    image: Optional[str] = None
+    duration: str
+    program_rating: float
+    is_best_seller: bool
+    enrolled_students: int
+    pricing: PricingSchema
+
+class ContinueWatchingProgressSchema(BaseModel):
+    percentage: float
+    status: str
+    last_watched_at: str
+    last_watched_topic: str
+    completed_topics: int
+    total_topics: int
+
+class ContinueWatchingSchema(ProgramCardSchema):
+    progress: ContinueWatchingProgressSchema
+
+class LandingDataSchema(BaseModel):
+    top_course: List[ProgramCardSchema]
+    recently_added: List[ProgramCardSchema]
+    featured: List[ProgramCardSchema]
+    programs: List[ProgramCardSchema]
+    advanced_programs: List[ProgramCardSchema]
+    continue_watching: List[ContinueWatchingSchema]
+
+class LandingCountsSchema(BaseModel):
+    top_course: int
+    recently_added: int
+    featured: int
+    programs: int
+    advanced_programs: int
+    continue_watching: int
+
+class LandingResponseSchema(BaseModel):
+    success: bool
+    data: LandingDataSchema
+    counts: LandingCountsSchema
+
+class FiltersAppliedSchema(BaseModel):
+    program_type: str
+    category_id: Optional[str] = None
+    is_best_seller: Optional[bool] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_rating: Optional[float] = None
+    search: Optional[str] = None
+    sort_by: str
+    sort_order: str
+
+class ProgramStatisticsSchema(BaseModel):
+    total_count: int
+    regular_programs_count: int
+    advanced_programs_count: int
+
+class PaginationSchema(BaseModel):
+    limit: int
+    count: int
+    has_more: bool
+    next_cursor: Optional[str] = None
+
+class ProgramListResponseSchema(BaseModel):
+    success: bool
+    filters_applied: FiltersAppliedSchema
+    statistics: ProgramStatisticsSchema
+    pagination: PaginationSchema
+    programs: List[ProgramCardSchema]
+
+class SyllabusTopicSchema(BaseModel):
+    id: int
+    topic_title: str
+    is_free_trail: Optional[bool] = None  # Regular programs only
+    is_intro: Optional[bool] = None  # Regular programs only
+    is_locked: bool
+    video_url: Optional[str] = None  # Only present when the topic is accessible
+
+class SyllabusModuleSchema(BaseModel):
+    id: int
+    module_title: str
+    topics_count: int
+    topics: List[SyllabusTopicSchema]
+
+class SyllabusSchema(BaseModel):
+    total_modules: int
+    total_topics: int
+    modules: List[SyllabusModuleSchema]
+
+class ProgramDetailsResponseSchema(BaseModel):
+    success: bool
+    program: ProgramCardSchema
+    syllabus: SyllabusSchema
+
+class BookmarkItemSchema(BaseModel):
+    bookmark_id: int
+    program: ProgramCardSchema
+    bookmarked_date: str
+
+class BookmarksResponseSchema(BaseModel):
+    success: bool
+    count: int
+    bookmarks: List[BookmarkItemSchema]
+
+class LearningProgressSchema(BaseModel):
+    percentage: float
+    status: str  # 'onprogress' or 'completed'
+    completed_modules: int
+    total_modules: int
+    estimated_completion: str
+
+class LearningItemSchema(BaseModel):
+    purchase_id: int
+    program: ProgramCardSchema
+    purchase_date: str
+    progress: LearningProgressSchema
+
+class LearningStatisticsSchema(BaseModel):
+    total_courses: int
+    completed_courses: int
+    in_progress_courses: int
+    completion_rate: float
+
+class MyLearningsResponseSchema(BaseModel):
+    success: bool
+    statistics: LearningStatisticsSchema
+    filter_applied: str
+    learnings: List[LearningItemSchema]
+
+class TopicProgressSummarySchema(BaseModel):
+    topic_title: str
+    status: str
+    completion_percentage: float
+    watch_time_seconds: int
+    total_duration_seconds: int
+    is_completed: bool
+
+class CourseProgressSummarySchema(BaseModel):
+    completion_percentage: float
+    completed_topics: int
+    total_topics: int
+    is_completed: bool
+
+class UpdateProgressResponseSchema(BaseModel):
+    success: bool
+    message: str
+    topic_progress: TopicProgressSummarySchema
+    course_progress: CourseProgressSummarySchema
+
+class BatchTopicProgressSchema(BaseModel):
+    topic_id: int
+    topic_type: str
+    status: str
+    completion_percentage: float
+    watch_time_seconds: int
+    total_duration_seconds: int
+    is_completed: bool
+
+class BatchCourseProgressSchema(CourseProgressSummarySchema):
+    purchase_id: int
+
+class RejectedProgressUpdateSchema(BaseModel):
+    topic_id: int
+    topic_type: str
+    message: str
+
+class BatchUpdateProgressResponseSchema(BaseModel):
+    success: bool
+    message: str
+    topics: List[BatchTopicProgressSchema]
+    courses: List[BatchCourseProgressSchema]
+    rejected: List[RejectedProgressUpdateSchema]
+
+class TopicProgressSchema(BaseModel):
+    status: str
+    completion_percentage: float
+    watch_time: str  # HH:MM:SS
+    watch_time_seconds: int
+    total_duration: str  # HH:MM
+    total_duration_seconds: int
+    started_at: Optional[str] = None
+    completed_at: Optional[str] = None
+    last_watched_at: Optional[str] = None
+
+class LearningTopicSchema(BaseModel):
+    id: int
+    topic_title: str
+    topic_type: str  # 'topic' or 'advance_topic'
+    is_free_trail: bool
+    is_intro: bool
+    is_locked: bool
+    video_url: Optional[str] = None
+    progress: TopicProgressSchema
+
+class LearningModuleSchema(BaseModel):
+    id: int
+    module_title: str
+    topics_count: int
+    completed_topics: int
+    topics: List[LearningTopicSchema]
+
+class CourseProgressSchema(BaseModel):
+    completion_percentage: float
+    completed_topics: int
+    total_topics: int
+    in_progress_topics: int
+    total_watch_time: str
+    total_watch_time_seconds: int
+    is_completed: bool
+    started_at: Optional[str] = None
+    completed_at: Optional[str] = None
+    last_activity_at: str
+
+class CourseLearningSchema(BaseModel):
+    purchase_id: int
+    program_type: str
+    program_title: str
+    program_subtitle: Optional[str] = None
+    program_description: Optional[str] = None
+    program_image: Optional[str] = None
+    purchase_date: str
+    progress: CourseProgressSchema
+    syllabus: List[LearningModuleSchema]
+
+class CourseLearningResponseSchema(BaseModel):
+    success: bool
+    course: CourseLearningSchema
@@ -0,0 +1,259 @@
+"""
+Full-text search over the program catalog.
+
+Programs are indexed together with their syllabus module titles and topic
+titles. On SQLite the index is an FTS5 table ranked with bm25; other
+databases fall back to LikeSearchBackend. Set PROGRAM_SEARCH_BACKEND in
+settings to a dotted path to pick a backend explicitly.
+
+The index is kept in sync by the signal receivers at the bottom of this
+module, which reindex the owning program after each committed write. A topic moved
+to another syllabus reindexes the program it left as well.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connection, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Program, AdvanceProgram, Syllabus, Topic, AdvanceSyllabus, AdvanceTopic
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MODELS = {
+    'program': Program,
+    'advanced_program': AdvanceProgram,
+}
+
+# Both program tables share one index, so documents are keyed by id * 2 + offset
+DOCUMENT_OFFSETS = {
+    'program': 0,
+    'advanced_program': 1,
+}
+
+
+class SearchBackend:
+    """
+    Interface for program search backends
+    """
+
+    def setup(self):
+        """Create whatever storage the index needs; must be idempotent"""
+
+    def rebuild(self):
+        """Reindex every program from scratch"""
+
+    def index(self, program_type, program_id):
+        """Refresh one program, removing it if it no longer exists"""
+
+    def apply(self, queryset, program_type, text):
+        """
+        Restrict a program queryset to rows matching `text` and annotate
+        `search_rank`, where lower values are more relevant.
+        """
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    Portable fallback using icontains; every match ranks equally
+    """
+
+    def apply(self, queryset, program_type, text):
+        matches = queryset.model.objects.filter(
+            models.Q(title__icontains=text) |
+            models.Q(subtitle__icontains=text) |
+            models.Q(description__icontains=text) |
+            models.Q(syllabuses__module_title__icontains=text) |
+            models.Q(syllabuses__topics__topic_title__icontains=text)
+        ).values('pk')
+        return queryset.filter(pk__in=matches).annotate(
+            search_rank=models.Value(0.0, output_field=models.FloatField())
+        )
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    SQLite FTS5 index ranked with bm25, weighting titles above body text
+    """
+    table = 'topgrade_api_program_search'
+    columns = ['title', 'subtitle', 'description', 'modules', 'topics']
+    weights = '10.0, 5.0, 1.0, 2.0, 1.0'
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"{', '.join(self.columns)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            # Persisted in the index config, so `rank` means weighted bm25 from now on
+            cursor.execute(
+                f"INSERT INTO {self.table}({self.table}, rank) VALUES ('rank', %s)",
+                [f"bm25({self.weights})"]
+            )
+
+    def is_empty(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT 1 FROM {self.table} LIMIT 1")
+            return cursor.fetchone() is None
+
+    def _documents(self, program_type, queryset):
+        offset = DOCUMENT_OFFSETS[program_type]
+        for program in queryset.prefetch_related('syllabuses__topics'):
+            syllabi = list(program.syllabuses.all())
+            yield (
+                program.id * 2 + offset,
+                program.title,
+                program.subtitle or '',
+                program.description or '',
+                ' '.join(syllabus.module_title for syllabus in syllabi),
+                ' '.join(topic.topic_title for syllabus in syllabi for topic in syllabus.topics.all()),
+            )
+
+    def _insert(self, cursor, documents):
+        placeholders = ', '.join(['%s'] * (len(self.columns) + 1))
+        cursor.executemany(
+            f"INSERT INTO {self.table}(rowid, {', '.join(self.columns)}) VALUES ({placeholders})",
+            list(documents)
+        )
+
+    def rebuild(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            for program_type, model in SEARCH_MODELS.items():
+                self._insert(cursor, self._documents(program_type, model.objects.all()))
+
+    def index(self, program_type, program_id):
+        model = SEARCH_MODELS[program_type]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid = %s",
+                [program_id * 2 + DOCUMENT_OFFSETS[program_type]]
+            )
+            self._insert(cursor, self._documents(program_type, model.objects.filter(pk=program_id)))
+
+    @staticmethod
+    def match_expression(text):
+        """Turn user input into an FTS5 query of prefix terms, all required"""
+        terms = re.findall(r'\w+', text)
+        return ' '.join(f'"{term}"*' for term in terms) or None
+
+    def apply(self, queryset, program_type, text):
+        match = self.match_expression(text)
+        if match is None:
+            return queryset.annotate(
+                search_rank=models.Value(0.0, output_field=models.FloatField())
+            ).none()
+
+        offset = DOCUMENT_OFFSETS[program_type]
+        document_id = f'"{queryset.model._meta.db_table}"."id" * 2 + {offset}'
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid / 2 FROM {self.table} WHERE {self.table} MATCH %s AND rowid %% 2 = {offset}",
+                [match]
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT rank FROM {self.table} WHERE {self.table} MATCH %s AND rowid = {document_id}",
+                [match],
+                output_field=models.FloatField()
+            )
+        )
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured search backend, defaulting by database vendor"""
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'PROGRAM_SEARCH_BACKEND', None)
+        if backend_path:
+            backend_class = import_string(backend_path)
+        elif connection.vendor == 'sqlite':
+            backend_class = SQLiteFTS5Backend
+        else:
+            backend_class = LikeSearchBackend
+        _backend = backend_class()
+    return _backend
+
+
+def setup_search_index(**kwargs):
+    """post_migrate hook: make sure the index exists and is populated"""
+    backend = get_search_backend()
+    backend.setup()
+    if isinstance(backend, SQLiteFTS5Backend) and backend.is_empty():
+        backend.rebuild()
+
+
+def schedule_reindex(program_type, program_id):
+    """Reindex a program once the current transaction commits"""
+    if program_id is None:
+        return
+
+    def reindex():
+        try:
+            get_search_backend().index(program_type, program_id)
+        except DatabaseError:
+            # The write already committed; `manage.py rebuild_search_index` repairs the index
+            logger.exception("Could not reindex %s #%s", program_type, program_id)
+
+    transaction.on_commit(reindex)
+
+
+@receiver([post_save, post_delete], sender=Program)
+def reindex_program(sender, instance, **kwargs):
+    schedule_reindex('program', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=AdvanceProgram)
+def reindex_advance_program(sender, instance, **kwargs):
+    schedule_reindex('advanced_program', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Syllabus)
+def reindex_syllabus_program(sender, instance, **kwargs):
+    schedule_reindex('program', instance.program_id)
+
+
+@receiver([post_save, post_delete], sender=AdvanceSyllabus)
+def reindex_advance_syllabus_program(sender, instance, **kwargs):
+    schedule_reindex('advanced_program', instance.advance_program_id)
+
+
+def previous_syllabus_id(instance, syllabus_id):
+    """The syllabus a loaded topic is being moved away from, if any"""
+    loaded_syllabus_id = getattr(instance, '_loaded_syllabus_id', syllabus_id)
+    return loaded_syllabus_id if loaded_syllabus_id != syllabus_id else None
+
+
+# Captured before save, since the topic count receivers reset the loaded syllabus in post_save
+@receiver(pre_save, sender=Topic)
+def remember_topic_syllabus(sender, instance, **kwargs):
+    instance._search_previous_syllabus_id = previous_syllabus_id(instance, instance.syllabus_id)
+
+
+@receiver(pre_save, sender=AdvanceTopic)
+def remember_advance_topic_syllabus(sender, instance, **kwargs):
+    instance._search_previous_syllabus_id = previous_syllabus_id(instance, instance.advance_syllabus_id)
+
+
+@receiver([post_save, post_delete], sender=Topic)
+def reindex_topic_program(sender, instance, **kwargs):
+    syllabus_ids = [instance.syllabus_id, getattr(instance, '_search_previous_syllabus_id', None)]
+    for program_id in set(Syllabus.objects.filter(pk__in=syllabus_ids).values_list('program_id', flat=True)):
+        schedule_reindex('program', program_id)
+
+
+@receiver([post_save, post_delete], sender=AdvanceTopic)
+def reindex_advance_topic_program(sender, instance, **kwargs):
+    syllabus_ids = [instance.advance_syllabus_id, getattr(instance, '_search_previous_syllabus_id', None)]
+    for program_id in set(AdvanceSyllabus.objects.filter(
+        pk__in=syllabus_ids
+    ).values_list('advance_program_id', flat=True)):
+        schedule_reindex('advanced_program', program_id)
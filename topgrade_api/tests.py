@@ -1,3 +1,1255 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.functional import lazy
+from ninja.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import hashing
+from .authentication import issue_refresh_token, user_cache
+from .backends import admin_cache
+from .catalog import (
+    SORT_OPTIONS, CatalogQuery, InvalidCursor, build_landing_sections, decode_cursor, encode_cursor, get_sort_keys,
+    list_programs, serialize_catalog_row, serialize_program_card
+)
+from .catalog_cache import forget_database_watermark, get_facets, get_syllabus_tree, version_in_database
+from .catalog_engine import MemoryCatalog, get_catalog_engine, np
+from .catalog_snapshot import MappedCatalog, write_snapshot
+from .models import (
+    AdvanceProgram, CatalogVersion, RevokedToken, Category, CustomUser, OTPVerification, Program, Syllabus, Topic,
+    UserBookmark, UserCourseProgress, UserPurchase, UserTopicProgress
+)
+from .otp_store import CacheOTPStore, DatabaseOTPStore
+from .progress_buffer import Flusher, MemoryProgressBuffer, flush
+from .ratelimit import hit
+from .renderers import FastJSONRenderer
+from .revocation import revocation_store
+from .search import LikeSearchBackend, SQLiteFTS5Backend, get_search_backend
+
+
+def make_program(category, title, **fields):
+    return Program.objects.create(**{
+        'title': title, 'category': category, 'batch_starts': 'Soon', 'available_slots': 10,
+        'duration': '8 weeks', 'job_openings': '1K', 'global_market_size': '1B', 'avg_annual_salary': '1L',
+        'price': 100, **fields,
+    })
+
+
+class CourseLearningDetailsQueryTests(TestCase):
+    """GET /api/learning/course/{id} costs the same number of queries for any course size"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.category = Category.objects.create(name='Engineering')
+
+    def make_purchase(self, modules, topics_per_module):
+        program = make_program(self.category, f'{modules}x{topics_per_module}')
+        for module in range(modules):
+            syllabus = Syllabus.objects.create(program=program, module_title=f'Module {module}')
+            Topic.objects.bulk_create(
+                Topic(syllabus=syllabus, topic_title=f'Topic {module}.{topic}') for topic in range(topics_per_module)
+            )
+        return UserPurchase.objects.create(
+            user=self.user, program_type='program', program=program, status='completed'
+        )
+
+    def get_details(self, purchase):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/learning/course/{purchase.id}', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['course'], len(queries)
+
+    def test_query_count_does_not_grow_with_topics(self):
+        small = self.make_purchase(modules=1, topics_per_module=2)
+        large = self.make_purchase(modules=5, topics_per_module=10)
+        # Authenticate once so the user lookup is cached for both courses
+        self.get_details(self.make_purchase(modules=1, topics_per_module=1))
+
+        # First open: seeds the course summary; unwatched topics get no progress rows
+        small_course, small_seeding = self.get_details(small)
+        large_course, large_seeding = self.get_details(large)
+        self.assertEqual(small_seeding, large_seeding)
+        self.assertFalse(UserTopicProgress.objects.filter(purchase=large).exists())
+        topics = [topic for module in large_course['syllabus'] for topic in module['topics']]
+        self.assertEqual(len(topics), 50)
+        self.assertTrue(all(topic['progress']['status'] == 'not_started' for topic in topics))
+        self.assertEqual(large_course['progress']['total_topics'], 50)
+
+        # Later opens: purchase, summary, syllabi, topics and progress
+        with self.assertNumQueries(5):
+            self.get_details(small)
+        with self.assertNumQueries(5):
+            self.get_details(large)
+
+
+class EnrolledStudentsCounterTests(TestCase):
+    """Completed purchases keep enrolled_students current, and listings read it"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Security')
+        self.program = make_program(self.category, 'Pentesting')
+        self.advanced = AdvanceProgram.objects.create(
+            title='Red Teaming', batch_starts='Soon', available_slots=10, duration='12 weeks',
+            job_openings='1K', global_market_size='1B', avg_annual_salary='1L', price=100,
+        )
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+
+    def enrolled(self):
+        self.program.refresh_from_db()
+        self.advanced.refresh_from_db()
+        return self.program.enrolled_students, self.advanced.enrolled_students
+
+    def test_follows_purchase_status(self):
+        purchase = UserPurchase.objects.create(user=self.user, program_type='program', program=self.program)
+        self.assertEqual(self.enrolled(), (0, 0))
+
+        purchase.status = 'completed'
+        purchase.save()
+        self.assertEqual(self.enrolled(), (1, 0))
+        # Saving a completed purchase again counts it once
+        purchase.save()
+        self.assertEqual(self.enrolled(), (1, 0))
+
+        purchase.status = 'cancelled'
+        purchase.save()
+        self.assertEqual(self.enrolled(), (0, 0))
+
+    def test_follows_a_completed_purchase_to_another_program(self):
+        purchase = UserPurchase.objects.create(
+            user=self.user, program_type='program', program=self.program, status='completed'
+        )
+        purchase.program_type, purchase.program, purchase.advanced_program = 'advanced_program', None, self.advanced
+        purchase.save()
+        self.assertEqual(self.enrolled(), (0, 1))
+
+    def test_deleting_releases_the_enrollment(self):
+        UserPurchase.objects.create(user=self.user, program_type='program', program=self.program, status='completed')
+        UserPurchase.objects.create(
+            user=self.user, program_type='advanced_program', advanced_program=self.advanced, status='completed'
+        )
+        UserPurchase.objects.filter(program=self.program).delete()
+        self.assertEqual(self.enrolled(), (0, 1))
+        # Cascades from the user count too
+        self.user.delete()
+        self.assertEqual(self.enrolled(), (0, 0))
+
+    def test_never_goes_negative(self):
+        purchase = UserPurchase.objects.create(
+            user=self.user, program_type='program', program=self.program, status='completed'
+        )
+        Program.objects.filter(pk=self.program.pk).update(enrolled_students=0)
+        purchase.delete()
+        self.assertEqual(self.enrolled(), (0, 0))
+
+    def test_listing_queries_do_not_grow_with_programs(self):
+        def list_programs():
+            # Every call rereads the catalog version, however long the previous one took
+            cache.clear()
+            forget_database_watermark()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/programs/filter')
+            self.assertEqual(response.status_code, 200)
+            return response.json()['programs'], len(queries)
+
+        UserPurchase.objects.create(user=self.user, program_type='program', program=self.program, status='completed')
+        # The first request also creates the catalog version row
+        list_programs()
+        _, few = list_programs()
+        for i in range(5):
+            program = make_program(self.category, f'Forensics {i}')
+            UserPurchase.objects.create(user=self.user, program_type='program', program=program, status='completed')
+        programs, many = list_programs()
+        self.assertEqual(few, many)
+        self.assertEqual({program['enrolled_students'] for program in programs if program['type'] == 'program'}, {1})
+
+
+class CatalogCacheInvalidationTests(TestCase):
+    """Cached facets and syllabus trees follow writes made by any worker"""
+
+    def setUp(self):
+        cache.clear()
+        forget_database_watermark()
+        self.builds = 0
+
+    def build(self, **kwargs):
+        self.builds += 1
+        return {'builds': self.builds}
+
+    def build_trees(self, program, program_type):
+        self.builds += 1
+        return {'locked': self.builds, 'unlocked': self.builds}
+
+    def test_facets_follow_a_version_bumped_by_another_worker(self):
+        # The test settings use LocMemCache, whose entries other workers can't see
+        self.assertTrue(version_in_database())
+        self.assertEqual(get_facets({'category': 'all'}, self.build), {'builds': 1})
+        self.assertEqual(get_facets({'category': 'all'}, self.build), {'builds': 1})
+
+        # What a commit in another process leaves behind: only the row moved
+        CatalogVersion.objects.filter(pk=1).update(version=models.F('version') + 1)
+        self.assertEqual(get_facets({'category': 'all'}, self.build), {'builds': 1})
+        # Seen once this process rereads the row, after CATALOG_VERSION_TTL
+        with mock.patch('topgrade_api.catalog_cache.time.monotonic', return_value=time.monotonic() + 2):
+            self.assertEqual(get_facets({'category': 'all'}, self.build), {'builds': 2})
+
+    # Frozen, so the memoized version can't expire between requests
+    @mock.patch('topgrade_api.catalog_cache.time.monotonic', return_value=1000.0)
+    def test_landing_reads_the_version_at_most_once(self, monotonic):
+        make_program(Category.objects.create(name='Design'), 'Typography')
+        self.client.get('/api/landing')
+        # Snapshot and version cached: nothing left to query
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/landing').status_code, 200)
+        # The ETag and the snapshot share one read of the row
+        forget_database_watermark()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/landing').status_code, 200)
+
+    def test_syllabus_tree_follows_topic_edits(self):
+        program = make_program(Category.objects.create(name='Design'), 'Typography')
+        syllabus = Syllabus.objects.create(program=program, module_title='Basics')
+        topic = Topic.objects.create(syllabus=syllabus, topic_title='Kerning')
+        program.refresh_from_db()
+        self.assertEqual(get_syllabus_tree(program, 'program', False, self.build_trees), 1)
+        self.assertEqual(get_syllabus_tree(program, 'program', True, self.build_trees), 1)
+
+        topic.topic_title = 'Tracking'
+        topic.save()
+        program.refresh_from_db()
+        self.assertEqual(get_syllabus_tree(program, 'program', False, self.build_trees), 2)
+
+    def test_enrollments_keep_the_syllabus_tree_but_move_the_etag(self):
+        program = make_program(Category.objects.create(name='Design'), 'Typography')
+        Syllabus.objects.create(program=program, module_title='Basics')
+        # Caches the syllabus tree
+        url = f'/api/program/program/{program.pk}/details'
+        etag = self.client.get(url)['ETag']
+
+        user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        with self.captureOnCommitCallbacks(execute=True):
+            UserPurchase.objects.create(user=user, program_type='program', program=program, status='completed')
+        program.refresh_from_db()
+        self.assertEqual(program.enrolled_students, 1)
+        get_syllabus_tree(program, 'program', False, self.build_trees)
+        self.assertEqual(self.builds, 0)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['program']['enrolled_students'], 1)
+
+
+class ProgramListingCursorTests(TestCase):
+    """/api/programs/filter pages through the catalog with keyset cursors"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Data')
+        # Three prices shared by regular and advanced programs, so most rows tie on the sort key
+        for i in range(7):
+            make_program(category, f'Program {i}', price=100 * (i % 3 + 1))
+        for i in range(4):
+            AdvanceProgram.objects.create(
+                title=f'Advanced {i}', batch_starts='Soon', available_slots=10, duration='12 weeks',
+                job_openings='1K', global_market_size='1B', avg_annual_salary='1L', price=100 * (i % 3 + 1),
+            )
+
+    def listing(self, **params):
+        response = self.client.get('/api/programs/filter', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, **params):
+        """Every (type, id) of a listing, a page of `limit` at a time"""
+        seen, cursor = [], None
+        while True:
+            page = self.listing(**params, **({'cursor': cursor} if cursor else {}))
+            seen += [(program['type'], program['id']) for program in page['programs']]
+            cursor = page['pagination']['next_cursor']
+            self.assertEqual(page['pagination']['has_more'], cursor is not None)
+            if cursor is None:
+                return seen
+
+    def test_pages_round_trip_to_the_full_listing(self):
+        for sort_by, sort_order in [('price', 'asc'), ('price', 'desc'), ('title', 'asc'), ('most_relevant', 'asc')]:
+            full = self.listing(sort_by=sort_by, sort_order=sort_order, limit=100)
+            expected = [(program['type'], program['id']) for program in full['programs']]
+            self.assertEqual(len(expected), 11)
+            for limit in (1, 2, 4):
+                with self.subTest(sort_by=sort_by, sort_order=sort_order, limit=limit):
+                    self.assertEqual(self.walk(sort_by=sort_by, sort_order=sort_order, limit=limit), expected)
+
+    def test_ties_break_on_regular_before_advanced_then_id(self):
+        programs = self.listing(sort_by='price', sort_order='asc', limit=100)['programs']
+        keys = [
+            (program['pricing']['original_price'], program['type'] != 'program', program['id'])
+            for program in programs
+        ]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_rejects_a_cursor_from_another_sort(self):
+        cursor = self.listing(sort_by='price', limit=2)['pagination']['next_cursor']
+        response = self.client.get('/api/programs/filter', {'sort_by': 'title', 'limit': 2, 'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/programs/filter', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_a_tampered_cursor(self):
+        sort_keys = get_sort_keys('price', 'asc')
+        forged = encode_cursor(sort_keys, ['cheap', 0, 1])
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(forged, sort_keys)
+        response = self.client.get('/api/programs/filter', {'sort_by': 'price', 'cursor': forged})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogQueryTests(TestCase):
+    """CatalogQuery lists both program tables as one UNION ALL"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Finance')
+        self.programs = [
+            make_program(category, 'Accounting', price=1000, discount_percentage=15, program_rating=4.5),
+            make_program(category, 'Auditing', price=800, program_rating=4.0, is_best_seller=True),
+            make_program(category, 'Tax', price=900, discount_percentage=10),
+        ]
+        self.advanced = [
+            AdvanceProgram.objects.create(
+                title=f'Advanced {price}', batch_starts='Soon', available_slots=10, duration='12 weeks',
+                job_openings='1K', global_market_size='1B', avg_annual_salary='1L', price=price,
+                discount_percentage=discount, program_rating=4.8,
+            )
+            for price, discount in [(850, 0), (1200, 25), (810, 0)]
+        ]
+
+    def test_rows_render_like_program_cards(self):
+        cards = {
+            (program_type, program.id): serialize_program_card(program, program_type)
+            for program_type, programs in (('program', self.programs), ('advanced_program', self.advanced))
+            for program in programs
+        }
+        rows = CatalogQuery().rows()
+        self.assertEqual(len(rows), 6)
+        for row in rows:
+            card = serialize_catalog_row(row)
+            self.assertEqual(card, cards[(card['type'], card['id'])])
+
+    def test_sorts_on_computed_columns_in_one_query(self):
+        with self.assertNumQueries(1):
+            rows, next_cursor = CatalogQuery().page(get_sort_keys('discounted_price', 'asc'), limit=4)
+        self.assertEqual(
+            [(row['program_type'], row['id']) for row in rows],
+            # 800, then a tie at 810 broken by type, then 850
+            [('program', self.programs[1].id), ('program', self.programs[2].id),
+             ('advanced_program', self.advanced[2].id), ('program', self.programs[0].id)],
+        )
+        self.assertIsNotNone(next_cursor)
+
+    def test_landing_sections_take_the_top_of_each_table(self):
+        sections = build_landing_sections()
+        self.assertEqual(
+            [(card['type'], card['id']) for card in sections['recently_added']],
+            [('program', program.id) for program in reversed(self.programs)] +
+            [('advanced_program', program.id) for program in reversed(self.advanced[1:])],
+        )
+        self.assertEqual(
+            [card['id'] for card in sections['top_course']],
+            [self.programs[0].id, self.programs[1].id] + [program.id for program in reversed(self.advanced[1:])],
+        )
+
+
+class FastJSONRendererTests(TestCase):
+    """FastJSONRenderer writes what the views' own JSON and Ninja's renderer would"""
+
+    def render(self, data):
+        return json.loads(FastJSONRenderer().render(None, data, response_status=200))
+
+    def test_renders_rich_types(self):
+        moment = timezone.now()
+        data = {
+            'at': moment, 'day': moment.date(), 'price': Decimal('99.50'), 'ids': {1: 'one'},
+            'label': lazy(lambda: 'Lazy', str)(),
+        }
+        self.assertEqual(self.render(data), {
+            'at': moment.isoformat(), 'day': moment.date().isoformat(), 'price': '99.50', 'ids': {'1': 'one'},
+            'label': 'Lazy',
+        })
+
+    def test_endpoints_match_the_stock_renderer(self):
+        category = Category.objects.create(name='Cloud')
+        make_program(category, 'Kubernetes', price=Decimal('1999.99'), discount_percentage=Decimal('12.5'))
+        for url in ('/api/landing', '/api/programs/filter', '/api/categories'):
+            with self.subTest(url=url):
+                cache.clear()
+                fast = self.client.get(url)
+                cache.clear()
+                with mock.patch('topgrade_api.renderers.orjson', None):
+                    stock = self.client.get(url)
+                self.assertEqual(fast['Content-Type'], stock['Content-Type'])
+                self.assertEqual(fast.json(), stock.json())
+
+    def test_falls_back_without_orjson(self):
+        data = {'price': Decimal('1.10'), 'day': datetime.date(2024, 1, 2)}
+        with mock.patch('topgrade_api.renderers.orjson', None):
+            rendered = FastJSONRenderer().render(None, data, response_status=200)
+        self.assertEqual(rendered, JSONRenderer().render(None, data, response_status=200))
+
+
+class ProgramSearchTests(TestCase):
+    """Searching /api/programs/filter ranks title matches above syllabus matches"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Software')
+        # The index follows commits, which a TestCase never makes, so run the hooks now
+        with self.captureOnCommitCallbacks(execute=True):
+            self.titled = make_program(category, 'Python for Analysts')
+            self.described = make_program(category, 'Analytics', description='Uses python throughout')
+            self.syllabus_only = make_program(category, 'Data Engineering')
+            syllabus = Syllabus.objects.create(program=self.syllabus_only, module_title='Tooling')
+            Topic.objects.create(syllabus=syllabus, topic_title='Scripting in Python')
+            make_program(category, 'Design Systems')
+
+    def search(self, text):
+        response = self.client.get('/api/programs/filter', {'search': text, 'program_type': 'program'})
+        self.assertEqual(response.status_code, 200)
+        return [program['id'] for program in response.json()['programs']]
+
+    def test_ranks_title_matches_first(self):
+        self.assertIsInstance(get_search_backend(), SQLiteFTS5Backend)
+        results = self.search('python')
+        self.assertEqual(results[0], self.titled.id)
+        self.assertEqual(set(results), {self.titled.id, self.described.id, self.syllabus_only.id})
+
+    def test_matches_prefixes_and_ignores_punctuation(self):
+        self.assertEqual(set(self.search('pyth')), {self.titled.id, self.described.id, self.syllabus_only.id})
+        self.assertEqual(self.search('analysts, python!'), [self.titled.id])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_index_follows_syllabus_edits(self):
+        topic = Topic.objects.get(syllabus__program=self.syllabus_only)
+        with self.captureOnCommitCallbacks(execute=True):
+            topic.topic_title = 'Scripting in Rust'
+            topic.save()
+        self.assertNotIn(self.syllabus_only.id, self.search('python'))
+
+    def test_index_follows_moved_topics(self):
+        topic = Topic.objects.get(syllabus__program=self.syllabus_only)
+        with self.captureOnCommitCallbacks(execute=True):
+            syllabus = Syllabus.objects.create(program=self.titled, module_title='Extras')
+            topic.syllabus = syllabus
+            topic.save()
+        self.assertEqual(self.search('scripting'), [self.titled.id])
+
+    def test_like_fallback_matches_without_ranking(self):
+        matches = LikeSearchBackend().apply(Program.objects.all(), 'program', 'python')
+        self.assertEqual(
+            {program.id: program.search_rank for program in matches},
+            {self.titled.id: 0.0, self.described.id: 0.0, self.syllabus_only.id: 0.0},
+        )
+
+
+class ColumnarCatalogParityTestsMixin:
+    """A columnar catalog lists programs exactly like the database does"""
+
+    def setUp(self):
+        self.categories = [Category.objects.create(name='Design'), Category.objects.create(name='Data')]
+        # Few distinct values per column, so most sorts have to break ties
+        for i in range(9):
+            make_program(
+                self.categories[i % 2], f'Program {i % 4}', price=100 * (i % 3 + 1), discount_percentage=5 * (i % 4),
+                program_rating=Decimal('3.5') + Decimal(i % 3) / 2, is_best_seller=i % 4 == 0,
+            )
+        for i in range(5):
+            AdvanceProgram.objects.create(
+                title=f'Advanced {i % 2}', batch_starts='Soon', available_slots=10 + i, duration='12 weeks',
+                job_openings='1K', global_market_size='1B', avg_annual_salary='1L', price=100 * (i % 3 + 1),
+                discount_percentage=10 * (i % 2), program_rating=Decimal('4.0') + Decimal(i % 2) / 2,
+                is_best_seller=i % 2 == 0,
+            )
+        self.catalog = self.load(version=1)
+
+    def walk(self, list_page, sort_keys, **listing):
+        """Counts and every card of a listing, three at a time"""
+        cards, cursor_values = [], None
+        while True:
+            counts, page, next_cursor = list_page(sort_keys=sort_keys, cursor_values=cursor_values, limit=3, **listing)
+            cards += page
+            if next_cursor is None:
+                return counts, cards
+            cursor_values = decode_cursor(next_cursor, sort_keys)
+
+    def test_listings_match_the_database(self):
+        filter_sets = [
+            {}, {'min_price': 150}, {'max_price': 200, 'min_rating': 4.0}, {'is_best_seller': True},
+            {'category_id': self.categories[0].id},
+        ]
+        for program_types in (['program', 'advanced_program'], ['advanced_program']):
+            for sort_by in SORT_OPTIONS:
+                for sort_order in ('asc', 'desc'):
+                    for filters in filter_sets:
+                        with self.subTest(program_types=program_types, sort_by=sort_by, sort_order=sort_order,
+                                          **filters):
+                            sort_keys = get_sort_keys(sort_by, sort_order)
+                            listing = dict(program_types=program_types, **filters)
+                            self.assertEqual(
+                                self.walk(self.catalog.list_programs, sort_keys, **listing),
+                                self.walk(list_programs, sort_keys, **listing),
+                            )
+
+    def test_landing_sections_match_the_database(self):
+        self.assertEqual(self.catalog.landing_sections(), build_landing_sections())
+
+    def test_looks_up_single_cards(self):
+        program = Program.objects.order_by('id').last()
+        self.assertEqual(self.catalog.program_card('program', program.id), serialize_program_card(program, 'program'))
+        self.assertIsNone(self.catalog.program_card('advanced_program', program.id + 100))
+
+
+@skipIf(np is None, "NumPy is not installed")
+class MemoryCatalogParityTests(ColumnarCatalogParityTestsMixin, TestCase):
+    def load(self, version):
+        return MemoryCatalog.load(version)
+
+    @override_settings(CATALOG_ENGINE='memory')
+    def test_engine_without_numpy_is_a_configuration_error(self):
+        with mock.patch('topgrade_api.catalog_engine.np', None), \
+                mock.patch('topgrade_api.catalog_engine._engine', None):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'pip install numpy'):
+                get_catalog_engine()
+
+
+@skipIf(np is None, "NumPy is not installed")
+class MappedCatalogParityTests(ColumnarCatalogParityTestsMixin, TestCase):
+    def load(self, version):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'catalog.snapshot')
+        write_snapshot(path, version)
+        return MappedCatalog.open(path)
+
+
+class OTPStoreTestsMixin:
+    """Challenges expire after their lifetime and authorize exactly one action"""
+
+    def later(self, seconds):
+        now = timezone.now() + datetime.timedelta(seconds=seconds)
+        return mock.patch('topgrade_api.otp_store.timezone.now', return_value=now)
+
+    def test_challenge_expires(self):
+        self.store.issue('learner@example.com')
+        self.assertFalse(self.store.get('learner@example.com').verified)
+        with self.later(self.store.lifetime + 1):
+            self.assertFalse(self.store.mark_verified('learner@example.com'))
+            self.assertFalse(self.store.consume('learner@example.com'))
+
+    def test_consumed_once(self):
+        self.store.issue('learner@example.com')
+        self.assertFalse(self.store.consume('learner@example.com', verified_only=True))
+        self.assertTrue(self.store.mark_verified('learner@example.com'))
+        self.assertTrue(self.store.consume('learner@example.com', verified_only=True))
+        self.assertFalse(self.store.consume('learner@example.com', verified_only=True))
+        self.assertIsNone(self.store.get('learner@example.com'))
+
+    def test_reissued_challenge_starts_unverified(self):
+        self.store.issue('learner@example.com')
+        self.store.mark_verified('learner@example.com')
+        self.store.issue('learner@example.com')
+        self.assertFalse(self.store.get('learner@example.com').verified)
+        self.assertFalse(self.store.consume('learner@example.com', verified_only=True))
+
+
+class CacheOTPStoreTests(OTPStoreTestsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = CacheOTPStore('password_reset', 600, cache)
+
+
+class DatabaseOTPStoreTests(OTPStoreTestsMixin, TestCase):
+    def setUp(self):
+        self.store = DatabaseOTPStore('password_reset', 600, OTPVerification, 'email')
+
+    def test_purge_expired(self):
+        self.store.issue('learner@example.com')
+        self.assertEqual(self.store.purge_expired(), 0)
+        with self.later(self.store.lifetime + 1):
+            self.assertEqual(self.store.purge_expired(), 1)
+
+
+class RateLimitTests(TestCase):
+    """Sliding-window limits reject over-limit requests without counting them"""
+
+    def setUp(self):
+        cache.clear()
+        # The start of a window, 3 requests per 60 seconds
+        self.start = 6000.0
+
+    def hits(self, *offsets):
+        return [hit(cache, 'ratelimit:test', 3, 60, now=self.start + offset) for offset in offsets]
+
+    def test_rejects_over_the_limit_until_the_window_rolls_over(self):
+        self.assertEqual(self.hits(0, 1, 2), [0, 0, 0])
+        self.assertEqual(self.hits(3), [57])
+        # Right after the rollover the previous window still counts in full
+        self.assertGreater(self.hits(60)[0], 0)
+
+    def test_retrying_client_is_admitted_once_the_window_slides(self):
+        self.hits(0, 1, 2)
+        rejected = self.hits(*range(3, 80))
+        self.assertTrue(all(rejected))
+        # A third of the previous window has slid out: 2 of its 3 requests plus this one
+        self.assertEqual(self.hits(80), [0])
+        self.assertGreater(self.hits(81)[0], 0)
+
+    def test_windows_reset(self):
+        self.hits(0, 1, 2, 3)
+        self.assertEqual(self.hits(120, 121, 122), [0, 0, 0])
+        self.assertGreater(self.hits(123)[0], 0)
+
+    @override_settings(RATE_LIMITS={'signin': [('email', 2, 60)]})
+    def test_endpoint_answers_429_per_identifier(self):
+        def signin(email):
+            return self.client.post(
+                '/api/auth/signin', {'email': email, 'password': 'wrong'}, content_type='application/json'
+            )
+
+        for _ in range(2):
+            self.assertNotEqual(signin('learner@example.com').status_code, 429)
+        response = signin(' Learner@Example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertNotEqual(signin('other@example.com').status_code, 429)
+
+
+class UserCacheTests(TestCase):
+    """API authentication serves users from the per-process cache until they change"""
+
+    def setUp(self):
+        # Rolled back ids are reused, so no test may see another's cached users
+        user_cache.clear()
+        revocation_store.reset()
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+
+    def user_queries(self, refresh):
+        """Status of a /my-learnings call and how many queries it made against the user table"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/my-learnings', HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        table = CustomUser._meta.db_table
+        return response.status_code, sum(table in query['sql'] for query in queries)
+
+    def test_caches_the_user_between_requests(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.assertEqual(self.user_queries(refresh), (200, 1))
+        self.assertEqual(self.user_queries(refresh), (200, 0))
+
+    def test_saving_or_deleting_the_user_drops_the_entry(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.user_queries(refresh)
+
+        self.user.fullname = 'Ada Lovelace'
+        self.user.save()
+        self.assertIsNone(user_cache.get(self.user.pk))
+        self.assertEqual(self.user_queries(refresh), (200, 1))
+        self.assertEqual(CustomUser.from_db('default', *user_cache.get(self.user.pk)).fullname, 'Ada Lovelace')
+
+        self.user.delete()
+        self.assertEqual(self.user_queries(refresh)[0], 401)
+
+    def test_cached_records_rebuild_the_user(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.user_queries(refresh)
+        # What views get as request.auth: every field outside the record is deferred
+        user = CustomUser.from_db('default', *user_cache.get(self.user.pk))
+        self.assertEqual((user.email, user.is_superuser, user.is_staff), ('learner@example.com', False, False))
+        user.area_of_intrest = 'Data'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.area_of_intrest, 'Data')
+        self.assertTrue(self.user.check_password('secret'))
+
+    @override_settings(JWT_USER_CLAIMS=True)
+    def test_tokens_with_user_claims_skip_the_database(self):
+        self.assertEqual(self.user_queries(issue_refresh_token(self.user)), (200, 0))
+
+
+class PhoneUserProvisioningTests(TestCase):
+    """Phone sign-in creates at most one user per number"""
+
+    def test_creates_once_then_fetches(self):
+        user, created = CustomUser.objects.get_or_create_phone_user('9876543210', fullname='98******10')
+        self.assertTrue(created)
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(CustomUser.objects.get_or_create_phone_user('9876543210'), (user, False))
+
+    def test_losing_a_race_returns_the_winners_user(self):
+        winner, _ = CustomUser.objects.get_or_create_phone_user('9876543210')
+        # A concurrent sign-in that looked the number up before the winner committed
+        with mock.patch.object(CustomUser.objects, 'filter', return_value=CustomUser.objects.none()):
+            user, created = CustomUser.objects.get_or_create_phone_user('9876543210')
+        self.assertEqual((user, created), (winner, False))
+        self.assertEqual(CustomUser.objects.filter(phone_number='9876543210').count(), 1)
+
+    def test_blank_numbers_do_not_conflict(self):
+        for email in ('first@example.com', 'second@example.com'):
+            CustomUser.objects.create_user(email=email, password='secret', phone_number='')
+        self.assertEqual(CustomUser.objects.filter(phone_number__isnull=True).count(), 2)
+
+    def test_signin_endpoint_provisions_one_user(self):
+        cache.clear()
+        for created in (True, False):
+            self.client.post('/api/auth/request-phone-otp', {'phone_number': '9876543210'}, content_type='application/json')
+            response = self.client.post(
+                '/api/auth/phone-signin', {'phone_number': '9876543210', 'otp': '654321'},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['message'].startswith('User created'), created)
+        self.assertEqual(CustomUser.objects.filter(phone_number='9876543210').count(), 1)
+
+
+class SignoutRevocationTests(TestCase):
+    """Signing out revokes the session's refresh and access tokens"""
+
+    def setUp(self):
+        # The Bloom filter outlives each test's rolled back RevokedToken rows
+        revocation_store.reset()
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = str(self.refresh.access_token)
+
+    def my_learnings(self):
+        return self.client.get('/api/my-learnings', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def post(self, path, body, access=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {access}'} if access else {}
+        return self.client.post(path, body, content_type='application/json', **headers)
+
+    def test_signout_revokes_both_tokens(self):
+        self.assertEqual(self.my_learnings().status_code, 200)
+        response = self.post('/api/auth/signout', {'refresh_token': str(self.refresh)}, self.access)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.post('/api/auth/refresh', {'refresh_token': str(self.refresh)}).status_code, 401)
+        self.assertEqual(self.my_learnings().status_code, 401)
+
+    def test_rotated_refresh_token_is_single_use(self):
+        response = self.post('/api/auth/refresh', {'refresh_token': str(self.refresh)})
+        self.assertEqual(response.status_code, 200)
+        rotated = response.json()['refresh_token']
+        self.assertEqual(self.post('/api/auth/refresh', {'refresh_token': str(self.refresh)}).status_code, 401)
+        self.assertEqual(self.post('/api/auth/refresh', {'refresh_token': rotated}).status_code, 200)
+
+    def test_honours_revocations_from_other_workers(self):
+        self.assertEqual(self.my_learnings().status_code, 200)
+        # Written by another process after this one's filter was synced
+        RevokedToken.objects.create(jti=self.refresh['jti'], expires_at=timezone.now() + datetime.timedelta(days=1))
+        self.assertEqual(self.post('/api/auth/refresh', {'refresh_token': str(self.refresh)}).status_code, 401)
+
+    def test_cannot_sign_out_another_users_session(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='secret')
+        other_access = str(RefreshToken.for_user(other).access_token)
+        response = self.post('/api/auth/signout', {'refresh_token': str(self.refresh)}, other_access)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.post('/api/auth/refresh', {'refresh_token': str(self.refresh)}).status_code, 200)
+
+
+class AsyncEndpointTests(TestCase):
+    """/purchase and /bookmarks run on the event loop under ASGI"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        revocation_store.reset()
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        self.headers = {'AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.program = make_program(Category.objects.create(name='Cloud'), 'Kubernetes', discount_percentage=10)
+        self.advanced = AdvanceProgram.objects.create(
+            title='Platform Engineering', batch_starts='Soon', available_slots=10, duration='12 weeks',
+            job_openings='1K', global_market_size='1B', avg_annual_salary='1L', price=300,
+        )
+
+    async def purchase(self, payment_succeeds=True):
+        """The response and how many times the payment gateway awaited its delay"""
+        with mock.patch('topgrade_api.views.asyncio.sleep', new=mock.AsyncMock()) as sleep, \
+                mock.patch('topgrade_api.views.random.random', return_value=0.0 if payment_succeeds else 1.0), \
+                mock.patch('topgrade_api.views.print', create=True):
+            response = await self.async_client.post(
+                '/api/purchase', {'program_type': 'program', 'program_id': self.program.pk},
+                content_type='application/json', headers=self.headers,
+            )
+        return response, sleep.await_count
+
+    async def test_purchase(self):
+        response, delays = await self.purchase()
+        self.assertEqual(response.status_code, 200)
+        # Waiting on the gateway yields the event loop rather than a worker thread
+        self.assertEqual(delays, 1)
+        self.assertEqual(response.json()['pricing']['discounted_price'], 90.0)
+        program = await Program.objects.aget(pk=self.program.pk)
+        self.assertEqual(program.enrolled_students, 1)
+
+        response, _ = await self.purchase()
+        self.assertEqual(response.status_code, 400)
+
+    async def test_failed_payment_creates_no_purchase(self):
+        response, _ = await self.purchase(payment_succeeds=False)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await UserPurchase.objects.filter(user=self.user).aexists())
+
+    async def test_rejects_invalid_tokens(self):
+        response = await self.async_client.get('/api/bookmarks', headers={'AUTHORIZATION': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_bookmarks_are_the_same_from_the_catalog_engine(self):
+        UserBookmark.objects.create(user=self.user, program_type='program', program=self.program)
+        UserBookmark.objects.create(user=self.user, program_type='advanced_program', advanced_program=self.advanced)
+
+        def bookmarks():
+            response = async_to_sync(self.async_client.get)('/api/bookmarks', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        from_database = bookmarks()
+        self.assertEqual(
+            [bookmark['program']['title'] for bookmark in from_database['bookmarks']],
+            ['Platform Engineering', 'Kubernetes'],
+        )
+        if np is not None:
+            with override_settings(CATALOG_ENGINE='memory'), mock.patch('topgrade_api.catalog_engine._engine', None):
+                self.assertEqual(bookmarks(), from_database)
+
+
+class CourseSummaryDeltaTests(TestCase):
+    """UserCourseProgress.apply_deltas() derives the completion fields in the same UPDATE"""
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        purchase = UserPurchase.objects.create(
+            user=user, program_type='program', program=make_program(Category.objects.create(name='Ops'), 'SRE'),
+            status='completed'
+        )
+        self.summary = UserCourseProgress.objects.create(user=user, purchase=purchase, total_topics=4)
+
+    def apply(self, **deltas):
+        UserCourseProgress.apply_deltas(self.summary.purchase_id, **deltas)
+        self.summary.refresh_from_db()
+        return self.summary
+
+    def test_completes_with_the_last_topic(self):
+        summary = self.apply(completed=1, in_progress=1, watch_time=600)
+        self.assertEqual(summary.completion_percentage, 25)
+        self.assertIsNotNone(summary.started_at)
+        self.assertFalse(summary.is_completed)
+
+        summary = self.apply(completed=3, in_progress=-1)
+        self.assertEqual((summary.completed_topics, summary.in_progress_topics), (4, 0))
+        self.assertEqual(summary.completion_percentage, 100)
+        self.assertTrue(summary.is_completed)
+        completed_at = summary.completed_at
+        self.assertIsNotNone(completed_at)
+
+        # Staying complete keeps the original completion time
+        self.assertEqual(self.apply(watch_time=60).completed_at, completed_at)
+
+    def test_growing_syllabus_reopens_a_completed_course(self):
+        self.apply(completed=4)
+        summary = self.apply(topics=1)
+        self.assertEqual(summary.total_topics, 5)
+        self.assertEqual(summary.completion_percentage, 80)
+        self.assertFalse(summary.is_completed)
+        self.assertIsNone(summary.completed_at)
+
+        summary = self.apply(completed=1)
+        self.assertTrue(summary.is_completed)
+        self.assertIsNotNone(summary.completed_at)
+
+    def test_uncompleting_a_topic_reopens_the_course(self):
+        self.apply(completed=4)
+        summary = self.apply(completed=-1, in_progress=1)
+        self.assertEqual(summary.completion_percentage, 75)
+        self.assertFalse(summary.is_completed)
+        self.assertIsNone(summary.completed_at)
+
+    def test_counters_are_clamped_at_zero(self):
+        summary = self.apply(completed=-2, watch_time=-100)
+        self.assertEqual((summary.completed_topics, summary.total_watch_time_seconds), (0, 0))
+        self.assertEqual(summary.completion_percentage, 0)
+
+
+class BatchProgressTests(TestCase):
+    """POST /api/learning/update-progress/batch upserts every topic once, newest client_ts last"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        category = Category.objects.create(name='Engineering')
+        program = make_program(category, 'Backend')
+        syllabus = Syllabus.objects.create(program=program, module_title='Module')
+        self.topics = [Topic.objects.create(syllabus=syllabus, topic_title=f'Topic {i}') for i in range(3)]
+        self.purchase = UserPurchase.objects.create(
+            user=self.user, program_type='program', program=program, status='completed'
+        )
+        other = Syllabus.objects.create(program=make_program(category, 'Not purchased'), module_title='Module')
+        self.locked_topic = Topic.objects.create(syllabus=other, topic_title='Locked')
+
+    def post(self, path, body):
+        response = self.client.post(path, body, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def update(self, topic, watch_time, client_ts=None, **fields):
+        return {
+            'topic_id': topic.id, 'topic_type': 'topic', 'watch_time_seconds': watch_time,
+            'total_duration_seconds': 1000, **({'client_ts': client_ts} if client_ts else {}), **fields,
+        }
+
+    def test_upserts_in_client_ts_order(self):
+        first, second, third = self.topics
+        self.post('/api/learning/update-progress', self.update(first, 100))
+
+        body = self.post('/api/learning/update-progress/batch', [
+            self.update(first, 950, '2026-01-01T10:05:00Z'),
+            self.update(first, 300, '2026-01-01T10:00:00Z'),
+            self.update(second, 200, '2026-01-01T10:01:00Z'),
+            self.update(self.locked_topic, 500),
+        ])
+        self.assertEqual(
+            {topic['topic_id']: topic['watch_time_seconds'] for topic in body['topics']},
+            {first.id: 950, second.id: 200},
+        )
+        self.assertEqual([rejected['topic_id'] for rejected in body['rejected']], [self.locked_topic.id])
+
+        rows = UserTopicProgress.objects.filter(user=self.user)
+        self.assertEqual({row.topic_id: (row.watch_time_seconds, row.status) for row in rows}, {
+            first.id: (950, 'completed'), second.id: (200, 'in_progress'),
+        })
+        self.assertFalse(rows.filter(topic=third).exists())
+
+        summary = UserCourseProgress.objects.get(purchase=self.purchase)
+        self.assertEqual((summary.total_topics, summary.completed_topics, summary.in_progress_topics), (3, 1, 1))
+        self.assertEqual(summary.total_watch_time_seconds, 1150)
+        self.assertEqual(body['courses'][0]['completed_topics'], 1)
+
+    @override_settings(PROGRESS_WRITE_BEHIND=True, PROGRESS_BUFFER='memory')
+    def test_builds_on_buffered_positions(self):
+        topic = self.topics[0]
+        buffer = MemoryProgressBuffer()
+        with mock.patch('topgrade_api.progress_buffer._buffer', buffer), \
+                mock.patch('topgrade_api.progress_buffer._flusher.ensure_started'):
+            self.post('/api/learning/update-progress', self.update(topic, 100))
+            # Only the position moves, so this one waits in the buffer
+            self.post('/api/learning/update-progress', self.update(topic, 300, total_duration_seconds=2000))
+            self.assertEqual(buffer.get(self.user.id, ('topic', topic.id))['watch_time_seconds'], 300)
+
+            body = self.post('/api/learning/update-progress/batch', [
+                {'topic_id': topic.id, 'topic_type': 'topic', 'watch_time_seconds': 500},
+            ])
+            self.assertEqual(body['topics'][0]['total_duration_seconds'], 2000)
+
+            # The batch superseded the buffered position, so flushing it changes nothing
+            self.assertEqual(flush(buffer), 0)
+
+        row = UserTopicProgress.objects.get(user=self.user, topic=topic)
+        self.assertEqual((row.watch_time_seconds, row.total_duration_seconds), (500, 2000))
+        summary = UserCourseProgress.objects.get(purchase=self.purchase)
+        self.assertEqual(summary.total_watch_time_seconds, 500)
+
+
+class RecountEnrollmentsTests(TestCase):
+    """recount_enrollments invalidates what a repaired counter was cached in"""
+
+    def setUp(self):
+        cache.clear()
+        self.program = make_program(Category.objects.create(name='Cloud'), 'Kubernetes')
+        Program.objects.filter(pk=self.program.pk).update(enrolled_students=5)
+
+    def test_repair_moves_the_etags(self):
+        urls = ['/api/landing', f'/api/program/program/{self.program.pk}/details']
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        for url in urls:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recount_enrollments', stdout=io.StringIO())
+        self.program.refresh_from_db()
+        self.assertEqual(self.program.enrolled_students, 0)
+
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etags[url])
+
+
+@override_settings(PASSWORD_HASHERS=[
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+])
+class PooledSigninTests(TestCase):
+    """Sign-ins hash on the bounded pool, shed load with a 503 and upgrade stale hashes"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+
+    def signin(self, password='secret'):
+        return self.client.post(
+            '/api/auth/signin', {'email': 'learner@example.com', 'password': password},
+            content_type='application/json'
+        )
+
+    def test_saturated_pool_answers_503(self):
+        pool = hashing.PasswordHashPool(workers=1, queue_size=0, timeout=5)
+        # Every slot taken, as by a burst of concurrent sign-ins
+        pool._slots.acquire()
+        with mock.patch.object(hashing, '_pool', pool), self.assertLogs('topgrade_api.hashing', 'WARNING'):
+            response = self.signin()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(pool.stats()['rejected'], 1)
+
+    def test_rehashes_outdated_passwords(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(password=make_password('secret', hasher='md5'))
+        self.assertEqual(self.signin().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.signin().status_code, 200)
+
+    def test_wrong_password_is_hashed_once(self):
+        with mock.patch('topgrade_api.hashing.verify_password', wraps=hashing.verify_password) as verify:
+            self.assertEqual(self.signin('wrong').status_code, 401)
+        self.assertEqual(verify.call_count, 1)
+
+    def test_sessions_of_the_previous_backend_stay_signed_in(self):
+        admin = CustomUser.objects.create_superuser(email='admin@example.com', password='secret')
+        self.client.force_login(admin, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get('/admin/').status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DashboardAuthTests(TestCase):
+    """Dashboard sessions resolve their admin from a cache that follows user changes"""
+
+    def setUp(self):
+        admin_cache.clear()
+        self.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='secret')
+
+    def signin(self, email='admin@example.com'):
+        return self.client.post('/dashboard/signin/', {'email': email, 'password': 'secret'})
+
+    def user_queries(self):
+        """Status of a dashboard page request and how many queries it made against the user table"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dashboard/programs/')
+        table = CustomUser._meta.db_table
+        return response.status_code, sum(table in query['sql'] for query in queries)
+
+    def test_cached_admin_costs_no_user_query(self):
+        self.assertRedirects(self.signin(), '/dashboard/', fetch_redirect_response=False)
+        self.assertEqual(self.client.session['_auth_user_backend'], 'topgrade_api.backends.AdminOnlyBackend')
+        self.assertEqual(self.user_queries(), (200, 1))
+        self.assertEqual(self.user_queries(), (200, 0))
+
+    def test_demoted_admin_is_signed_out(self):
+        self.signin()
+        self.user_queries()
+        self.admin.is_superuser = False
+        self.admin.save()
+        self.assertEqual(self.user_queries()[0], 302)
+
+    def test_rejects_learners(self):
+        CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        self.signin('learner@example.com')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportLearnersTests(TestCase):
+    """import_learners creates users and enrollments in chunks and can be run again"""
+
+    def setUp(self):
+        self.program = make_program(Category.objects.create(name='Data'), 'SQL')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(text)
+        return path
+
+    def run_import(self, path):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_learners', path, batch_size=2, workers=2, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_imports_csv(self):
+        path = self.write('cohort.csv', (
+            "email,fullname,phone_number,password,programs\n"
+            f"ada@example.com,Ada,9000000001,secret,{self.program.pk}\n"
+            "grace@example.com,Grace,,,\n"
+            "not-an-email,Nobody,,,\n"
+            f"alan@example.com,Alan,9000000001,secret,{self.program.pk}\n"
+            f"ada@example.com,Ada again,,,{self.program.pk}\n"
+            "linus@example.com,Linus,,,999\n"
+        ))
+        stdout, stderr = self.run_import(path)
+
+        self.assertIn("Imported 2 learners and 1 enrollments", stdout)
+        self.assertEqual(stderr.count('line '), 4)
+        ada = CustomUser.objects.get(email='ada@example.com')
+        self.assertTrue(ada.check_password('secret'))
+        self.assertEqual((ada.username, ada.phone_number), ('ada', '9000000001'))
+        self.assertFalse(CustomUser.objects.get(email='grace@example.com').has_usable_password())
+        self.assertTrue(UserPurchase.objects.filter(user=ada, program=self.program, status='completed').exists())
+        self.program.refresh_from_db()
+        self.assertEqual(self.program.enrolled_students, 1)
+
+    def test_rerun_skips_imported_learners(self):
+        path = self.write('cohort.jsonl', (
+            f'{{"email": "ada@example.com", "password": "secret", "programs": [{self.program.pk}]}}\n'
+            '{"email": "grace@example.com"}\n'
+            'not json\n'
+        ))
+        self.run_import(path)
+        stdout, stderr = self.run_import(path)
+
+        self.assertIn("Imported 0 learners and 0 enrollments", stdout)
+        self.assertIn("skipped 2 already registered and 1 invalid rows", stdout)
+        self.assertIn("line 3: invalid JSON", stderr)
+        self.assertEqual(UserPurchase.objects.count(), 1)
+        self.program.refresh_from_db()
+        self.assertEqual(self.program.enrolled_students, 1)
+
+
+class FlusherTests(TestCase):
+    """The flusher writes buffered positions, and gives up on ones that keep failing"""
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        program = make_program(Category.objects.create(name='Engineering'), 'Backend')
+        topic = Topic.objects.create(
+            syllabus=Syllabus.objects.create(program=program, module_title='Module'), topic_title='Topic'
+        )
+        purchase = UserPurchase.objects.create(user=user, program_type='program', program=program, status='completed')
+        self.row = UserTopicProgress.objects.create(
+            user=user, purchase=purchase, topic=topic, status='in_progress', watch_time_seconds=100,
+            total_duration_seconds=1000, completion_percentage=10,
+        )
+        self.buffer = MemoryProgressBuffer()
+        self.buffer.record(user.id, ('topic', topic.id), {
+            'purchase_id': purchase.id, 'watch_time_seconds': 300, 'total_duration_seconds': 1000,
+            'completion_percentage': 30, 'at': timezone.now(),
+        })
+        self.flusher = Flusher(interval=60)
+
+    def flush_now(self):
+        with mock.patch('topgrade_api.progress_buffer.get_progress_buffer', return_value=self.buffer):
+            self.flusher.flush_now()
+
+    def test_writes_buffered_positions(self):
+        self.flush_now()
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.watch_time_seconds, 300)
+        self.assertEqual(self.buffer.drain(), [])
+
+    @override_settings(PROGRESS_FLUSH_MAX_ATTEMPTS=3)
+    def test_drops_positions_after_repeated_failures(self):
+        with mock.patch('topgrade_api.progress_buffer._write', side_effect=RuntimeError("database is down")), \
+                self.assertLogs('topgrade_api.progress_buffer', 'ERROR') as logs:
+            for _ in range(2):
+                self.flush_now()
+                # Requeued for the next interval
+                self.assertEqual(len(self.buffer._dirty), 1)
+            self.flush_now()
+        self.assertEqual(self.buffer._dirty, set())
+        self.assertEqual(self.buffer.user_entries(self.row.user_id), {})
+        self.assertTrue(any('Dropped 1 buffered positions after 3 failed flushes' in line for line in logs.output))
+
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.watch_time_seconds, 100)
+
+
+class SparseTopicProgressTests(TestCase):
+    """Topic progress rows exist only for watched topics; the rest read as not_started"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = CustomUser.objects.create_user(email='learner@example.com', password='secret')
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        syllabus = Syllabus.objects.create(
+            program=make_program(Category.objects.create(name='Engineering'), 'Backend'), module_title='Module'
+        )
+        self.topics = [Topic.objects.create(syllabus=syllabus, topic_title=f'Topic {i}') for i in range(3)]
+        self.purchase = UserPurchase.objects.create(
+            user=self.user, program_type='program', program=syllabus.program, status='completed'
+        )
+
+    def course(self):
+        response = self.client.get(f'/api/learning/course/{self.purchase.id}', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        course = response.json()['course']
+        statuses = [
+            (topic['progress']['status'], topic['progress']['watch_time_seconds'])
+            for module in course['syllabus'] for topic in module['topics']
+        ]
+        return statuses, course['progress']
+
+    def watch(self, topic, seconds):
+        response = self.client.post('/api/learning/update-progress', {
+            'topic_id': topic.id, 'topic_type': 'topic', 'watch_time_seconds': seconds,
+            'total_duration_seconds': 1000,
+        }, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_watched_topics_get_rows(self):
+        statuses, progress = self.course()
+        self.assertEqual(statuses, [('not_started', 0)] * 3)
+        self.assertEqual(progress['total_topics'], 3)
+        self.assertFalse(UserTopicProgress.objects.exists())
+
+        self.watch(self.topics[1], 1000)
+        statuses, progress = self.course()
+        self.assertEqual(statuses, [('not_started', 0), ('completed', 1000), ('not_started', 0)])
+        self.assertEqual((progress['completed_topics'], progress['total_topics']), (1, 3))
+        self.assertEqual(UserTopicProgress.objects.count(), 1)
+
+    def test_prune_keeps_what_learners_see(self):
+        # What opening a course used to leave behind for every topic
+        UserTopicProgress.objects.bulk_create(
+            UserTopicProgress(user=self.user, purchase=self.purchase, topic=topic, total_duration_seconds=1800)
+            for topic in self.topics
+        )
+        self.watch(self.topics[0], 300)
+        before = self.course()
+
+        stdout = io.StringIO()
+        call_command('prune_untouched_progress', dry_run=True, stdout=stdout)
+        self.assertIn("Would delete 2 of 3 topic progress rows", stdout.getvalue())
+        self.assertEqual(UserTopicProgress.objects.count(), 3)
+
+        stdout = io.StringIO()
+        call_command('prune_untouched_progress', batch_size=1, stdout=stdout)
+        self.assertIn("3 -> 1 rows", stdout.getvalue())
+        self.assertEqual(
+            list(UserTopicProgress.objects.values_list('topic_id', 'status')), [(self.topics[0].id, 'in_progress')]
+        )
+        self.assertEqual(self.course(), before)
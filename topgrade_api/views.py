@@ -1,35 +1,37 @@
 from ninja import NinjaAPI
-from ninja.security import HttpBearer
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from ninja.decorators import decorate_view
 from django.contrib.auth import get_user_model
 from django.http import JsonResponse
-from .schemas import AreaOfInterestSchema, PurchaseSchema, BookmarkSchema, UpdateProgressSchema
+from .authentication import AsyncAuthBearer, AuthBearer
+from .schemas import (
+    AreaOfInterestSchema, PurchaseSchema, BookmarkSchema, UpdateProgressSchema, CategoriesResponseSchema,
+    LandingResponseSchema, ProgramListResponseSchema, ProgramDetailsResponseSchema, BookmarksResponseSchema,
+    MyLearningsResponseSchema, UpdateProgressResponseSchema, CourseLearningResponseSchema,
+    ProgressUpdateItemSchema, BatchUpdateProgressResponseSchema
+)
 from .models import Program, AdvanceProgram, Category, UserPurchase, UserBookmark, UserCourseProgress, UserTopicProgress
-from django.db import models
+from .catalog import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, build_landing_sections, count_facets, decode_cursor,
+    get_sort_keys, list_programs, serialize_program_card, serialize_syllabus_trees
+)
+from .catalog_cache import get_facets, get_landing_snapshot, get_syllabus_tree
+from .catalog_engine import get_catalog_engine
+from .conditional import catalog_condition, program_condition
+from .progress_buffer import get_progress_buffer, merge_buffered, record_position, topic_key
+from .renderers import FastJSONRenderer
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import models, transaction
 from django.utils import timezone
 from typing import List
+import asyncio
 import random
 import string
 
 User = get_user_model()
 
-class AuthBearer(HttpBearer):
-    def authenticate(self, request, token):
-        try:
-            # Validate the token
-            UntypedToken(token)
-            # Get user from token
-            from rest_framework_simplejwt.tokens import AccessToken
-            access_token = AccessToken(token)
-            user_id = access_token['user_id']
-            user = User.objects.get(id=user_id)
-            return user
-        except (InvalidToken, TokenError, User.DoesNotExist):
-            return None
-
 # Initialize Django Ninja API for general endpoints
-api = NinjaAPI(version="1.0.0", title="General API")
+api = NinjaAPI(version="1.0.0", title="General API", renderer=FastJSONRenderer())
 
 @api.post("/add-area-of-interest", auth=AuthBearer())
 def add_area_of_interest(request, data: AreaOfInterestSchema):
@@ -39,7 +41,8 @@ def add_area_of_interest(request, data: AreaOfInterestSchema):
     try:
         user = request.auth
         user.area_of_intrest = data.area_of_intrest
-        user.save()
+        # request.auth only has some fields loaded, so never write back the rest
+        user.save(update_fields=['area_of_intrest'])
         
         return {
             "success": True,
@@ -50,7 +53,8 @@ def add_area_of_interest(request, data: AreaOfInterestSchema):
         return JsonResponse({"message": f"Error updating area of interest: {str(e)}"}, status=500)
 
 
-@api.get("/categories")
+@api.get("/categories", response=CategoriesResponseSchema)
+@decorate_view(catalog_condition)
 def get_categories(request):
     """
     Get list of all categories
@@ -75,96 +79,34 @@ def get_categories(request):
         return JsonResponse({"success": False, "message": f"Error fetching categories: {str(e)}"}, status=500)
 
 
-@api.get("/landing")
-def get_landing_data(request):
+def get_landing_sections():
+    # Non-personal sections come from the catalog engine or the shared, versioned snapshot
+    engine = get_catalog_engine()
+    if engine is not None:
+        return engine.landing_sections()
+    return get_landing_snapshot(build_landing_sections)
+
+
+def bookmark_program(bookmark):
+    return bookmark.program if bookmark.program_type == 'program' else bookmark.advanced_program
+
+
+@api.get("/landing", response=LandingResponseSchema)
+@decorate_view(catalog_condition)
+async def get_landing_data(request):
     """
     Get landing page data with different program groups
     Returns: top_course, recently_added, featured, programs, advanced_programs
     Each group contains max 5 programs
     """
     try:
-        def format_program_data(program, program_type):
-            """Helper function to format program data consistently"""
-            discounted_price = program.price
-            if program.discount_percentage > 0:
-                discounted_price = program.price * (1 - program.discount_percentage / 100)
-            
-            enrolled_students = 0
-            if program_type == 'program':
-                enrolled_students = UserPurchase.objects.filter(
-                    program=program,
-                    status='completed'
-                ).count()
-            else:
-                enrolled_students = UserPurchase.objects.filter(
-                    advanced_program=program,
-                    status='completed'
-                ).count()
-            
-            return {
-                "id": program.id,
-                "type": program_type,
-                "title": program.title,
-                "subtitle": program.subtitle,
-                "description": program.description,
-                "category": {
-                    "id": program.category.id,
-                    "name": program.category.name,
-                } if hasattr(program, 'category') and program.category else None,
-                "image": program.image.url if program.image else None,
-                "duration": program.duration,
-                "program_rating": float(program.program_rating),
-                "is_best_seller": program.is_best_seller,
-                "enrolled_students": enrolled_students,
-                "pricing": {
-                    "original_price": float(program.price),
-                    "discount_percentage": float(program.discount_percentage),
-                    "discounted_price": float(discounted_price),
-                    "savings": float(program.price - discounted_price)
-                },
-            }
-        
-        # Top Courses - Highest rated programs (both regular and advanced)
-        top_programs = Program.objects.filter(program_rating__gte=4.0).order_by('-program_rating', '-id')[:3]
-        top_advanced = AdvanceProgram.objects.filter(program_rating__gte=4.0).order_by('-program_rating', '-id')[:2]
-        
-        top_course = []
-        for program in top_programs:
-            top_course.append(format_program_data(program, 'program'))
-        for program in top_advanced:
-            top_course.append(format_program_data(program, 'advanced_program'))
-        
-        # Recently Added - Latest programs by ID (assuming higher ID = newer)
-        recent_programs = Program.objects.all().order_by('-id')[:3]
-        recent_advanced = AdvanceProgram.objects.all().order_by('-id')[:2]
-        
-        recently_added = []
-        for program in recent_programs:
-            recently_added.append(format_program_data(program, 'program'))
-        for program in recent_advanced:
-            recently_added.append(format_program_data(program, 'advanced_program'))
-        
-        # Featured - Best seller programs
-        featured_programs = Program.objects.filter(is_best_seller=True).order_by('-program_rating', '-id')[:3]
-        featured_advanced = AdvanceProgram.objects.filter(is_best_seller=True).order_by('-program_rating', '-id')[:2]
-        
-        featured = []
-        for program in featured_programs:
-            featured.append(format_program_data(program, 'program'))
-        for program in featured_advanced:
-            featured.append(format_program_data(program, 'advanced_program'))
-        
-        # Programs - Regular programs only (max 5)
-        regular_programs = Program.objects.all().order_by('-program_rating', '-id')[:5]
-        programs = []
-        for program in regular_programs:
-            programs.append(format_program_data(program, 'program'))
-        
-        # Advanced Programs - Advanced programs only (max 5)
-        advance_programs = AdvanceProgram.objects.all().order_by('-program_rating', '-id')[:5]
-        advanced_programs = []
-        for program in advance_programs:
-            advanced_programs.append(format_program_data(program, 'advanced_program'))
+        # A rebuild may query the database, so it runs off the event loop
+        sections = await sync_to_async(get_landing_sections)()
+        top_course = sections['top_course']
+        recently_added = sections['recently_added']
+        featured = sections['featured']
+        programs = sections['programs']
+        advanced_programs = sections['advanced_programs']
         
         # Continue Watching - Recently watched programs for authenticated users only
         continue_watching = []
@@ -176,11 +118,12 @@ def get_landing_data(request):
                 user=user,
                 status__in=['in_progress', 'completed']
             ).select_related(
-                'purchase__program', 
+                'purchase__program__category', 
                 'purchase__advanced_program',
                 'topic__syllabus__program',
                 'advance_topic__advance_syllabus__advance_program'
             ).order_by('-last_watched_at')[:10]  # Get more to filter unique programs
+            recent_progress = [progress async for progress in recent_progress]
             
             seen_programs = set()
             for progress in recent_progress:
@@ -202,12 +145,12 @@ def get_landing_data(request):
                     seen_programs.add(program.id)
                     
                     # Get course progress for this program
-                    course_progress = UserCourseProgress.objects.filter(
+                    course_progress = await UserCourseProgress.objects.filter(
                         user=user,
                         purchase=progress.purchase
-                    ).first()
+                    ).afirst()
                     
-                    program_data = format_program_data(program, program_type)
+                    program_data = serialize_program_card(program, program_type)
                     
                     # Add progress information
                     program_data['progress'] = {
@@ -245,8 +188,9 @@ def get_landing_data(request):
         return JsonResponse({"success": False, "message": f"Error fetching landing data: {str(e)}"}, status=500)
 
 
-@api.get("/programs/filter")
-def get_all_programs_with_filters(
+@api.get("/programs/filter", response=ProgramListResponseSchema)
+@decorate_view(catalog_condition)
+async def get_all_programs_with_filters(
     request,
     program_type: str = None,
     category_id: int = None,
@@ -256,10 +200,13 @@ def get_all_programs_with_filters(
     min_rating: float = None,
     search: str = None,
     sort_by: str = 'most_relevant',
-    sort_order: str = 'asc'
+    sort_order: str = 'asc',
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str = None
 ):
     """
-    Get all programs (regular and advanced) with comprehensive filtering options
+    Get all programs (regular and advanced) with comprehensive filtering options.
+    Results are paginated: pass `next_cursor` from the previous page as `cursor`.
     """
     try:
         # Filter parameters are now function arguments
@@ -267,154 +214,44 @@ def get_all_programs_with_filters(
         if category_id is not None:
             category_id = str(category_id)
         
-        all_programs = []
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        sort_keys = get_sort_keys(sort_by, sort_order, ranked=bool(search))
         
-        # Include regular programs
-        if program_type in [None, 'all', 'program']:
-            programs_query = Program.objects.all().select_related('category')
-            
-            # Apply category filter for regular programs
-            if category_id is not None:
-                try:
-                    category = Category.objects.get(id=category_id)
-                    programs_query = programs_query.filter(category=category)
-                except Category.DoesNotExist:
-                    pass  # Skip invalid category
-            
-            # Apply other filters
-            if is_best_seller is not None:
-                programs_query = programs_query.filter(is_best_seller=is_best_seller)
-            
-            if min_price is not None:
-                programs_query = programs_query.filter(price__gte=min_price)
-            
-            if max_price is not None:
-                programs_query = programs_query.filter(price__lte=max_price)
-            
-            if min_rating is not None:
-                programs_query = programs_query.filter(program_rating__gte=min_rating)
-            
-            if search:
-                programs_query = programs_query.filter(
-                    models.Q(title__icontains=search) | 
-                    models.Q(description__icontains=search) |
-                    models.Q(subtitle__icontains=search)
-                )
-            
-            # Convert regular programs to unified format
-            for program in programs_query:
-                discounted_price = program.price
-                if program.discount_percentage > 0:
-                    discounted_price = program.price * (1 - program.discount_percentage / 100)
-                
-                program_data = {
-                    "id": program.id,
-                    "type": "program",
-                    "title": program.title,
-                    "subtitle": program.subtitle,
-                    "description": program.description,
-                    "category": {
-                        "id": program.category.id,
-                        "name": program.category.name,
-                    } if program.category else None,
-                    "image": program.image.url if program.image else None,
-                    "duration": program.duration,
-                    "program_rating": float(program.program_rating),
-                    "is_best_seller": program.is_best_seller,
-                    "enrolled_students": UserPurchase.objects.filter(
-                        program=program,
-                        status='completed'
-                    ).count(),
-                    "pricing": {
-                        "original_price": float(program.price),
-                        "discount_percentage": float(program.discount_percentage),
-                        "discounted_price": float(discounted_price),
-                        "savings": float(program.price - discounted_price)
-                    },
-                }
-                all_programs.append(program_data)
+        cursor_values = None
+        if cursor:
+            try:
+                cursor_values = decode_cursor(cursor, sort_keys)
+            except InvalidCursor as e:
+                return JsonResponse({"success": False, "message": f"Invalid cursor: {str(e)}"}, status=400)
         
-        # Include advanced programs
+        program_types = []
+        if program_type in [None, 'all', 'program']:
+            program_types.append('program')
         if program_type in [None, 'all', 'advanced_program']:
-            advanced_programs_query = AdvanceProgram.objects.all()
-            
-            # Apply filters (category filter not applicable for advanced programs)
-            if is_best_seller is not None:
-                advanced_programs_query = advanced_programs_query.filter(is_best_seller=is_best_seller)
-            
-            if min_price is not None:
-                advanced_programs_query = advanced_programs_query.filter(price__gte=min_price)
-            
-            if max_price is not None:
-                advanced_programs_query = advanced_programs_query.filter(price__lte=max_price)
-            
-            if min_rating is not None:
-                advanced_programs_query = advanced_programs_query.filter(program_rating__gte=min_rating)
-            
-            if search:
-                advanced_programs_query = advanced_programs_query.filter(
-                    models.Q(title__icontains=search) | 
-                    models.Q(description__icontains=search) |
-                    models.Q(subtitle__icontains=search)
-                )
-            
-            # Convert advanced programs to unified format
-            for program in advanced_programs_query:
-                discounted_price = program.price
-                if program.discount_percentage > 0:
-                    discounted_price = program.price * (1 - program.discount_percentage / 100)
-                
-                program_data = {
-                    "id": program.id,
-                    "type": "advanced_program",
-                    "title": program.title,
-                    "subtitle": program.subtitle,
-                    "description": program.description,
-                    "category": None,  # Advanced programs don't have categories
-                    "image": program.image.url if program.image else None,
-                    "duration": program.duration,
-                    "program_rating": float(program.program_rating),
-                    "is_best_seller": program.is_best_seller,
-                    "enrolled_students": UserPurchase.objects.filter(
-                        advanced_program=program,
-                        status='completed'
-                    ).count(),
-                    "pricing": {
-                        "original_price": float(program.price),
-                        "discount_percentage": float(program.discount_percentage),
-                        "discounted_price": float(discounted_price),
-                        "savings": float(program.price - discounted_price)
-                    },
-                }
-                all_programs.append(program_data)
+            program_types.append('advanced_program')
+        
+        listing = {
+            "program_types": program_types,
+            "category_id": category_id,
+            "is_best_seller": is_best_seller,
+            "min_price": min_price,
+            "max_price": max_price,
+            "min_rating": min_rating,
+            "sort_keys": sort_keys,
+            "cursor_values": cursor_values,
+            "limit": limit,
+        }
         
-        # Apply sorting to combined results
-        if sort_by in ['title', 'price', 'program_rating', 'available_slots', 'discounted_price', 'most_relevant', 'recently_added', 'top_rated']:
-            reverse_order = sort_order == 'desc'
-            
-            if sort_by == 'most_relevant':
-                # Sort by relevance: best sellers first, then by rating, then by enrolled students
-                all_programs.sort(key=lambda x: (
-                    not x.get('is_best_seller', False),  # Best sellers first (False sorts before True)
-                    -x.get('program_rating', 0),         # Higher rating first
-                    -x.get('enrolled_students', 0)       # More enrolled students first
-                ))
-            elif sort_by == 'recently_added':
-                # Sort by creation date (newest first) - using ID as proxy for creation order
-                all_programs.sort(key=lambda x: x.get('id', 0), reverse=True)
-            elif sort_by == 'top_rated':
-                # Sort by rating (highest first), then by number of enrolled students
-                all_programs.sort(key=lambda x: (
-                    -x.get('program_rating', 0),         # Higher rating first
-                    -x.get('enrolled_students', 0)       # More enrolled students as tiebreaker
-                ))
-            else:
-                # Standard sorting for other fields
-                all_programs.sort(key=lambda x: x.get(sort_by, 0), reverse=reverse_order)
+        # The in-memory engine has no text index, so searches always go to the database
+        engine = get_catalog_engine()
+        if engine is not None and not search:
+            counts, all_programs, next_cursor = await sync_to_async(engine.list_programs)(**listing)
+        else:
+            counts, all_programs, next_cursor = await sync_to_async(list_programs)(search=search, **listing)
         
-        # Get filter statistics
-        regular_count = sum(1 for p in all_programs if p['type'] == 'program')
-        advanced_count = sum(1 for p in all_programs if p['type'] == 'advanced_program')
+        # Filter statistics cover the whole filtered catalog, independent of the page
+        regular_count = counts.get('program', 0)
+        advanced_count = counts.get('advanced_program', 0)
         
         return {
             "success": True,
@@ -430,18 +267,79 @@ def get_all_programs_with_filters(
                 "sort_order": sort_order
             },
             "statistics": {
-                "total_count": len(all_programs),
+                "total_count": regular_count + advanced_count,
                 "regular_programs_count": regular_count,
                 "advanced_programs_count": advanced_count
             },
+            "pagination": {
+                "limit": limit,
+                "count": len(all_programs),
+                "has_more": next_cursor is not None,
+                "next_cursor": next_cursor
+            },
             "programs": all_programs
         }
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Error fetching filtered programs: {str(e)}"}, status=500)
 
 
-@api.get("/program/{program_type}/{program_id}/details")
-def get_program_details(request, program_type: str, program_id: int):
+@api.get("/programs/facets")
+@decorate_view(catalog_condition)
+def get_program_facets(
+    request,
+    program_type: str = None,
+    category_id: int = None,
+    is_best_seller: bool = None,
+    min_price: float = None,
+    max_price: float = None,
+    min_rating: float = None,
+    search: str = None
+):
+    """
+    Get facet counts (program type, category, price, rating, best seller) for a
+    /programs/filter filter set. Each facet ignores its own filter.
+    """
+    try:
+        program_types = []
+        if program_type in [None, 'all', 'program']:
+            program_types.append('program')
+        if program_type in [None, 'all', 'advanced_program']:
+            program_types.append('advanced_program')
+        
+        # Normalized so that equivalent requests share a cache entry
+        filters = {
+            "program_types": program_types,
+            "category_id": category_id,
+            "search": ' '.join(search.split()).lower() if search and search.strip() else None,
+            "is_best_seller": is_best_seller,
+            "min_price": min_price,
+            "max_price": max_price,
+            "min_rating": min_rating,
+        }
+        facets = get_facets(filters, count_facets)
+        
+        return {
+            "success": True,
+            "filters_applied": {
+                "program_type": program_type or 'all',
+                "category_id": category_id,
+                "is_best_seller": is_best_seller,
+                "min_price": min_price,
+                "max_price": max_price,
+                "min_rating": min_rating,
+                "search": search
+            },
+            "total_count": sum(facets["program_type"].get(name, 0) for name in program_types),
+            "facets": facets
+        }
+    except Exception as e:
+        return JsonResponse({"success": False, "message": f"Error fetching program facets: {str(e)}"}, status=500)
+
+
+# Locked topics have no video_url and advanced topics no is_intro; leave them out rather than null
+@api.get("/program/{program_type}/{program_id}/details", response=ProgramDetailsResponseSchema, exclude_unset=True)
+@decorate_view(program_condition)
+async def get_program_details(request, program_type: str, program_id: int):
     """
     Get detailed information about a specific program (regular or advanced) including syllabus and topics
     """
@@ -456,10 +354,10 @@ def get_program_details(request, program_type: str, program_id: int):
         # Get program based on type
         try:
             if program_type == 'program':
-                program = Program.objects.select_related('category').get(id=program_id)
+                program = await Program.objects.select_related('category').aget(id=program_id)
                 program_model_type = 'program'
             else:
-                program = AdvanceProgram.objects.get(id=program_id)
+                program = await AdvanceProgram.objects.aget(id=program_id)
                 program_model_type = 'advanced_program'
         except (Program.DoesNotExist, AdvanceProgram.DoesNotExist):
             return JsonResponse({
@@ -477,57 +375,22 @@ def get_program_details(request, program_type: str, program_id: int):
         has_purchased = False
         if user:
             if program_type == 'program':
-                has_purchased = UserPurchase.objects.filter(
+                has_purchased = await UserPurchase.objects.filter(
                     user=user,
                     program=program,
                     status='completed'
-                ).exists()
+                ).aexists()
             else:
-                has_purchased = UserPurchase.objects.filter(
+                has_purchased = await UserPurchase.objects.filter(
                     user=user,
                     advanced_program=program,
                     status='completed'
-                ).exists()
+                ).aexists()
         
-        # Get syllabus with topics
-        syllabus_list = []
-        syllabi = program.syllabuses.all().prefetch_related('topics')
-        
-        for syllabus in syllabi:
-            topics_list = []
-            for topic in syllabus.topics.all():
-                if program_type == 'program':
-                    # Regular programs have intro videos
-                    is_accessible = has_purchased or topic.is_intro
-                    topic_data = {
-                        "id": topic.id,
-                        "topic_title": topic.topic_title,
-                        "is_free_trail": topic.is_free_trail,
-                        "is_intro": topic.is_intro,
-                        "is_locked": not is_accessible
-                    }
-                else:
-                    # Advanced programs - all videos locked unless purchased
-                    topic_data = {
-                        "id": topic.id,
-                        "topic_title": topic.topic_title,
-                        "is_locked": not has_purchased
-                    }
-                    is_accessible = has_purchased
-                
-                # Only add video_url if accessible
-                if is_accessible:
-                    topic_data["video_url"] = topic.video_url
-                
-                topics_list.append(topic_data)
-            
-            syllabus_data = {
-                "id": syllabus.id,
-                "module_title": syllabus.module_title,
-                "topics_count": len(topics_list),
-                "topics": topics_list
-            }
-            syllabus_list.append(syllabus_data)
+        # Syllabus tree is built once per program version; just pick the variant
+        syllabus = await sync_to_async(get_syllabus_tree)(
+            program, program_model_type, has_purchased, serialize_syllabus_trees
+        )
         
         # Build program data
         program_data = {
@@ -538,16 +401,13 @@ def get_program_details(request, program_type: str, program_id: int):
             "category": {
                 "id": program.category.id,
                 "name": program.category.name,
-            } if program.category else None,
+            } if program_model_type == 'program' and program.category else None,
             "description": program.description,
             "image": program.image.url if program.image else None,
             "duration": program.duration,
             "program_rating": float(program.program_rating),
             "is_best_seller": program.is_best_seller,
-            "enrolled_students": UserPurchase.objects.filter(
-                program=program,
-                status='completed'
-            ).count(),
+            "enrolled_students": program.enrolled_students,
             "pricing": {
                 "original_price": float(program.price),
                 "discount_percentage": float(program.discount_percentage),
@@ -559,11 +419,7 @@ def get_program_details(request, program_type: str, program_id: int):
         return {
             "success": True,
             "program": program_data,
-            "syllabus": {
-                "total_modules": len(syllabus_list),
-                "total_topics": sum(len(s["topics"]) for s in syllabus_list),
-                "modules": syllabus_list
-            }
+            "syllabus": syllabus
         }
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Error fetching program details: {str(e)}"}, status=500)
@@ -687,8 +543,8 @@ def remove_from_bookmark(request, data: BookmarkSchema):
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Error removing bookmark: {str(e)}"}, status=500)
 
-@api.get("/bookmarks", auth=AuthBearer())
-def get_user_bookmarks(request):
+@api.get("/bookmarks", auth=AsyncAuthBearer(), response=BookmarksResponseSchema)
+async def get_user_bookmarks(request):
     """
     Get all bookmarks for the authenticated user
     """
@@ -698,79 +554,37 @@ def get_user_bookmarks(request):
         # Get all user bookmarks
         bookmarks = UserBookmark.objects.filter(user=user).order_by('-bookmarked_date')
         
+        # Cards come from the catalog engine when enabled, otherwise from the joined rows
+        engine = get_catalog_engine()
+        catalog = await sync_to_async(engine.current)() if engine is not None else None
+        if catalog is None:
+            bookmarks = bookmarks.select_related('program__category', 'advanced_program')
+        
         bookmarks_data = []
-        for bookmark in bookmarks:
-            if bookmark.program_type == 'program' and bookmark.program:
-                program = bookmark.program
-                # Calculate discounted price
-                discounted_price = program.price
-                if program.discount_percentage > 0:
-                    discounted_price = program.price * (1 - program.discount_percentage / 100)
-                
-                bookmark_data = {
-                    "bookmark_id": bookmark.id,
-                    "program": {
-                        "id": program.id,
-                        "type": "program",
-                        "title": program.title,
-                        "subtitle": program.subtitle,
-                        "description": program.description,
-                        "category": {
-                            "id": program.category.id,
-                            "name": program.category.name,
-                        } if program.category else None,
-                        "image": program.image.url if program.image else None,
-                        "duration": program.duration,
-                        "program_rating": float(program.program_rating),
-                        "is_best_seller": program.is_best_seller,
-                        "enrolled_students": UserPurchase.objects.filter(
-                            program=program,
-                            status='completed'
-                        ).count(),
-                        "pricing": {
-                            "original_price": float(program.price),
-                            "discount_percentage": float(program.discount_percentage),
-                            "discounted_price": float(discounted_price),
-                            "savings": float(program.price - discounted_price)
-                        },
-                    },
-                    "bookmarked_date": bookmark.bookmarked_date.isoformat()
-                }
-            elif bookmark.program_type == 'advanced_program' and bookmark.advanced_program:
-                program = bookmark.advanced_program
-                # Calculate discounted price
-                discounted_price = program.price
-                if program.discount_percentage > 0:
-                    discounted_price = program.price * (1 - program.discount_percentage / 100)
-                
-                bookmark_data = {
-                    "bookmark_id": bookmark.id,
-                    "program": {
-                        "id": program.id,
-                        "type": "advanced_program",
-                        "title": program.title,
-                        "subtitle": program.subtitle,
-                        "description": program.description,
-                        "category": None,  # Advanced programs don't have categories
-                        "image": program.image.url if program.image else None,
-                        "duration": program.duration,
-                        "program_rating": float(program.program_rating),
-                        "is_best_seller": program.is_best_seller,
-                        "enrolled_students": UserPurchase.objects.filter(
-                            advanced_program=program,
-                            status='completed'
-                        ).count(),
-                        "pricing": {
-                            "original_price": float(program.price),
-                            "discount_percentage": float(program.discount_percentage),
-                            "discounted_price": float(discounted_price),
-                            "savings": float(program.price - discounted_price)
-                        },
-                    },
-                    "bookmarked_date": bookmark.bookmarked_date.isoformat()
-                }
+        async for bookmark in bookmarks:
+            if bookmark.program_type == 'program':
+                program_id = bookmark.program_id
+            elif bookmark.program_type == 'advanced_program':
+                program_id = bookmark.advanced_program_id
             else:
                 continue  # Skip invalid bookmarks
+            if program_id is None:
+                continue  # Skip invalid bookmarks
+            
+            program_data = catalog.program_card(bookmark.program_type, program_id) if catalog else None
+            if program_data is None:
+                if catalog is None:
+                    program = bookmark_program(bookmark)  # Joined above
+                else:
+                    # Not in this catalog version yet; the lazy load has to leave the event loop
+                    program = await sync_to_async(bookmark_program)(bookmark)
+                program_data = serialize_program_card(program, bookmark.program_type)
+            
+            bookmark_data = {
+                "bookmark_id": bookmark.id,
+                "program": program_data,
+                "bookmarked_date": bookmark.bookmarked_date.isoformat()
+            }
             
             bookmarks_data.append(bookmark_data)
         
@@ -783,8 +597,8 @@ def get_user_bookmarks(request):
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Error fetching bookmarks: {str(e)}"}, status=500)
 
-@api.post("/purchase", auth=AuthBearer())
-def purchase_course(request, data: PurchaseSchema):
+@api.post("/purchase", auth=AsyncAuthBearer())
+async def purchase_course(request, data: PurchaseSchema):
     """
     Purchase a course (program or advanced program) with dummy payment gateway
     """
@@ -806,24 +620,24 @@ def purchase_course(request, data: PurchaseSchema):
         # Get the program
         try:
             if program_type == 'program':
-                program = Program.objects.get(id=program_id)
+                program = await Program.objects.aget(id=program_id)
                 program_obj = program
                 advanced_program_obj = None
             else:
-                program = AdvanceProgram.objects.get(id=program_id)
+                program = await AdvanceProgram.objects.aget(id=program_id)
                 program_obj = None
                 advanced_program_obj = program
         except (Program.DoesNotExist, AdvanceProgram.DoesNotExist):
             return JsonResponse({"success": False, "message": "Program not found"}, status=404)
         
         # Check if user already purchased this course
-        existing_purchase = UserPurchase.objects.filter(
+        existing_purchase = await UserPurchase.objects.filter(
             user=user,
             program_type=program_type,
             program=program_obj,
             advanced_program=advanced_program_obj,
             status='completed'
-        ).first()
+        ).afirst()
         
         if existing_purchase:
             return JsonResponse({
@@ -843,7 +657,7 @@ def purchase_course(request, data: PurchaseSchema):
         transaction_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
         
         # Dummy Payment Gateway Processing
-        payment_success = dummy_payment_gateway(
+        payment_success = await dummy_payment_gateway(
             amount=final_price,
             payment_method=payment_method,
             transaction_id=transaction_id
@@ -857,7 +671,7 @@ def purchase_course(request, data: PurchaseSchema):
             }, status=400)
         
         # Create purchase record
-        purchase = UserPurchase.objects.create(
+        purchase = await UserPurchase.objects.acreate(
             user=user,
             program_type=program_type,
             program=program_obj,
@@ -888,14 +702,13 @@ def purchase_course(request, data: PurchaseSchema):
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Error processing purchase: {str(e)}"}, status=500)
 
-def dummy_payment_gateway(amount, payment_method, transaction_id):
+async def dummy_payment_gateway(amount, payment_method, transaction_id):
     """
     Dummy payment gateway implementation
     Returns True for successful payment, False for failed payment
     """
-    # Simulate payment processing delay
-    import time
-    time.sleep(0.5)
+    # Simulate payment processing delay without holding a worker thread
+    await asyncio.sleep(0.5)
     
     # Dummy logic: 90% success rate, 10% failure rate
     success_rate = 0.9
@@ -910,7 +723,7 @@ def dummy_payment_gateway(amount, payment_method, transaction_id):
         print(f"[DUMMY PAYMENT] FAILED - Transaction ID: {transaction_id}, Amount: ₹{amount}, Method: {payment_method}")
         return False
 
-@api.get("/my-learnings", auth=AuthBearer())
+@api.get("/my-learnings", auth=AuthBearer(), response=MyLearningsResponseSchema)
 def get_my_learnings(
     request,
     status: str = None  # 'onprogress', 'completed', or None for all
@@ -925,7 +738,7 @@ def get_my_learnings(
         purchases = UserPurchase.objects.filter(
             user=user,
             status='completed'
-        ).order_by('-purchase_date')
+        ).select_related('program__category', 'advanced_program').order_by('-purchase_date')
         
         # Apply status filter if provided
         if status:
@@ -979,10 +792,7 @@ def get_my_learnings(
                         "duration": program.duration,
                         "program_rating": float(program.program_rating),
                         "is_best_seller": program.is_best_seller,
-                        "enrolled_students": UserPurchase.objects.filter(
-                            program=program,
-                            status='completed'
-                        ).count(),
+                        "enrolled_students": program.enrolled_students,
                         "pricing": {
                             "original_price": float(program.price),
                             "discount_percentage": float(program.discount_percentage),
@@ -1025,10 +835,7 @@ def get_my_learnings(
                         "duration": program.duration,
                         "program_rating": float(program.program_rating),
                         "is_best_seller": program.is_best_seller,
-                        "enrolled_students": UserPurchase.objects.filter(
-                            advanced_program=program,
-                            status='completed'
-                        ).count(),
+                        "enrolled_students": program.enrolled_students,
                         "pricing": {
                             "original_price": float(program.price),
                             "discount_percentage": float(program.discount_percentage),
@@ -1070,7 +877,7 @@ def get_my_learnings(
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Error fetching learnings: {str(e)}"}, status=500)
 
-@api.post("/learning/update-progress", auth=AuthBearer())
+@api.post("/learning/update-progress", auth=AuthBearer(), response=UpdateProgressResponseSchema)
 def update_learning_progress(request, data: UpdateProgressSchema):
     """
     Update user's progress for a specific topic/video
@@ -1123,30 +930,50 @@ def update_learning_progress(request, data: UpdateProgressSchema):
                     "message": "Advanced topic not found or you don't have access to this course"
                 }, status=404)
         
-        # Get or create topic progress
-        topic_progress, created = UserTopicProgress.objects.get_or_create(
+        # A new course summary starts from the existing topic rows; topic saves keep it current
+        course_progress, created = UserCourseProgress.objects.get_or_create(
             user=user,
-            purchase=purchase,
-            topic=topic_obj,
-            advance_topic=advance_topic_obj,
-            defaults={
-                'status': 'not_started',
-                'total_duration_seconds': data.total_duration_seconds or 1800
-            }
+            purchase=purchase
         )
+        if created:
+            course_progress.update_progress()
+        else:
+            course_progress.sync_total_topics(purchase)
+        
+        # Get or create topic progress; a heartbeat at 0 seconds doesn't create a row, as not started topics are synthesized
+        lookup = {'user': user, 'purchase': purchase, 'topic': topic_obj, 'advance_topic': advance_topic_obj}
+        defaults = {'status': 'not_started', 'total_duration_seconds': data.total_duration_seconds or 1800}
+        untouched = False
+        if data.watch_time_seconds:
+            topic_progress, created = UserTopicProgress.objects.get_or_create(**lookup, defaults=defaults)
+        else:
+            topic_progress = UserTopicProgress.objects.filter(**lookup).first()
+            created = untouched = topic_progress is None
+            if untouched:
+                topic_progress = UserTopicProgress(**lookup, **defaults)
+        
+        buffer = get_progress_buffer()
+        if buffer is not None and not created:
+            # An earlier heartbeat may still be waiting for the flusher
+            merge_buffered(topic_progress, buffer.get(user.id, topic_key(topic_progress)))
+        previous_state = (topic_progress.status, topic_progress.started_at, topic_progress.completed_at)
         
         # Update progress
-        topic_progress.update_progress(
+        topic_progress.apply_watch_time(
             watch_time_seconds=data.watch_time_seconds,
             total_duration_seconds=data.total_duration_seconds
         )
         
-        # Update course progress
-        course_progress, _ = UserCourseProgress.objects.get_or_create(
-            user=user,
-            purchase=purchase
-        )
-        course_progress.update_progress()
+        if buffer is not None and not created and previous_state == (
+            topic_progress.status, topic_progress.started_at, topic_progress.completed_at
+        ):
+            # Only the watch position moved, which the flusher writes later; the summary's counts stand
+            topic_progress.last_watched_at = timezone.now()
+            record_position(user.id, topic_progress)
+        elif not untouched:
+            topic_progress.save()
+            # The topic save moved the summary in the database
+            course_progress.refresh_from_db(fields=['completion_percentage', 'completed_topics', 'total_topics', 'is_completed'])
         
         topic_title = topic_obj.topic_title if topic_obj else advance_topic_obj.topic_title
         
@@ -1172,7 +999,185 @@ def update_learning_progress(request, data: UpdateProgressSchema):
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Error updating progress: {str(e)}"}, status=500)
 
-@api.get("/learning/course/{purchase_id}", auth=AuthBearer())
+# Columns a batched heartbeat may change on an existing topic progress row
+TOPIC_PROGRESS_UPSERT_FIELDS = [
+    'status', 'watch_time_seconds', 'total_duration_seconds', 'completion_percentage',
+    'started_at', 'completed_at', 'last_watched_at',
+]
+
+@api.post("/learning/update-progress/batch", auth=AuthBearer(), response=BatchUpdateProgressResponseSchema)
+def batch_update_learning_progress(request, updates: List[ProgressUpdateItemSchema]):
+    """
+    Apply many progress heartbeats at once, e.g. from a player resyncing after being offline.
+    Updates to the same topic apply in client_ts order within this batch only: they build on
+    the topic's latest position, buffered or saved, whatever its time. Updates for topics the
+    user can't access are rejected individually.
+    """
+    try:
+        user = request.auth
+        
+        max_updates = getattr(settings, 'PROGRESS_BATCH_MAX_UPDATES', 500)
+        if len(updates) > max_updates:
+            return JsonResponse({
+                "success": False,
+                "message": f"At most {max_updates} updates per batch"
+            }, status=400)
+        
+        from .models import Topic, AdvanceTopic
+        
+        # Resolve every topic to its program, one query per topic type
+        topic_programs = {}
+        topic_ids = {update.topic_id for update in updates if update.topic_type == 'topic'}
+        advance_topic_ids = {update.topic_id for update in updates if update.topic_type == 'advance_topic'}
+        if topic_ids:
+            for topic_id, program_id in Topic.objects.filter(id__in=topic_ids).values_list('id', 'syllabus__program_id'):
+                topic_programs['topic', topic_id] = ('program', program_id)
+        if advance_topic_ids:
+            for topic_id, program_id in AdvanceTopic.objects.filter(id__in=advance_topic_ids).values_list(
+                'id', 'advance_syllabus__advance_program_id'
+            ):
+                topic_programs['advance_topic', topic_id] = ('advanced_program', program_id)
+        
+        # And every program to the user's purchase of it, in one query
+        program_purchases = {}
+        program_ids = {program_id for kind, program_id in topic_programs.values() if kind == 'program'}
+        advanced_program_ids = {program_id for kind, program_id in topic_programs.values() if kind == 'advanced_program'}
+        if topic_programs:
+            for purchase_id, program_id, advanced_program_id in UserPurchase.objects.filter(
+                models.Q(program_id__in=program_ids) | models.Q(advanced_program_id__in=advanced_program_ids),
+                user=user,
+                status='completed'
+            ).values_list('id', 'program_id', 'advanced_program_id'):
+                if program_id:
+                    program_purchases['program', program_id] = purchase_id
+                else:
+                    program_purchases['advanced_program', advanced_program_id] = purchase_id
+        
+        accepted = []
+        rejected = []
+        for update in updates:
+            program = topic_programs.get((update.topic_type, update.topic_id))
+            purchase_id = program_purchases.get(program) if program else None
+            if update.topic_type not in ['topic', 'advance_topic']:
+                message = "Invalid topic_type. Must be 'topic' or 'advance_topic'"
+            elif purchase_id is None:
+                message = "Topic not found or you don't have access to this course"
+            else:
+                accepted.append((update, purchase_id))
+                continue
+            rejected.append({"topic_id": update.topic_id, "topic_type": update.topic_type, "message": message})
+        
+        # Oldest first, so the most recent position of each topic wins
+        accepted.sort(key=lambda item: item[0].client_ts.timestamp() if item[0].client_ts else 0)
+        
+        with transaction.atomic():
+            existing = {}
+            if accepted:
+                for row in UserTopicProgress.objects.select_for_update().filter(
+                    models.Q(topic_id__in=topic_ids) | models.Q(advance_topic_id__in=advance_topic_ids),
+                    user=user
+                ):
+                    key = ('topic', row.topic_id) if row.topic_id else ('advance_topic', row.advance_topic_id)
+                    existing[key] = row
+            
+            # The summary only counts saved watch time; buffered positions are still the latest ones
+            saved_watch_time = {key: row.watch_time_seconds for key, row in existing.items()}
+            buffer = get_progress_buffer()
+            if buffer is not None:
+                buffered = buffer.user_entries(user.id)
+                for key, row in existing.items():
+                    merge_buffered(row, buffered.get(key))
+            
+            rows = {}
+            course_deltas = {}
+            for update, purchase_id in accepted:
+                key = (update.topic_type, update.topic_id)
+                row = rows.get(key)
+                if row is None:
+                    previous = existing.get(key)
+                    # Unsaved copies: upserting needs rows without a primary key
+                    row = UserTopicProgress(
+                        user=user,
+                        purchase_id=purchase_id,
+                        topic_id=update.topic_id if update.topic_type == 'topic' else None,
+                        advance_topic_id=update.topic_id if update.topic_type == 'advance_topic' else None,
+                        status=previous.status if previous else 'not_started',
+                        watch_time_seconds=previous.watch_time_seconds if previous else 0,
+                        total_duration_seconds=(
+                            previous.total_duration_seconds if previous else update.total_duration_seconds or 1800
+                        ),
+                        completion_percentage=previous.completion_percentage if previous else 0,
+                        started_at=previous.started_at if previous else None,
+                        completed_at=previous.completed_at if previous else None,
+                    )
+                    rows[key] = row
+                    deltas = course_deltas.setdefault(purchase_id, dict.fromkeys(
+                        ['completed', 'in_progress', 'watch_time'], 0
+                    ))
+                    if previous:
+                        deltas['completed'] -= previous.status == 'completed'
+                        deltas['in_progress'] -= previous.status == 'in_progress'
+                        deltas['watch_time'] -= saved_watch_time[key]
+                row.apply_watch_time(update.watch_time_seconds, update.total_duration_seconds)
+            
+            for row in rows.values():
+                deltas = course_deltas[row.purchase_id]
+                deltas['completed'] += row.status == 'completed'
+                deltas['in_progress'] += row.status == 'in_progress'
+                deltas['watch_time'] += row.watch_time_seconds
+            
+            # One upsert per topic type, each on its own unique constraint
+            for topic_type, unique_field in [('topic', 'topic'), ('advance_topic', 'advance_topic')]:
+                batch = [row for key, row in rows.items() if key[0] == topic_type]
+                if batch:
+                    UserTopicProgress.objects.bulk_create(
+                        batch,
+                        update_conflicts=True,
+                        unique_fields=['user', unique_field],
+                        update_fields=TOPIC_PROGRESS_UPSERT_FIELDS
+                    )
+            
+            # Each affected course summary moves once; missing ones are seeded from the rows
+            summarized = set(UserCourseProgress.objects.filter(
+                purchase_id__in=course_deltas
+            ).values_list('purchase_id', flat=True))
+            for purchase_id, deltas in course_deltas.items():
+                if purchase_id in summarized:
+                    UserCourseProgress.apply_deltas(purchase_id, **deltas)
+                else:
+                    course_progress, _ = UserCourseProgress.objects.get_or_create(user=user, purchase_id=purchase_id)
+                    course_progress.update_progress()
+        
+        courses = UserCourseProgress.objects.filter(purchase_id__in=course_deltas).values(
+            'purchase_id', 'completion_percentage', 'completed_topics', 'total_topics', 'is_completed'
+        )
+        
+        return {
+            "success": True,
+            "message": f"Progress updated for {len(rows)} topics",
+            "topics": [
+                {
+                    "topic_id": topic_id,
+                    "topic_type": topic_type,
+                    "status": row.status,
+                    "completion_percentage": float(row.completion_percentage),
+                    "watch_time_seconds": row.watch_time_seconds,
+                    "total_duration_seconds": row.total_duration_seconds,
+                    "is_completed": row.is_completed
+                }
+                for (topic_type, topic_id), row in rows.items()
+            ],
+            "courses": [
+                {**course, "completion_percentage": float(course['completion_percentage'])}
+                for course in courses
+            ],
+            "rejected": rejected
+        }
+        
+    except Exception as e:
+        return JsonResponse({"success": False, "message": f"Error updating progress: {str(e)}"}, status=500)
+
+@api.get("/learning/course/{purchase_id}", auth=AuthBearer(), response=CourseLearningResponseSchema)
 def get_course_learning_details(request, purchase_id: int):
     """
     Get detailed learning information for a specific purchased course with all topics and progress
@@ -1182,7 +1187,7 @@ def get_course_learning_details(request, purchase_id: int):
         
         # Get the purchase
         try:
-            purchase = UserPurchase.objects.get(
+            purchase = UserPurchase.objects.select_related('program', 'advanced_program').get(
                 id=purchase_id,
                 user=user,
                 status='completed'
@@ -1199,74 +1204,47 @@ def get_course_learning_details(request, purchase_id: int):
             purchase=purchase
         )
         
-        if created:
-            # Initialize progress for new purchase
-            from .models import Syllabus, AdvanceSyllabus
-            
-            if purchase.program_type == 'program' and purchase.program:
-                syllabi = Syllabus.objects.filter(program=purchase.program).prefetch_related('topics')
-                for syllabus in syllabi:
-                    for topic in syllabus.topics.all():
-                        UserTopicProgress.objects.get_or_create(
-                            user=user,
-                            purchase=purchase,
-                            topic=topic,
-                            defaults={
-                                'status': 'not_started',
-                                'total_duration_seconds': 1800,  # 30 minutes default
-                            }
-                        )
-            elif purchase.program_type == 'advanced_program' and purchase.advanced_program:
-                syllabi = AdvanceSyllabus.objects.filter(advance_program=purchase.advanced_program).prefetch_related('topics')
-                for syllabus in syllabi:
-                    for topic in syllabus.topics.all():
-                        UserTopicProgress.objects.get_or_create(
-                            user=user,
-                            purchase=purchase,
-                            advance_topic=topic,
-                            defaults={
-                                'status': 'not_started',
-                                'total_duration_seconds': 2700,  # 45 minutes default
-                            }
-                        )
-        course_progress.update_progress()
-        
         # Get program details
         if purchase.program_type == 'program':
             program = purchase.program
-            syllabi = program.syllabuses.all().prefetch_related('topics')
+            topic_type = 'topic'
         else:
             program = purchase.advanced_program
-            syllabi = program.syllabuses.all().prefetch_related('topics')
+            topic_type = 'advance_topic'
+        
+        # The whole syllabus tree in two queries
+        syllabi = list(program.syllabuses.all().prefetch_related('topics'))
+        
+        if created:
+            # Seed the summary once; topic saves keep it current from here on
+            course_progress.update_progress()
+        else:
+            course_progress.sync_total_topics(purchase)
+        
+        # Progress rows only exist for watched topics; the rest are synthesized as not started below
+        progress_by_topic = {
+            progress.topic_id if topic_type == 'topic' else progress.advance_topic_id: progress
+            for progress in UserTopicProgress.objects.filter(user=user, purchase=purchase)
+        }
+        
+        # Positions the flusher hasn't written yet, and the watch time they add to the summary
+        buffer = get_progress_buffer()
+        buffered = buffer.user_entries(user.id) if buffer is not None else {}
+        buffered_watch_time = 0
         
         # Build syllabus with progress
         syllabus_data = []
         for syllabus in syllabi:
             topics_data = []
             
-            if purchase.program_type == 'program':
-                topics = syllabus.topics.all()
-                topic_type = 'topic'
-            else:
-                topics = syllabus.topics.all()
-                topic_type = 'advance_topic'
-            
-            for topic in topics:
-                # Get topic progress
-                if purchase.program_type == 'program':
-                    topic_progress = UserTopicProgress.objects.filter(
-                        user=user,
-                        purchase=purchase,
-                        topic=topic
-                    ).first()
-                else:
-                    topic_progress = UserTopicProgress.objects.filter(
-                        user=user,
-                        purchase=purchase,
-                        advance_topic=topic
-                    ).first()
+            for topic in syllabus.topics.all():
+                topic_progress = progress_by_topic.get(topic.id)
                 
                 if topic_progress:
+                    stored_watch_time = topic_progress.watch_time_seconds
+                    if merge_buffered(topic_progress, buffered.get(topic_key(topic_progress))):
+                        buffered_watch_time += topic_progress.watch_time_seconds - stored_watch_time
+                    
                     watch_hours = topic_progress.watch_time_seconds // 3600
                     watch_minutes = (topic_progress.watch_time_seconds % 3600) // 60
                     watch_seconds = topic_progress.watch_time_seconds % 60
@@ -1296,7 +1274,7 @@ def get_course_learning_details(request, purchase_id: int):
                         }
                     }
                 else:
-                    # Topic not started
+                    # Topic not started, so it has no progress row
                     is_intro = getattr(topic, 'is_intro', False)
                     topic_data = {
                         "id": topic.id,
@@ -1311,7 +1289,8 @@ def get_course_learning_details(request, purchase_id: int):
                             "completion_percentage": 0,
                             "watch_time": "00:00:00",
                             "watch_time_seconds": 0,
-                            "total_duration": "30:00" if purchase.program_type == 'program' else "45:00",
+                            # Same HH:MM format as a stored row's default duration
+                            "total_duration": "00:30" if purchase.program_type == 'program' else "00:45",
                             "total_duration_seconds": 1800 if purchase.program_type == 'program' else 2700,
                             "started_at": None,
                             "completed_at": None,
@@ -1329,6 +1308,9 @@ def get_course_learning_details(request, purchase_id: int):
                 "topics": topics_data
             })
         
+        # As the flusher will leave it (apply_deltas() clamps at zero too)
+        course_progress.total_watch_time_seconds = max(course_progress.total_watch_time_seconds + buffered_watch_time, 0)
+        
         # Format course progress times
         total_watch_hours = course_progress.total_watch_time_seconds // 3600
         total_watch_minutes = (course_progress.total_watch_time_seconds % 3600) // 60